@@ -0,0 +1,12 @@
+from django.http import Http404
+from .services.vendor_resolver import resolve_vendor
+
+
+class VendorResolverMixin:
+    #Gives nested vendor viewsets a get_vendor() backed by the per-request vendor cache.
+
+    def get_vendor(self):
+        vendor = resolve_vendor(self.request, self.kwargs.get("vendor_slug"))
+        if vendor is None:
+            raise Http404("No Vendor matches the given query.")
+        return vendor
@@ -1,5 +1,6 @@
 from rest_framework.permissions import BasePermission
 from accounts.models import Membership
+from accounts.services.vendor_resolver import resolve_vendor
 from rest_framework.permissions import SAFE_METHODS
 
 class IsPlatformAdmin(BasePermission):
@@ -82,8 +83,13 @@ class IsVendorAdminOrAgent(BasePermission):
         if not vendor_slug:
             return False
 
+        # Shares the request's resolved vendor with the view, no join on the slug
+        vendor = resolve_vendor(request, vendor_slug)
+        if vendor is None:
+            return False
+
         return Membership.objects.filter(
             user=request.user,
-            vendor__slug=vendor_slug,
+            vendor=vendor,
             role__in=["vendor_admin", "vendor_agent"]
         ).exists()
\ No newline at end of file
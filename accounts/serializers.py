@@ -50,7 +50,8 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
                 code='authorization'
             )
 
-        # Generate tokens
+        # Generate tokens, the view merges the guest's carts into this user's
+        self.user = user
         refresh = self.get_token(user)
         
         data = {
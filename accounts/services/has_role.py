@@ -6,4 +6,30 @@ def has_role(request, user, role_name,):
     if membership.role == "vendor_admin" and not membership.vendor.approved:
         return False
     if user.is_authentiacated and (membership and membership.role == role_name):
-        return True
\ No newline at end of file
+        return True
+
+VENDOR_WIDE_ROLES = [
+    "platform_admin",
+    "vendor_admin",
+    "platform_agent",
+    "vendor_agent",
+]
+
+
+def has_vendor_wide_access(request, vendor_slug):
+    #Check if the caller can see every cart/order of a vendor. Memoized on the request
+    #so get_queryset and the list cache scope share a single membership query.
+    user = request.user
+    if not user or not user.is_authenticated:
+        return False
+    if user.is_staff:
+        return True
+
+    checked = request.__dict__.setdefault("_vendor_wide_access", {})
+    if vendor_slug not in checked:
+        checked[vendor_slug] = Membership.objects.filter(
+            user=user,
+            vendor__slug=vendor_slug,
+            role__in=VENDOR_WIDE_ROLES,
+        ).exists()
+    return checked[vendor_slug]
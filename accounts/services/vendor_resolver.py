@@ -0,0 +1,68 @@
+from django.core.cache import cache
+from django.db import transaction
+from services.local_cache import local_cache
+from ..models import Vendor
+import logging
+
+logger = logging.getLogger(__name__)
+
+VENDOR_CACHE_TIMEOUT = 60 * 60
+
+
+def get_vendor_cache_key(vendor_slug):
+    return f"vendor:slug:{vendor_slug}"
+
+
+def get_vendor_by_slug(vendor_slug):
+    #Look a vendor up by slug through the per-worker LRU, then Redis, then the database.
+    #Returns None for unknown slugs, which are not cached.
+    if not vendor_slug:
+        return None
+
+    cache_key = get_vendor_cache_key(vendor_slug)
+    vendor = local_cache.get(cache_key)
+    if vendor is not None:
+        return vendor
+
+    try:
+        vendor = cache.get(cache_key)
+    except Exception as e:
+        logger.warning(f"Vendor cache retrieval failed: {str(e)}")
+        vendor = None
+
+    if vendor is None:
+        vendor = Vendor.objects.filter(slug=vendor_slug).first()
+        if vendor is None:
+            return None
+        try:
+            cache.set(cache_key, vendor, VENDOR_CACHE_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"Vendor cache storage failed: {str(e)}")
+
+    local_cache.set(cache_key, vendor)
+    return vendor
+
+
+def resolve_vendor(request, vendor_slug):
+    #Resolve a vendor slug once per request. Memoized on the request so the
+    #permission check, serializer context and perform_create share one lookup.
+    resolved = request.__dict__.setdefault("_resolved_vendors", {})
+    if vendor_slug not in resolved:
+        resolved[vendor_slug] = get_vendor_by_slug(vendor_slug)
+    return resolved[vendor_slug]
+
+
+def invalidate_vendor(vendor_slug):
+    #Drop a slug from both cache tiers now and again once the transaction commits,
+    #so a reader that refilled it with the old row in between doesn't win.
+    #Other workers' LRU copies expire within LOCAL_CACHE_TIMEOUT.
+    def invalidate():
+        cache_key = get_vendor_cache_key(vendor_slug)
+        local_cache.delete(cache_key)
+        try:
+            cache.delete(cache_key)
+        except Exception as e:
+            logger.warning(f"Failed to clear vendor cache: {str(e)}")
+
+    invalidate()
+    transaction.on_commit(invalidate)
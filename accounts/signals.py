@@ -1,7 +1,8 @@
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
 from .models import Vendor
-from django.core.cache import cache
+from .services.vendor_resolver import invalidate_vendor
+from services.caching import clear_vendor_cache_on_commit, PLATFORM_SCOPE
 import logging
 
 logger = logging.getLogger(__name__)
@@ -9,9 +10,20 @@ logger = logging.getLogger(__name__)
 
 @receiver([post_save, post_delete], sender=Vendor)
 def invalidate_vendor_list_cache(sender, instance, **kwargs):
-    try:
-        cache.delete('vendors_approved')
-        cache.delete('vendors_pending')
-        logger.info('Cleared vendors_approved and vendors_pending cache')
-    except Exception as e:
-        logger.warning(f'Failed to clear vendor list caches: {e}')
+    # One generation bump covers both the approved and pending listings
+    clear_vendor_cache_on_commit(PLATFORM_SCOPE, 'vendor')
+
+
+@receiver([post_save, post_delete], sender=Vendor)
+def invalidate_resolved_vendor(sender, instance, **kwargs):
+    invalidate_vendor(instance.slug)
+
+
+@receiver(pre_save, sender=Vendor)
+def invalidate_renamed_vendor_slug(sender, instance, **kwargs):
+    # The old slug would otherwise keep resolving to the cached vendor
+    if instance.pk is None:
+        return
+    old_slug = Vendor.objects.filter(pk=instance.pk).values_list('slug', flat=True).first()
+    if old_slug and old_slug != instance.slug:
+        invalidate_vendor(old_slug)
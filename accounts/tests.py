@@ -1,8 +1,14 @@
-from django.test import TestCase
+from decimal import Decimal
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.db.utils import IntegrityError
+from rest_framework.test import APIRequestFactory, force_authenticate
+from services.local_cache import local_cache
+from services.testing import LOCMEM_CACHES
 
 from .models import Vendor, Membership, CustomUserManager
+from .services.vendor_resolver import get_vendor_by_slug
 
 User = get_user_model()
 
@@ -163,3 +169,67 @@ class MembershipModelTests(TestCase):
                 vendor=self.vendor,
                 role='Vendor_agent'
             )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class VendorResolverTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        self.vendor = Vendor.objects.create(
+            company_name='Acme', address='123 Lane', phone_number='1234567890', email='v@acme.com'
+        )
+
+    def test_slug_lookups_are_cached(self):
+        #Test that a resolved vendor is served from cache on the next lookup
+        self.assertEqual(get_vendor_by_slug('acme'), self.vendor)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_vendor_by_slug('acme'), self.vendor)
+        local_cache.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_vendor_by_slug('acme').pk, self.vendor.pk)
+
+    def test_unknown_slugs_resolve_to_none(self):
+        #Test that a missing vendor is None and is not cached
+        self.assertIsNone(get_vendor_by_slug('nope'))
+        created = Vendor.objects.create(
+            company_name='Nope', address='1 St', phone_number='1234567890', email='n@nope.com'
+        )
+        self.assertEqual(get_vendor_by_slug('nope'), created)
+
+    def test_saves_invalidate_the_cached_vendor(self):
+        #Test that vendor changes, including slug changes, are picked up
+        get_vendor_by_slug('acme')
+        self.vendor.approved = True
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vendor.save()
+        self.assertTrue(get_vendor_by_slug('acme').approved)
+
+        self.vendor.slug = 'acme-corp'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vendor.save()
+        self.assertIsNone(get_vendor_by_slug('acme'))
+        self.assertEqual(get_vendor_by_slug('acme-corp'), self.vendor)
+
+    def test_create_resolves_the_vendor_once(self):
+        #Test that permission, serializer context and perform_create share one vendor lookup
+        from products.models import Category
+        from products.views import ProductViewSet
+        user = User.objects.create_user(email='admin@acme.com', password='pass')
+        Membership.objects.create(user=user, vendor=self.vendor, role='vendor_admin')
+        category = Category.objects.create(name='Phones', vendor=self.vendor)
+        local_cache.clear()
+        cache.clear()
+
+        request = APIRequestFactory().post('/api/vendors/acme/products/', {
+            'name': 'Phone', 'description': 'Desc', 'price': '10.00', 'category': category.id,
+        }, format='json')
+        force_authenticate(request, user=user)
+        view = ProductViewSet.as_view({'post': 'create'})
+        # Vendor, membership, category, insert
+        with self.assertNumQueries(4) as queries:
+            response = view(request, vendor_slug='acme')
+        self.assertEqual(response.status_code, 201)
+        vendor_queries = [q['sql'] for q in queries.captured_queries if 'FROM "accounts_vendor"' in q['sql']]
+        self.assertEqual(len(vendor_queries), 1)
+        self.assertEqual(Decimal(response.data['price']), Decimal('10.00'))
@@ -7,12 +7,33 @@ from rest_framework.decorators import action
 from accounts.services.access_control import make_agent, remove_agent
 from .permissions import IsPlatformAdmin, IsVendorAdmin, IsPlatformAdminOrAgent
 from django.core.cache import cache
+from services.caching import get_versioned_key, DEFAULT_CACHE_TIMEOUT, PLATFORM_SCOPE
 from .serializers import MyTokenObtainPairSerializer
 from rest_framework_simplejwt.views import TokenObtainPairView
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from cart.services import merge_guest_carts
+import logging
+
+logger = logging.getLogger(__name__)
 
 class MyTokenObtainPairView(TokenObtainPairView):
     serializer_class = MyTokenObtainPairSerializer
 
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        try:
+            serializer.is_valid(raise_exception=True)
+        except TokenError as e:
+            raise InvalidToken(e.args[0]) from e
+
+        # A guest who signs in keeps what they put in their carts, a failed merge never blocks the login
+        try:
+            merge_guest_carts(request, serializer.user)
+        except Exception as e:
+            logger.warning(f"Failed to merge guest carts for user={serializer.user.pk}: {e}")
+
+        return Response(serializer.validated_data, status=status.HTTP_200_OK)
+
 
 class RegisterViewSet(viewsets.ModelViewSet):
     queryset = CustomUser.objects.all()
@@ -143,10 +164,8 @@ class VendorViewSet(viewsets.ModelViewSet):
     def approve_vendor(self, request, pk=None):
         vendor = self.get_object()
         vendor.approved = True
+        # Vendor post_save invalidates the approved/pending listings
         vendor.save()
-        # Invalidate cache
-        cache.delete('vendors_approved')
-        cache.delete('vendors_pending')
         return Response(
             {"detail": f"Vendor {vendor.company_name} approved."},
             status=status.HTTP_200_OK
@@ -156,10 +175,8 @@ class VendorViewSet(viewsets.ModelViewSet):
     def reject_vendor(self, request, pk=None):
         vendor = self.get_object()
         vendor.approved = False
+        # Vendor post_save invalidates the approved/pending listings
         vendor.save()
-        # Invalidate cache
-        cache.delete('vendors_approved')
-        cache.delete('vendors_pending')
         return Response(
             {"detail": f"Vendor {vendor.company_name} rejected."},
             status=status.HTTP_200_OK
@@ -168,25 +185,25 @@ class VendorViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=["GET"], permission_classes=[IsAuthenticated, IsPlatformAdmin])  # Changed to detail=False
     def get_approved_vendors(self, request):
         """Get all approved vendors with caching."""
-        cache_key = 'vendors_approved'
+        cache_key = get_versioned_key('vendor', PLATFORM_SCOPE, 'approved')
         cached = cache.get(cache_key)
         if cached is not None:
             return Response(cached, status=status.HTTP_200_OK)
 
         approved_vendors = Vendor.objects.filter(approved=True)
         serializer = self.get_serializer(approved_vendors, many=True)
-        cache.set(cache_key, serializer.data, 60 * 15)
+        cache.set(cache_key, serializer.data, DEFAULT_CACHE_TIMEOUT)
         return Response(serializer.data, status=status.HTTP_200_OK)
     
     @action(detail=False, methods=["GET"], permission_classes=[IsAuthenticated, IsPlatformAdmin])  # Changed to detail=False
     def get_pending_vendors(self, request):
         """Get all pending vendors with caching."""
-        cache_key = 'vendors_pending'
+        cache_key = get_versioned_key('vendor', PLATFORM_SCOPE, 'pending')
         cached = cache.get(cache_key)
         if cached is not None:
             return Response(cached, status=status.HTTP_200_OK)
 
         pending_vendors = Vendor.objects.filter(approved=False)
         serializer = self.get_serializer(pending_vendors, many=True)
-        cache.set(cache_key, serializer.data, 60 * 15)
+        cache.set(cache_key, serializer.data, DEFAULT_CACHE_TIMEOUT)
         return Response(serializer.data, status=status.HTTP_200_OK)
\ No newline at end of file
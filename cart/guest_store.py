@@ -0,0 +1,243 @@
+import json
+import logging
+from datetime import datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from accounts.models import Vendor
+from products.models import Product
+from .models import Cart, CartItem
+
+logger = logging.getLogger(__name__)
+
+GUEST_CART_PREFIX = "guest_cart"
+ITEM_FIELD_PREFIX = "item:"
+# Guest cart and item ids as the API shows them, never equal to a database primary key
+GUEST_ID_PREFIX = "g-"
+
+
+def get_guest_id(number):
+    return f"{GUEST_ID_PREFIX}{number}"
+
+
+def get_session_index_key(session_key):
+    return f"{GUEST_CART_PREFIX}:session:{session_key}"
+
+
+def uses_guest_store(request):
+    """Anonymous carts live in Redis unless GUEST_CART_STORAGE is 'database'"""
+    return settings.GUEST_CART_STORAGE == "redis" and not request.user.is_authenticated
+
+
+class GuestCartStore:
+    """
+    One guest cart per vendor and session, kept in a Redis hash with a TTL.
+
+    The hash holds the cart's `id`, `created_at` and `updated_at`, plus one
+    `item:<product_id>` field per line with the item's JSON. Every write
+    renews the TTL, so abandoned carts simply expire and nothing touches
+    the database until persist() runs at checkout or login. Ids come from
+    Redis counters and are shown as "g-<n>", so the API exposes the same
+    fields as database carts without a guest id ever naming a table row.
+    """
+
+    def __init__(self, vendor, session_key, client=None):
+        self.vendor = vendor
+        self.session_key = session_key
+        self.key = f"{GUEST_CART_PREFIX}:{vendor.pk}:{session_key}"
+        # Vendor ids this session has a cart with, so login can find them without a SCAN
+        self.session_index = get_session_index_key(session_key)
+        self.client = client or get_redis_connection("default")
+
+    @classmethod
+    def for_session(cls, session_key, client=None):
+        """One store per vendor the session has a guest cart with"""
+        client = client or get_redis_connection("default")
+        vendor_ids = [int(vendor_id) for vendor_id in client.smembers(get_session_index_key(session_key))]
+        vendors = Vendor.objects.in_bulk(vendor_ids)
+        return [cls(vendors[vendor_id], session_key, client) for vendor_id in sorted(vendors)]
+
+    def _next_id(self, name):
+        return int(self.client.incr(f"{GUEST_CART_PREFIX}:{name}"))
+
+    def _touch(self, pipe, now):
+        pipe.hset(self.key, "updated_at", now.isoformat())
+        pipe.expire(self.key, settings.GUEST_CART_TTL)
+        pipe.sadd(self.session_index, self.vendor.pk)
+        pipe.expire(self.session_index, settings.GUEST_CART_TTL)
+
+    def _update(self, change):
+        """Apply change(fields, now) -> {field: value or None} under WATCH, retried if the hash changes"""
+
+        def apply(pipe):
+            fields = {key.decode(): value.decode() for key, value in pipe.hgetall(self.key).items()}
+            now = timezone.now()
+            updates = change(fields, now)
+            pipe.multi()
+            for field, value in updates.items():
+                if value is None:
+                    pipe.hdel(self.key, field)
+                else:
+                    pipe.hset(self.key, field, value)
+            self._touch(pipe, now)
+
+        self.client.transaction(apply, self.key)
+
+    def _start(self, fields, now):
+        """Fields that begin a new cart, nothing when the hash already holds one"""
+        if "id" in fields:
+            return {}
+        return {"id": str(self._next_id("ids")), "created_at": now.isoformat()}
+
+    def create(self):
+        """Start the cart if this session has none yet, and return it"""
+        self._update(self._start)
+        return self.load()
+
+    def get_lines(self):
+        """{product_id: quantity} straight from the hash, without touching the database"""
+        return {
+            int(field[len(ITEM_FIELD_PREFIX):]): json.loads(value)["quantity"]
+            for field, value in (
+                (key.decode(), value.decode()) for key, value in self.client.hgetall(self.key).items()
+            )
+            if field.startswith(ITEM_FIELD_PREFIX)
+        }
+
+    def load(self):
+        """The cart as unsaved Cart/CartItem instances, products loaded in one query, or None"""
+        fields = {key.decode(): value.decode() for key, value in self.client.hgetall(self.key).items()}
+        if "id" not in fields:
+            return None
+
+        lines = {
+            int(field[len(ITEM_FIELD_PREFIX):]): json.loads(value)
+            for field, value in fields.items() if field.startswith(ITEM_FIELD_PREFIX)
+        }
+        products = Product.objects.filter(pk__in=lines, vendor=self.vendor).select_related("category").in_bulk()
+
+        cart = Cart(
+            pk=get_guest_id(fields["id"]),
+            vendor=self.vendor,
+            session_key=self.session_key,
+            is_active=True,
+            created_at=datetime.fromisoformat(fields["created_at"]),
+            updated_at=datetime.fromisoformat(fields["updated_at"]),
+        )
+        items = []
+        # Products deleted since they were added just drop out of the cart
+        for product_id, line in sorted(lines.items(), key=lambda entry: entry[1]["id"]):
+            if product_id in products:
+                items.append(CartItem(
+                    pk=get_guest_id(line["id"]),
+                    cart=cart,
+                    product=products[product_id],
+                    quantity=line["quantity"],
+                    created_at=datetime.fromisoformat(line["created_at"]),
+                    updated_at=datetime.fromisoformat(line["updated_at"]),
+                ))
+        cart.total = sum((item.total for item in items), Decimal("0.00"))
+        cart.guest_items = items
+        return cart
+
+    def add_item(self, product, quantity=1):
+        """Add a product, or raise its quantity if it's already in the cart, like the database path"""
+        field = f"{ITEM_FIELD_PREFIX}{product.pk}"
+
+        def add(fields, now):
+            if field in fields:
+                line = json.loads(fields[field])
+            else:
+                line = {"id": self._next_id("item_ids"), "quantity": 0, "created_at": now.isoformat()}
+            line["quantity"] += quantity
+            line["updated_at"] = now.isoformat()
+            return {**self._start(fields, now), field: json.dumps(line)}
+
+        self._update(add)
+        return self.get_item(product_id=product.pk)
+
+    def get_item(self, item_id=None, product_id=None):
+        cart = self.load()
+        if cart is None:
+            return None
+        for item in cart.guest_items:
+            if item.pk == item_id or item.product_id == product_id:
+                return item
+        return None
+
+    def set_quantity(self, item, quantity):
+        field = f"{ITEM_FIELD_PREFIX}{item.product_id}"
+
+        def update(fields, now):
+            if field not in fields:
+                return {}
+            line = json.loads(fields[field])
+            line.update(quantity=quantity, updated_at=now.isoformat())
+            return {field: json.dumps(line)}
+
+        self._update(update)
+        return self.get_item(item_id=item.pk)
+
+    def set_lines(self, lines):
+        """Set {product_id: quantity} lines in one transaction, 0 removes a line, and return the cart"""
+
+        def update(fields, now):
+            updates = self._start(fields, now)
+            for product_id, quantity in lines.items():
+                field = f"{ITEM_FIELD_PREFIX}{product_id}"
+                if not quantity:
+                    updates[field] = None
+                    continue
+                if field in fields:
+                    line = json.loads(fields[field])
+                else:
+                    line = {"id": self._next_id("item_ids"), "created_at": now.isoformat()}
+                line.update(quantity=quantity, updated_at=now.isoformat())
+                updates[field] = json.dumps(line)
+            return updates
+
+        self._update(update)
+        return self.load()
+
+    def remove_item(self, item):
+        self._update(lambda fields, now: {f"{ITEM_FIELD_PREFIX}{item.product_id}": None})
+
+    def clear(self):
+        pipe = self.client.pipeline()
+        pipe.delete(self.key)
+        pipe.srem(self.session_index, self.vendor.pk)
+        pipe.execute()
+
+    def persist(self, user=None):
+        """
+        Write the guest cart to the database and drop it from Redis.
+
+        The cart and all of its items are inserted in one transaction, with
+        a single aggregate UPDATE for the total. Returns the new Cart, or
+        None when the session has no guest cart.
+        """
+        guest_cart = self.load()
+        if guest_cart is None:
+            return None
+
+        with transaction.atomic():
+            cart = Cart.objects.create(
+                user=user,
+                session_key=None if user else self.session_key,
+                vendor=self.vendor,
+            )
+            # bulk_create sends no post_save, so the total is refreshed once below
+            CartItem.objects.bulk_create([
+                CartItem(cart=cart, product=item.product, quantity=item.quantity)
+                for item in guest_cart.guest_items
+            ])
+            Cart.refresh_total(cart.pk)
+            transaction.on_commit(self.clear)
+
+        cart.refresh_from_db()
+        logger.info(f"Persisted guest cart {guest_cart.pk} as cart={cart.pk} for vendor={self.vendor.slug}")
+        return cart
@@ -0,0 +1,86 @@
+import time
+import uuid
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models.signals import post_delete, post_save
+from django.test.utils import CaptureQueriesContext
+
+from accounts.models import Vendor
+from cart.models import Cart, CartItem
+from cart.signals import update_cart_total
+from products.models import Category, Product
+
+
+class Rollback(Exception):
+    pass
+
+
+def legacy_update_cart_total(sender, instance, **kwargs):
+    """The previous signal: reload every item and product, sum in Python, save the cart"""
+    cart = instance.cart
+    total = sum(item.total for item in cart.items.select_related('product').all())
+    cart.total = Decimal(total).quantize(Decimal('0.01'))
+    cart.save(update_fields=['total', 'updated_at'])
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill a throwaway cart item by item and report queries and time per mutation, with the "
+        "aggregate UPDATE and with the previous Python recompute. Nothing is kept."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--items", type=int, default=100, help="Items added to the cart")
+
+    def handle(self, *args, **options):
+        for label, receiver in (("python recompute", legacy_update_cart_total), ("sql aggregate", update_cart_total)):
+            self.swap_receiver(receiver)
+            try:
+                self.run(label, options["items"])
+            finally:
+                self.swap_receiver(update_cart_total)
+
+    def swap_receiver(self, receiver):
+        for signal in (post_save, post_delete):
+            for connected in (legacy_update_cart_total, update_cart_total):
+                signal.disconnect(connected, sender=CartItem)
+            signal.connect(receiver, sender=CartItem)
+
+    def run(self, label, count):
+        try:
+            with transaction.atomic():
+                suffix = uuid.uuid4().hex[:8]
+                vendor = Vendor.objects.create(
+                    company_name=f"Benchmark {suffix}", address="-", phone_number="0", email="bench@example.com"
+                )
+                category = Category.objects.create(name="Benchmark", vendor=vendor)
+                products = []
+                for i in range(count):
+                    product = Product(
+                        name=f"Benchmark {i}", description="-", price=Decimal("9.99"), category=category, vendor=vendor
+                    )
+                    product.update_effective_price()
+                    products.append(product)
+                products = Product.objects.bulk_create(products)
+                cart = Cart.objects.create(vendor=vendor, session_key=f"benchmark-{suffix}")
+
+                samples = []
+                for position, product in enumerate(products, start=1):
+                    with CaptureQueriesContext(connection) as queries:
+                        started = time.perf_counter()
+                        CartItem.objects.create(cart=cart, product=product, quantity=2)
+                        elapsed = time.perf_counter() - started
+                    samples.append((position, len(queries), elapsed))
+
+                self.stdout.write(f"{label}, {count}-item cart:")
+                for position, queries, elapsed in samples:
+                    if position in (1, 10, count // 2, count):
+                        self.stdout.write(f"  add item {position:>5} {queries:>4} queries {elapsed * 1000:>9.2f} ms")
+                total_queries = sum(queries for _, queries, _ in samples)
+                total_time = sum(elapsed for _, _, elapsed in samples)
+                self.stdout.write(f"  all {count} adds   {total_queries:>4} queries {total_time * 1000:>9.2f} ms")
+                raise Rollback
+        except Rollback:
+            pass
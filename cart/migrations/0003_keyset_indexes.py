@@ -0,0 +1,24 @@
+# Generated by Django 5.2.11 on 2026-10-18 17:56
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_alter_membership_user'),
+        ('cart', '0002_cart_total_alter_cart_updated_at_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(fields=['vendor', 'created_at', 'id'], name='cart_vendor_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(fields=['vendor', 'user', 'created_at', 'id'], name='cart_vendor_user_created_idx'),
+        ),
+    ]
@@ -1,12 +1,21 @@
 from decimal import Decimal
 from django.db import models
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
 from products.models import Product
 from accounts.models import Vendor
 
 User = get_user_model()
 
+# Line total of a cart item at the product's current sale price, evaluated in SQL
+ITEM_TOTAL = ExpressionWrapper(
+    F('product__effective_price') * F('quantity'),
+    output_field=DecimalField(max_digits=12, decimal_places=2),
+)
+
 
 # Create your models here.
 class Cart(models.Model):
@@ -18,9 +27,32 @@ class Cart(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of vendor-wide and per-user cart listings
+            models.Index(fields=["vendor", "created_at", "id"], name="cart_vendor_created_idx"),
+            models.Index(fields=["vendor", "user", "created_at", "id"], name="cart_vendor_user_created_idx"),
+        ]
+
     def compute_total(self):
-        total = sum(item.total for item in self.items.select_related('product').all())
-        return Decimal(total).quantize(Decimal('0.01'))
+        total = self.items.aggregate(total=Sum(ITEM_TOTAL))['total']
+        return Decimal(total or 0).quantize(Decimal('0.01'))
+
+    @classmethod
+    def refresh_total(cls, cart_id):
+        """
+        Store the sum of a cart's items in one UPDATE with the SUM as a subquery.
+
+        No items are loaded into Python and the query count doesn't grow with
+        the cart. update() sends no post_save, callers invalidate caches.
+        """
+        item_totals = CartItem.objects.filter(cart=OuterRef('pk')).values('cart').annotate(
+            total=Sum(ITEM_TOTAL)
+        ).values('total')
+        return cls.objects.filter(pk=cart_id).update(
+            total=Coalesce(Subquery(item_totals), Value(Decimal('0.00')), output_field=cls._meta.get_field('total')),
+            updated_at=timezone.now(),
+        )
 
     def __str__(self):
         if self.user:
@@ -40,10 +72,8 @@ class CartItem(models.Model):
 
     @property
     def total(self):
-        price = Decimal(self.product.price)
-        discount = Decimal(self.product.discount) / Decimal('100') if self.product.discount else Decimal('0')
-        total = price * (Decimal('1') - discount) * Decimal(self.quantity)
-        return total.quantize(Decimal('0.01'))
+        # effective_price is the discounted unit price, already rounded to cents
+        return (self.product.effective_price * self.quantity).quantize(Decimal('0.01'))
 
     def __str__(self):
         return f"{self.quantity} x {self.product.name}"
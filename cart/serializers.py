@@ -1,36 +1,114 @@
+from django.db.models import Prefetch
 from rest_framework import serializers
 from .models import Cart, CartItem
 from accounts.serializers import VendorSerializer, RegisterSerializer
 from django.contrib.auth import get_user_model
-from products.serializers import ProductSerializer
+from products.models import Product
 
 user = get_user_model()
 
-class CartSerializer(serializers.ModelSerializer):
-    items = serializers.SerializerMethodField()
-
-    class Meta:
-        model = Cart
-        fields = ["id", "user", "session_key", "is_active", "vendor", "items", "total", "created_at", "updated_at"]
-        read_only_fields = ["id", "user", "session_key", "is_active", "vendor", "created_at", "updated_at"]
-
-    def get_items(self, obj):
-        items = CartItem.objects.filter(cart=obj)
-        return CartItemSerializer(items, many=True).data
+# Everything a cart line shows, joined in the item query
+CART_ITEM_RELATED = ("product__category",)
 
+# Largest number of lines one batch request may set
+MAX_BATCH_ITEMS = 100
 
 class CartItemSerializer(serializers.ModelSerializer):
-    cart = CartSerializer(read_only=True)
+    """
+    One cart line, flat: the product is referenced by id with the few
+    fields a cart needs next to it, instead of a nested ProductSerializer
+    and a nested copy of the cart.
+    """
+    # Integer for database rows, "g-<n>" for Redis guest lines
+    id = serializers.ReadOnlyField()
+    product = serializers.PrimaryKeyRelatedField(queryset=Product.objects.all())
+    name = serializers.CharField(source="product.name", read_only=True)
+    sku = serializers.CharField(source="product.sku", read_only=True, allow_null=True)
+    category = serializers.CharField(source="product.category.name", read_only=True)
+    unit_price = serializers.DecimalField(
+        source="product.effective_price", max_digits=10, decimal_places=2, read_only=True
+    )
     price_total = serializers.SerializerMethodField()
-    product = ProductSerializer()
 
     class Meta:
         model = CartItem
-        fields = ["id", "cart", "product", "quantity", "price_total", "created_at", "updated_at"]
-        read_only_fields = ["id", "cart", "product", "created_at", "updated_at"]
+        fields = [
+            "id", "cart", "product", "name", "sku", "category", "unit_price",
+            "quantity", "price_total", "created_at", "updated_at"
+        ]
+        read_only_fields = ["id", "cart", "created_at", "updated_at"]
 
     def get_price_total(self, obj):
         return obj.total
-        
+
+    def validate_product(self, value):
+        vendor = self.context.get("vendor")
+        # Compare ids, loading value.vendor would cost a query per request
+        if vendor is not None and value.vendor_id != vendor.pk:
+            raise serializers.ValidationError("Product does not belong to this vendor.")
+        return value
+
+
+class CartItemBatchLineSerializer(serializers.Serializer):
+    # Plain ids, the batch serializer checks every product with one query
+    product = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=0)
+
+
+class CartItemBatchSerializer(serializers.Serializer):
+    """
+    Many cart lines set at once, as {product, quantity} entries.
+
+    Each entry sets the product's quantity in the cart, 0 removes it. The
+    products are checked against the vendor in context with one query, and
+    validated_data["items"] is a {product_id: quantity} dict.
+    """
+    items = CartItemBatchLineSerializer(many=True, allow_empty=False, max_length=MAX_BATCH_ITEMS)
+
+    def validate_items(self, value):
+        product_ids = [line["product"] for line in value]
+        vendor = self.context["vendor"]
+        known = set(Product.objects.filter(pk__in=product_ids, vendor=vendor).values_list("pk", flat=True))
+
+        seen = set()
+        errors = []
+        for product_id in product_ids:
+            if product_id not in known:
+                errors.append({"product": ["Product does not belong to this vendor."]})
+            elif product_id in seen:
+                errors.append({"product": ["Product is listed more than once."]})
+            else:
+                errors.append({})
+            seen.add(product_id)
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return {line["product"]: line["quantity"] for line in value}
+
+
+class CartSerializer(serializers.ModelSerializer):
+    # Integer for database rows, "g-<n>" for Redis guest carts
+    id = serializers.ReadOnlyField()
+    items = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Cart
+        fields = ["id", "user", "session_key", "is_active", "vendor", "items", "total", "created_at", "updated_at"]
+        read_only_fields = ["id", "user", "session_key", "is_active", "vendor", "total", "created_at", "updated_at"]
+
+    def get_items(self, obj):
+        # Lists prefetch every cart's items with prefetch_cart_items(), single carts load theirs here
+        if hasattr(obj, "guest_items"):
+            # Redis guest carts come with their items already built
+            items = obj.guest_items
+        elif "items" in getattr(obj, "_prefetched_objects_cache", {}):
+            items = obj.items.all()
+        else:
+            items = obj.items.select_related(*CART_ITEM_RELATED).order_by("id")
+        return CartItemSerializer(items, many=True, context=self.context).data
 
 
+def prefetch_cart_items(queryset):
+    """Load the items of every cart in the queryset, with product and category, in one extra query"""
+    return queryset.prefetch_related(
+        Prefetch("items", queryset=CartItem.objects.select_related(*CART_ITEM_RELATED).order_by("id"))
+    )
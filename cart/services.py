@@ -0,0 +1,136 @@
+import logging
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from products.models import Product
+from services.caching import clear_vendor_cache_on_commit, coalesce_invalidations
+from .guest_store import GuestCartStore
+from .models import Cart, CartItem
+from .signals import skip_cart_totals
+from .utilis import get_session_key
+
+logger = logging.getLogger(__name__)
+
+
+def lock_active_cart(vendor, user=None, session_key=None):
+    """The owner's newest active cart for a vendor, locked for update, created if there is none"""
+    owner = {'user': user} if user else {'session_key': session_key, 'user__isnull': True}
+    cart = Cart.objects.select_for_update().filter(
+        vendor=vendor, is_active=True, **owner
+    ).order_by('-updated_at').first()
+    if cart is None:
+        cart = Cart.objects.create(vendor=vendor, user=user, session_key=None if user else session_key)
+    return cart
+
+
+def write_cart_lines(cart, quantities):
+    """Upsert {product_id: quantity} lines into a cart with one INSERT ... ON CONFLICT DO UPDATE"""
+    now = timezone.now()
+    CartItem.objects.bulk_create(
+        [
+            CartItem(cart=cart, product_id=product_id, quantity=quantity, created_at=now, updated_at=now)
+            for product_id, quantity in sorted(quantities.items())
+        ],
+        update_conflicts=True,
+        unique_fields=['cart', 'product'],
+        update_fields=['quantity', 'updated_at'],
+    )
+
+
+def merge_cart_lines(user, vendor, lines):
+    """
+    Add {product_id: quantity} lines to a user's active cart for a vendor, in one transaction.
+
+    Quantities of products already in the cart are summed. All lines are
+    written with a single INSERT ... ON CONFLICT (cart, product) DO UPDATE,
+    so no per-item signal runs. The total is then recomputed with one
+    aggregate UPDATE, and the cart cache is invalidated once on commit.
+    """
+    with transaction.atomic():
+        cart = lock_active_cart(vendor, user=user)
+
+        # Deleted products and products of other vendors are dropped
+        product_ids = set(Product.objects.filter(pk__in=lines, vendor=vendor).values_list('pk', flat=True))
+        existing = dict(cart.items.filter(product_id__in=product_ids).values_list('product_id', 'quantity'))
+
+        write_cart_lines(cart, {
+            product_id: existing.get(product_id, 0) + lines[product_id] for product_id in product_ids
+        })
+        Cart.refresh_total(cart.pk)
+        clear_vendor_cache_on_commit(vendor.slug, 'cart')
+    return cart
+
+
+def set_cart_lines(vendor, lines, user=None, session_key=None):
+    """
+    Set the quantity of many products in the owner's active cart, in one transaction.
+
+    `lines` maps product ids, already checked against the vendor, to their
+    new quantity, and a quantity of 0 removes the product. Present lines are
+    upserted with one statement and removed ones deleted with another. The
+    per-item total signal is skipped, the total is recomputed with a single
+    aggregate UPDATE and the cart cache invalidated once on commit.
+    """
+    with transaction.atomic(), skip_cart_totals():
+        cart = lock_active_cart(vendor, user=user, session_key=session_key)
+        quantities = {product_id: quantity for product_id, quantity in lines.items() if quantity}
+        removed = [product_id for product_id, quantity in lines.items() if not quantity]
+
+        if quantities:
+            write_cart_lines(cart, quantities)
+        if removed:
+            cart.items.filter(product_id__in=removed).delete()
+        Cart.refresh_total(cart.pk)
+        clear_vendor_cache_on_commit(vendor.slug, 'cart')
+
+    cart.refresh_from_db(fields=['total', 'updated_at'])
+    return cart
+
+
+def merge_guest_carts(request, user):
+    """
+    Move every cart the guest session holds into the user's carts, one vendor at a time.
+
+    Database guest carts are deactivated with one UPDATE, Redis guest carts
+    are dropped once the merge commits. Returns the user's merged carts.
+    """
+    session_key = get_session_key(request, create=False)
+    if session_key is None:
+        return []
+
+    sources = defaultdict(lambda: defaultdict(int))
+    vendors = {}
+
+    guest_carts = list(
+        Cart.objects.filter(session_key=session_key, user__isnull=True, is_active=True).select_related('vendor')
+    )
+    items = CartItem.objects.filter(cart__in=guest_carts).values_list('cart_id', 'product_id', 'quantity')
+    carts_by_id = {cart.pk: cart for cart in guest_carts}
+    for cart_id, product_id, quantity in items:
+        vendor = carts_by_id[cart_id].vendor
+        vendors[vendor.pk] = vendor
+        sources[vendor.pk][product_id] += quantity
+
+    stores = GuestCartStore.for_session(session_key) if settings.GUEST_CART_STORAGE == 'redis' else []
+    for store in stores:
+        vendors[store.vendor.pk] = store.vendor
+        for product_id, quantity in store.get_lines().items():
+            sources[store.vendor.pk][product_id] += quantity
+
+    merged = []
+    with transaction.atomic(), coalesce_invalidations():
+        for vendor_id, lines in sources.items():
+            merged.append(merge_cart_lines(user, vendors[vendor_id], lines))
+        if guest_carts:
+            Cart.objects.filter(pk__in=carts_by_id).update(is_active=False, updated_at=timezone.now())
+            for cart in guest_carts:
+                clear_vendor_cache_on_commit(cart.vendor.slug, 'cart')
+        for store in stores:
+            transaction.on_commit(store.clear)
+
+    if merged:
+        logger.info(f"Merged {len(merged)} guest carts into user={user.pk}'s carts")
+    return merged
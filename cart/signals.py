@@ -1,24 +1,55 @@
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from .models import CartItem
-from services.caching import clear_vendor_cache
+from .models import Cart, CartItem
+from services.caching import clear_vendor_cache_on_commit
+from contextlib import contextmanager
 import logging
+import threading
 
 logger = logging.getLogger(__name__)
 
+_total_state = threading.local()
+
+
+@contextmanager
+def skip_cart_totals():
+    # bulk cart writes refresh the total themselves, once, instead of per deleted item
+    _total_state.depth = getattr(_total_state, 'depth', 0) + 1
+    try:
+        yield
+    finally:
+        _total_state.depth -= 1
+
+
+def get_cart_vendor_slug(item):
+    # reuse the cart and vendor already loaded by the caller, query only when they aren't
+    if CartItem.cart.is_cached(item) and Cart.vendor.is_cached(item.cart):
+        return item.cart.vendor.slug
+    return Cart.objects.filter(pk=item.cart_id).values_list('vendor__slug', flat=True).first()
+
 
 @receiver([post_save, post_delete], sender=CartItem)
 def update_cart_total(sender, instance, **kwargs):
-    cart = instance.cart
-    cart.total = cart.compute_total()
-    cart.save(update_fields=['total', 'updated_at'])
+    if getattr(_total_state, 'depth', 0):
+        return
+    # one aggregate UPDATE, however many items the cart holds
+    Cart.refresh_total(instance.cart_id)
+    # the update sends no post_save, so invalidate the cart list cache here
+    try:
+        vendor_slug = get_cart_vendor_slug(instance)
+        if vendor_slug:
+            clear_vendor_cache_on_commit(vendor_slug, 'cart')
+    except Exception as e:
+        logger.warning(f"Failed to clear cart cache: {e}")
+
 
-    
-    # invalidate cart list cache for vendor
+@receiver([post_save, post_delete], sender=Cart)
+def invalidate_cart_cache(sender, instance, **kwargs):
+    # carts are cached per user/session, so new or closed carts must show up too
     try:
-        vendor = getattr(cart, 'vendor', None)
+        vendor = getattr(instance, 'vendor', None)
         if vendor:
-            clear_vendor_cache(vendor.slug, 'cart')
+            clear_vendor_cache_on_commit(vendor.slug, 'cart')
             logger.info(f"Cleared cart cache for vendor={vendor.slug}")
     except Exception as e:
-        logger.warning(f"Failed to clear cart cache: {e}")
\ No newline at end of file
+        logger.warning(f"Failed to clear cart cache: {e}")
@@ -1,11 +1,25 @@
 from decimal import Decimal
-from django.test import TestCase
+from unittest import mock
+import fakeredis
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.models import Session
+from django.contrib.sessions.backends.db import SessionStore
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
 import cart.signals  
-from accounts.models import Vendor
+from accounts.models import Vendor, Membership
 from products.models import Category, Product
 from .models import Cart, CartItem
-
+from .guest_store import GuestCartStore
+from .services import merge_cart_lines
+from .views import CartViewSet
+from orders.models import Order
+from orders.views import CheckoutViewSet
+from services.testing import LOCMEM_CACHES
 
 class CartModelTests(TestCase):
 	def setUp(self):
@@ -43,3 +57,452 @@ class CartModelTests(TestCase):
 		self.cart.refresh_from_db()
 		self.assertEqual(self.cart.total, Decimal('10.00'))
 
+	def test_total_is_updated_with_flat_query_count(self):
+		#Test that changing an item costs the same queries in a 1-item and a 100-item cart
+		products = []
+		for i in range(100):
+			product = Product(
+				name=f'Bulk {i}', description='B', price=Decimal('2.50'), category=self.category, vendor=self.vendor
+			)
+			product.update_effective_price()
+			products.append(product)
+		products = Product.objects.bulk_create(products)
+
+		with self.assertNumQueries(2):
+			first = CartItem.objects.create(cart=self.cart, product=products[0], quantity=1)
+		CartItem.objects.bulk_create(
+			[CartItem(cart=self.cart, product=product, quantity=2) for product in products[1:99]]
+		)
+		with self.assertNumQueries(2):
+			last = CartItem.objects.create(cart=self.cart, product=products[99], quantity=1)
+		self.assertEqual(Cart.objects.get(pk=self.cart.pk).total, Decimal('2.50') * (2 + 98 * 2))
+
+		last.quantity = 5
+		with self.assertNumQueries(2):
+			last.save()
+		with self.assertNumQueries(2):
+			first.delete()
+		cart = Cart.objects.get(pk=self.cart.pk)
+		self.assertEqual(cart.total, cart.compute_total())
+		self.assertEqual(cart.total, Decimal('2.50') * (98 * 2 + 5))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CartListCachingTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.factory = APIRequestFactory()
+		self.view = CartViewSet.as_view({'get': 'list'})
+		# Flush the fixtures' invalidations so each test starts without a pending batch
+		with self.captureOnCommitCallbacks(execute=True):
+			self.vendor = Vendor.objects.create(
+				company_name='Acme Corp', address='123 Lane', phone_number='1234567890', email='v@acme.com'
+			)
+			self.alice = get_user_model().objects.create_user(email='alice@example.com', password='pass')
+			self.bob = get_user_model().objects.create_user(email='bob@example.com', password='pass')
+			self.admin = get_user_model().objects.create_user(email='admin@example.com', password='pass')
+			Membership.objects.create(user=self.admin, vendor=self.vendor, role='vendor_admin')
+			self.alice_cart = Cart.objects.create(user=self.alice, vendor=self.vendor)
+			self.bob_cart = Cart.objects.create(user=self.bob, vendor=self.vendor)
+
+	def list_ids(self, user):
+		request = self.factory.get(f'/api/cart/vendors/{self.vendor.slug}/carts/')
+		force_authenticate(request, user=user)
+		response = self.view(request, vendor_slug=self.vendor.slug)
+		return [cart['id'] for cart in response.data['results']]
+
+	def test_each_user_gets_their_own_cached_list(self):
+		#Test that the first caller's cached list is not served to others
+		self.assertEqual(self.list_ids(self.alice), [self.alice_cart.id])
+		self.assertEqual(self.list_ids(self.bob), [self.bob_cart.id])
+		self.assertEqual(self.list_ids(self.alice), [self.alice_cart.id])
+
+	def test_admin_roles_get_the_vendor_wide_list(self):
+		#Test that vendor admins see every cart even after a user primed the cache
+		self.list_ids(self.alice)
+		self.assertEqual(sorted(self.list_ids(self.admin)), sorted([self.alice_cart.id, self.bob_cart.id]))
+
+	def test_listing_cost_does_not_grow_with_carts_or_items(self):
+		#Test that a vendor-wide listing runs the same queries for 2 carts and for 20 carts of 10 items
+		category = Category.objects.create(name='Default', vendor=self.vendor)
+		products = Product.objects.bulk_create([
+			Product(name=f'P{i}', description='P', price=Decimal('5.00'), effective_price=Decimal('5.00'),
+				category=category, vendor=self.vendor)
+			for i in range(10)
+		])
+
+		def fill(carts):
+			CartItem.objects.bulk_create(
+				[CartItem(cart=cart, product=product, quantity=1) for cart in carts for product in products]
+			)
+
+		def count_queries():
+			cache.clear()
+			request = self.factory.get(f'/api/cart/vendors/{self.vendor.slug}/carts/?page_size=50')
+			force_authenticate(request, user=self.admin)
+			with CaptureQueriesContext(connection) as queries:
+				response = self.view(request, vendor_slug=self.vendor.slug)
+			return len(queries), response.data['results']
+
+		fill([self.alice_cart, self.bob_cart])
+		baseline, results = count_queries()
+		self.assertEqual([len(cart['items']) for cart in results], [10, 10])
+
+		users = get_user_model().objects.bulk_create([get_user_model()(email=f'u{i}@example.com') for i in range(18)])
+		fill(Cart.objects.bulk_create([Cart(user=user, vendor=self.vendor) for user in users]))
+		queries, results = count_queries()
+		self.assertEqual(queries, baseline)
+		self.assertEqual(len(results), 20)
+		self.assertEqual(
+			set(results[0]['items'][0]),
+			{
+				'id', 'cart', 'product', 'name', 'sku', 'category', 'unit_price', 'quantity', 'price_total',
+				'created_at', 'updated_at',
+			}
+		)
+		self.assertEqual(results[0]['items'][0]['category'], 'Default')
+
+	def test_new_cart_invalidates_cached_lists(self):
+		#Test that creating a cart shows up in an already cached list
+		self.list_ids(self.admin)
+		carol = get_user_model().objects.create_user(email='carol@example.com', password='pass')
+		with self.captureOnCommitCallbacks(execute=True):
+			carol_cart = Cart.objects.create(user=carol, vendor=self.vendor)
+		self.assertIn(carol_cart.id, self.list_ids(self.admin))
+
+
+@override_settings(CACHES=LOCMEM_CACHES, GUEST_CART_STORAGE='redis')
+class GuestCartStoreTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.redis = fakeredis.FakeRedis()
+		patcher = mock.patch('cart.guest_store.get_redis_connection', return_value=self.redis)
+		patcher.start()
+		self.addCleanup(patcher.stop)
+
+		self.vendor = Vendor.objects.create(
+			company_name='Acme Corp', address='123 Lane', phone_number='1234567890', email='v@acme.com'
+		)
+		self.category = Category.objects.create(name='Default', vendor=self.vendor)
+		self.phone = Product.objects.create(
+			name='Phone', description='P', price=Decimal('100.00'), discount=Decimal('10'),
+			category=self.category, vendor=self.vendor
+		)
+		self.case = Product.objects.create(
+			name='Case', description='C', price=Decimal('15.00'), category=self.category, vendor=self.vendor
+		)
+		self.client = APIClient()
+		self.carts_url = f'/api/cart/vendors/{self.vendor.slug}/carts/'
+		self.items_url = f'/api/cart/vendors/{self.vendor.slug}/cartitems/'
+
+	def add(self, product, quantity):
+		response = self.client.post(self.items_url, {'product': product.pk, 'quantity': quantity}, format='json')
+		self.assertEqual(response.status_code, 201)
+		return response.json()
+
+	def test_browsing_creates_no_session_or_cart(self):
+		#Test that a guest who only reads gets empty lists without a session row
+		self.assertEqual(self.client.get(self.carts_url).json()['results'], [])
+		self.assertEqual(self.client.get(self.items_url).json()['results'], [])
+		self.assertEqual(Session.objects.count(), 0)
+
+	@override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cache')
+	def test_cache_sessions_keep_guest_writes_out_of_the_database(self):
+		#Test that with the cache session engine a guest cart writes no session or cart row
+		self.add(self.phone, 1)
+		self.assertEqual(Session.objects.count(), 0)
+		self.assertFalse(Cart.objects.exists())
+
+	def test_guest_cart_lives_in_redis(self):
+		#Test that adding items builds the cart in a Redis hash with a TTL and no cart rows
+		first = self.add(self.phone, 1)
+		again = self.add(self.phone, 2)
+		self.add(self.case, 1)
+		self.assertEqual(again['id'], first['id'])
+		self.assertEqual(again['quantity'], 3)
+
+		carts = self.client.get(self.carts_url).json()['results']
+		self.assertEqual(len(carts), 1)
+		self.assertEqual(carts[0]['total'], '285.00')
+		self.assertEqual([item['name'] for item in carts[0]['items']], ['Phone', 'Case'])
+		self.assertFalse(Cart.objects.exists())
+		key = next(iter(self.redis.scan_iter('guest_cart:*:*')))
+		self.assertGreater(self.redis.ttl(key), 0)
+
+	def test_guest_ids_never_name_database_rows(self):
+		#Test that guest ids are namespaced, so a database id can't reach a guest line or the other way round
+		with self.captureOnCommitCallbacks(execute=True):
+			cart = Cart.objects.create(session_key='someone-else', vendor=self.vendor)
+			row = CartItem.objects.create(cart=cart, product=self.case, quantity=1)
+		item = self.add(self.phone, 1)
+		self.assertTrue(str(item['id']).startswith('g-'))
+		self.assertTrue(str(item['cart']).startswith('g-'))
+		self.assertEqual(self.client.get(f"{self.items_url}{item['id']}/").status_code, 200)
+		self.assertEqual(self.client.get(f"{self.items_url}{row.pk}/").status_code, 404)
+		self.assertEqual(self.client.get(f"{self.carts_url}{cart.pk}/").status_code, 404)
+
+	def test_items_can_be_updated_and_removed(self):
+		#Test the item detail routes against the Redis store
+		item = self.add(self.phone, 1)
+		response = self.client.patch(f"{self.items_url}{item['id']}/", {'quantity': 4}, format='json')
+		self.assertEqual(response.json()['price_total'], 360)
+		self.assertEqual(self.client.delete(f"{self.items_url}{item['id']}/").status_code, 204)
+		self.assertEqual(self.client.get(f"{self.items_url}{item['id']}/").status_code, 404)
+
+	def test_products_of_other_vendors_are_rejected(self):
+		#Test that a guest can't add another vendor's product
+		other = Vendor.objects.create(
+			company_name='Other', address='1 Road', phone_number='1234567890', email='o@other.com'
+		)
+		product = Product.objects.create(
+			name='Other', description='O', price=Decimal('1.00'),
+			category=Category.objects.create(name='Default', vendor=other), vendor=other
+		)
+		response = self.client.post(self.items_url, {'product': product.pk, 'quantity': 1}, format='json')
+		self.assertEqual(response.status_code, 400)
+
+	def test_both_storage_modes_return_the_same_cart(self):
+		#Test that the Redis and database guest paths answer with the same payloads
+		def run():
+			self.client = APIClient()
+			self.add(self.phone, 2)
+			self.add(self.case, 1)
+			cart = self.client.get(self.carts_url).json()['results'][0]
+			for volatile in ('id', 'session_key', 'created_at', 'updated_at'):
+				cart.pop(volatile)
+			for item in cart['items']:
+				for volatile in ('id', 'cart', 'created_at', 'updated_at'):
+					item.pop(volatile)
+			return cart
+
+		in_redis = run()
+		with override_settings(GUEST_CART_STORAGE='database'):
+			in_database = run()
+		self.assertEqual(in_redis, in_database)
+
+	def checkout(self):
+		request = APIRequestFactory().post(f'/api/vendors/{self.vendor.slug}/checkout/')
+		request.session = SessionStore(session_key=self.client.cookies['sessionid'].value)
+		request.user = AnonymousUser()
+		with self.captureOnCommitCallbacks(execute=True):
+			return CheckoutViewSet.as_view({'post': 'create'})(request, vendor_slug=self.vendor.slug)
+
+	def test_checkout_writes_the_guest_cart_to_the_database(self):
+		#Test that checkout persists the Redis cart, orders it and drops the hash
+		self.add(self.phone, 2)
+		session_key = self.client.cookies['sessionid'].value
+		response = self.checkout()
+		self.assertEqual(response.status_code, 201)
+
+		order = Order.objects.get(pk=response.data['order_id'])
+		self.assertEqual(order.total, Decimal('180.00'))
+		self.assertEqual(order.session_key, session_key)
+		cart = Cart.objects.get(session_key=session_key)
+		self.assertFalse(cart.is_active)
+		self.assertEqual(cart.items.get().quantity, 2)
+		self.assertEqual(list(self.redis.scan_iter('guest_cart:*:*')), [])
+
+	def test_repeat_checkout_keeps_the_guest_cart(self):
+		#Test that checking out again with a pending order answers 409 and leaves the new cart in Redis
+		self.add(self.phone, 2)
+		first = self.checkout()
+		self.add(self.case, 1)
+
+		response = self.checkout()
+		self.assertEqual(response.status_code, 409)
+		self.assertEqual(response.data['order_id'], first.data['order_id'])
+		self.assertEqual(Order.objects.count(), 1)
+		self.assertFalse(Cart.objects.filter(is_active=True).exists())
+		carts = self.client.get(self.carts_url).json()['results']
+		self.assertEqual([item['name'] for item in carts[0]['items']], ['Case'])
+
+	def test_failed_checkout_keeps_the_guest_cart(self):
+		#Test that the Redis cart is only dropped once the order commits
+		self.add(self.phone, 2)
+		with mock.patch('orders.views.create_order_from_cart', side_effect=RuntimeError):
+			with self.assertRaises(RuntimeError):
+				self.checkout()
+		self.assertFalse(Cart.objects.exists())
+		carts = self.client.get(self.carts_url).json()['results']
+		self.assertEqual([item['name'] for item in carts[0]['items']], ['Phone'])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CartMergeTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.redis = fakeredis.FakeRedis()
+		patcher = mock.patch('cart.guest_store.get_redis_connection', return_value=self.redis)
+		patcher.start()
+		self.addCleanup(patcher.stop)
+
+		with self.captureOnCommitCallbacks(execute=True):
+			self.vendor = Vendor.objects.create(
+				company_name='Acme Corp', address='123 Lane', phone_number='1234567890', email='v@acme.com'
+			)
+			self.category = Category.objects.create(name='Default', vendor=self.vendor)
+			self.products = []
+			for i in range(30):
+				product = Product(
+					name=f'P{i}', description='P', price=Decimal('10.00'), category=self.category, vendor=self.vendor
+				)
+				product.update_effective_price()
+				self.products.append(product)
+			self.products = Product.objects.bulk_create(self.products)
+			self.user = get_user_model().objects.create_user(email='user@example.com', password='pass')
+			self.user_cart = Cart.objects.create(user=self.user, vendor=self.vendor)
+			CartItem.objects.create(cart=self.user_cart, product=self.products[0], quantity=1)
+
+		self.session = SessionStore()
+		self.session.create()
+		self.client = APIClient()
+		self.client.cookies['sessionid'] = self.session.session_key
+
+	def login(self):
+		with self.captureOnCommitCallbacks(execute=True):
+			response = self.client.post(
+				'/api/accounts/token/', {'email': 'user@example.com', 'password': 'pass'}, format='json'
+			)
+		self.assertEqual(response.status_code, 200)
+		return Cart.objects.get(pk=self.user_cart.pk)
+
+	def quantities(self, cart):
+		return dict(cart.items.values_list('product__name', 'quantity'))
+
+	@override_settings(GUEST_CART_STORAGE='database')
+	def test_database_guest_cart_is_merged_on_login(self):
+		#Test that a session cart's items are added to the user's cart and the guest cart closed
+		with self.captureOnCommitCallbacks(execute=True):
+			guest_cart = Cart.objects.create(session_key=self.session.session_key, vendor=self.vendor)
+			CartItem.objects.create(cart=guest_cart, product=self.products[0], quantity=2)
+			CartItem.objects.create(cart=guest_cart, product=self.products[1], quantity=3)
+
+		cart = self.login()
+		self.assertEqual(self.quantities(cart), {'P0': 3, 'P1': 3})
+		self.assertEqual(cart.total, Decimal('60.00'))
+		guest_cart.refresh_from_db()
+		self.assertFalse(guest_cart.is_active)
+
+	@override_settings(GUEST_CART_STORAGE='redis')
+	def test_redis_guest_cart_is_merged_on_login(self):
+		#Test that the Redis guest cart is merged and then dropped
+		store = GuestCartStore(self.vendor, self.session.session_key)
+		store.add_item(self.products[0], 1)
+		store.add_item(self.products[2], 4)
+
+		cart = self.login()
+		self.assertEqual(self.quantities(cart), {'P0': 2, 'P2': 4})
+		self.assertEqual(cart.total, Decimal('60.00'))
+		self.assertEqual(list(self.redis.scan_iter('guest_cart:*')), [b'guest_cart:ids', b'guest_cart:item_ids'])
+
+	def test_merge_cost_does_not_grow_with_lines(self):
+		#Test that merging 3 or 30 lines runs the same queries and invalidates the cache once
+		def merge(count):
+			lines = {product.pk: 1 for product in self.products[:count]}
+			with mock.patch('services.caching.clear_vendor_cache') as clear:
+				with CaptureQueriesContext(connection) as queries:
+					with self.captureOnCommitCallbacks(execute=True):
+						merge_cart_lines(self.user, self.vendor, lines)
+			clear.assert_called_once_with(self.vendor.slug, 'cart')
+			return len(queries)
+
+		self.assertEqual(merge(3), merge(30))
+		self.assertEqual(Cart.objects.get(pk=self.user_cart.pk).total, Decimal('340.00'))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CartBatchTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.redis = fakeredis.FakeRedis()
+		patcher = mock.patch('cart.guest_store.get_redis_connection', return_value=self.redis)
+		patcher.start()
+		self.addCleanup(patcher.stop)
+
+		with self.captureOnCommitCallbacks(execute=True):
+			self.vendor = Vendor.objects.create(
+				company_name='Acme Corp', address='123 Lane', phone_number='1234567890', email='v@acme.com'
+			)
+			self.category = Category.objects.create(name='Default', vendor=self.vendor)
+			self.products = []
+			for i in range(30):
+				product = Product(
+					name=f'P{i}', description='P', price=Decimal('10.00'), category=self.category, vendor=self.vendor
+				)
+				product.update_effective_price()
+				self.products.append(product)
+			self.products = Product.objects.bulk_create(self.products)
+			self.user = get_user_model().objects.create_user(email='user@example.com', password='pass')
+			self.user_cart = Cart.objects.create(user=self.user, vendor=self.vendor)
+			CartItem.objects.create(cart=self.user_cart, product=self.products[0], quantity=1)
+			CartItem.objects.create(cart=self.user_cart, product=self.products[1], quantity=1)
+
+		self.client = APIClient()
+		self.url = f'/api/cart/vendors/{self.vendor.slug}/cartitems/batch/'
+
+	def batch(self, lines, status_code=200):
+		with self.captureOnCommitCallbacks(execute=True):
+			response = self.client.post(
+				self.url, [{'product': product.pk, 'quantity': quantity} for product, quantity in lines], format='json'
+			)
+		self.assertEqual(response.status_code, status_code)
+		return response.json()
+
+	def test_batch_sets_updates_and_removes_lines(self):
+		#Test that one request adds, updates and removes items and returns the final cart
+		self.client.force_authenticate(self.user)
+		cart = self.batch([(self.products[0], 3), (self.products[1], 0), (self.products[2], 2)])
+		self.assertEqual(cart['id'], self.user_cart.pk)
+		self.assertEqual({item['name']: item['quantity'] for item in cart['items']}, {'P0': 3, 'P2': 2})
+		self.assertEqual(cart['total'], '50.00')
+		self.assertEqual(Cart.objects.get(pk=self.user_cart.pk).total, Decimal('50.00'))
+
+	def test_batch_cost_does_not_grow_with_lines(self):
+		#Test that setting 3 or 28 lines runs the same queries and invalidates the cache once
+		self.client.force_authenticate(self.user)
+		# the first request also caches the vendor lookup
+		self.batch([(self.products[2], 1)])
+
+		def run(removed, count):
+			lines = [(removed, 0)] + [(product, 2) for product in self.products[2:2 + count]]
+			with mock.patch('services.caching.clear_vendor_cache') as clear:
+				with CaptureQueriesContext(connection) as queries:
+					self.batch(lines)
+			clear.assert_called_once_with(self.vendor.slug, 'cart')
+			return len(queries)
+
+		self.assertEqual(run(self.products[0], 3), run(self.products[1], 28))
+		self.assertEqual(Cart.objects.get(pk=self.user_cart.pk).total, Decimal('560.00'))
+
+	def test_invalid_lines_reject_the_whole_batch(self):
+		#Test that foreign or repeated products fail per entry and leave the cart untouched
+		self.client.force_authenticate(self.user)
+		other = Vendor.objects.create(
+			company_name='Other', address='1 Road', phone_number='1234567890', email='o@other.com'
+		)
+		foreign = Product.objects.create(
+			name='Other', description='O', price=Decimal('1.00'),
+			category=Category.objects.create(name='Default', vendor=other), vendor=other
+		)
+		errors = self.batch([(self.products[2], 1), (foreign, 1), (self.products[2], 2)], status_code=400)
+		self.assertEqual(errors['items'][0], {})
+		self.assertIn('product', errors['items'][1])
+		self.assertIn('product', errors['items'][2])
+		self.assertEqual(self.user_cart.items.count(), 2)
+
+	@override_settings(GUEST_CART_STORAGE='database')
+	def test_database_guest_gets_a_session_cart(self):
+		#Test that a guest's batch creates their session cart
+		cart = self.batch([(self.products[3], 2), (self.products[4], 1)])
+		self.assertEqual(cart['session_key'], self.client.cookies['sessionid'].value)
+		self.assertEqual(cart['total'], '30.00')
+		self.assertEqual(Cart.objects.get(pk=cart['id']).items.count(), 2)
+
+	@override_settings(GUEST_CART_STORAGE='redis')
+	def test_redis_guest_cart_is_set_in_one_write(self):
+		#Test that a Redis guest's batch updates the hash and no cart rows
+		self.batch([(self.products[3], 2), (self.products[4], 1)])
+		cart = self.batch([(self.products[3], 5), (self.products[4], 0)])
+		self.assertEqual([(item['name'], item['quantity']) for item in cart['items']], [('P3', 5)])
+		self.assertEqual(cart['total'], '50.00')
+		self.assertEqual(Cart.objects.filter(user__isnull=True).count(), 0)
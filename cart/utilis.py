@@ -1,4 +1,7 @@
-def get_session_key(request):
+def get_session_key(request, create=True):
+    # reads pass create=False so browsing guests and bots don't each get a session row
     if not request.session.session_key:
+        if not create:
+            return None
         request.session.create()
     return request.session.session_key
@@ -1,37 +1,54 @@
-from rest_framework import viewsets
-from django.shortcuts import get_object_or_404
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from django.http import Http404
 from .models import Cart, CartItem
-from .serializers import CartSerializer, CartItemSerializer
-from accounts.models import Membership, Vendor
+from .serializers import CartSerializer, CartItemSerializer, CartItemBatchSerializer, prefetch_cart_items
+from accounts.services.has_role import has_vendor_wide_access
+from accounts.mixins import VendorResolverMixin
+from .guest_store import GuestCartStore, uses_guest_store
+from .services import set_cart_lines
 from .utilis import get_session_key
-from services.caching import caching
+from services.caching import caching, get_principal_scope
+from services.pagination import PageOrKeysetPagination
 
-class CartViewSet(viewsets.ModelViewSet):
+class GuestCartMixin(VendorResolverMixin):
+    # Serves anonymous callers from the Redis guest cart store when GUEST_CART_STORAGE is "redis".
+    # Responses have the same shape as the database path, only the storage differs.
+
+    def uses_guest_store(self):
+        return not getattr(self, "swagger_fake_view", False) and uses_guest_store(self.request)
+
+    def get_guest_store(self, create=False):
+        session_key = get_session_key(self.request, create=create)
+        if session_key is None:
+            return None
+        return GuestCartStore(self.get_vendor(), session_key)
+
+    def get_guest_cart(self):
+        store = self.get_guest_store()
+        return store.load() if store else None
+
+
+class CartViewSet(GuestCartMixin, viewsets.ModelViewSet):
     serializer_class = CartSerializer
+    pagination_class = PageOrKeysetPagination
 
     def get_queryset(self):
         if getattr(self, "swagger_fake_view", False):
             return Cart.objects.none()
 
+        # Items, products and categories of the whole page come from one extra query
+        return prefetch_cart_items(self.get_cart_queryset())
+
+    def get_cart_queryset(self):
         request = self.request
         user = request.user
         vendor_slug = self.kwargs.get("vendor_slug")
 
         # Admin / vendor roles
         if user.is_authenticated:
-            membership = Membership.objects.filter(
-                user=user,
-                vendor__slug=vendor_slug,
-            ).first()
-
-            if user.is_staff or (
-                membership and membership.role in [
-                    "platform_admin",
-                    "vendor_admin",
-                    "platform_agent",
-                    "vendor_agent",
-                ]
-            ):
+            if has_vendor_wide_access(request, vendor_slug):
                 return Cart.objects.filter(vendor__slug=vendor_slug)
 
             return Cart.objects.filter(
@@ -48,16 +65,59 @@ class CartViewSet(viewsets.ModelViewSet):
             is_active=True
         )
 
+    def get_guest_object(self):
+        cart = self.get_guest_cart()
+        if cart is None or str(cart.pk) != str(self.kwargs.get("pk")):
+            raise Http404("No Cart matches the given query.")
+        return cart
+
     def list(self, request, *args, **kwargs):
-        # cache cart listings per vendor for admin roles
-        return caching(self, request, "cart", *args, **kwargs)
+        if self.uses_guest_store():
+            # A guest has at most one cart per vendor, so this is always a single page
+            carts = [cart for cart in [self.get_guest_cart()] if cart is not None]
+            payload = {}
+            if self.paginator.should_count(request):
+                payload["count"] = len(carts)
+            payload.update(next=None, previous=None, results=self.get_serializer(carts, many=True).data)
+            return Response(payload)
+
+        # cache cart listings vendor-wide for admin roles, per user/session otherwise
+        vendor_wide = has_vendor_wide_access(request, self.kwargs.get("vendor_slug"))
+        scope = get_principal_scope(request, vendor_wide)
+        return caching(self, request, "cart", *args, scope=scope, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        if self.uses_guest_store():
+            return Response(self.get_serializer(self.get_guest_object()).data)
+        return super().retrieve(request, *args, **kwargs)
+
+    def create(self, request, *args, **kwargs):
+        if self.uses_guest_store():
+            self.get_serializer(data=request.data).is_valid(raise_exception=True)
+            cart = self.get_guest_store(create=True).create()
+            return Response(self.get_serializer(cart).data, status=status.HTTP_201_CREATED)
+        return super().create(request, *args, **kwargs)
+
+    def update(self, request, *args, **kwargs):
+        if self.uses_guest_store():
+            # every cart field is read-only, so an update only validates and echoes the cart
+            cart = self.get_guest_object()
+            serializer = self.get_serializer(cart, data=request.data, partial=kwargs.get("partial", False))
+            serializer.is_valid(raise_exception=True)
+            return Response(self.get_serializer(cart).data)
+        return super().update(request, *args, **kwargs)
+
+    def destroy(self, request, *args, **kwargs):
+        if self.uses_guest_store():
+            self.get_guest_object()
+            self.get_guest_store().clear()
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        return super().destroy(request, *args, **kwargs)
 
     def perform_create(self, serializer):
         request = self.request
         user = request.user
-        vendor_slug = self.kwargs.get("vendor_slug")
-
-        vendor = get_object_or_404(Vendor, slug=vendor_slug)
+        vendor = self.get_vendor()
 
         if user.is_authenticated:
             serializer.save(
@@ -72,7 +132,7 @@ class CartViewSet(viewsets.ModelViewSet):
             )
 
 
-class CartItemViewSet(viewsets.ModelViewSet):
+class CartItemViewSet(GuestCartMixin, viewsets.ModelViewSet):
     serializer_class = CartItemSerializer
 
     def get_queryset(self):
@@ -90,7 +150,7 @@ class CartItemViewSet(viewsets.ModelViewSet):
             ).select_related(
                 "product",
                 "cart",
-                "product__vendor"
+                "product__category"
             )
 
         # guest user
@@ -102,18 +162,82 @@ class CartItemViewSet(viewsets.ModelViewSet):
         ).select_related(
             "product",
             "cart",
-            "product__vendor"
+            "product__category"
         )
     
-    def perfom_create(self, serializer):
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if getattr(self, "swagger_fake_view", False) or not self.kwargs.get("vendor_slug"):
+            return context
+        context["vendor"] = self.get_vendor()
+        return context
+
+    def get_guest_object(self):
+        cart = self.get_guest_cart()
+        for item in cart.guest_items if cart else []:
+            if str(item.pk) == str(self.kwargs.get("pk")):
+                return item
+        raise Http404("No CartItem matches the given query.")
+
+    def list(self, request, *args, **kwargs):
+        if self.uses_guest_store():
+            cart = self.get_guest_cart()
+            page = self.paginate_queryset(cart.guest_items if cart else [])
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return super().list(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        if self.uses_guest_store():
+            return Response(self.get_serializer(self.get_guest_object()).data)
+        return super().retrieve(request, *args, **kwargs)
+
+    def create(self, request, *args, **kwargs):
+        if self.uses_guest_store():
+            serializer = self.get_serializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            store = self.get_guest_store(create=True)
+            item = store.add_item(serializer.validated_data["product"], serializer.validated_data.get("quantity", 1))
+            return Response(self.get_serializer(item).data, status=status.HTTP_201_CREATED)
+        return super().create(request, *args, **kwargs)
+
+    def update(self, request, *args, **kwargs):
+        if self.uses_guest_store():
+            item = self.get_guest_object()
+            serializer = self.get_serializer(item, data=request.data, partial=kwargs.get("partial", False))
+            serializer.is_valid(raise_exception=True)
+            quantity = serializer.validated_data.get("quantity", item.quantity)
+            item = self.get_guest_store().set_quantity(item, quantity)
+            return Response(self.get_serializer(item).data)
+        return super().update(request, *args, **kwargs)
+
+    def destroy(self, request, *args, **kwargs):
+        if self.uses_guest_store():
+            item = self.get_guest_object()
+            self.get_guest_store().remove_item(item)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        return super().destroy(request, *args, **kwargs)
+
+    @action(detail=False, methods=["post"], url_path="batch")
+    def batch(self, request, *args, **kwargs):
+        # Sets many lines in one request, e.g. a reorder or a bundle: [{"product": 1, "quantity": 2}, ...]
+        # A quantity of 0 removes the product. Answers with the whole cart.
+        data = {"items": request.data} if isinstance(request.data, list) else request.data
+        serializer = CartItemBatchSerializer(data=data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        lines = serializer.validated_data["items"]
+
+        if self.uses_guest_store():
+            cart = self.get_guest_store(create=True).set_lines(lines)
+        elif request.user.is_authenticated:
+            cart = set_cart_lines(self.get_vendor(), lines, user=request.user)
+        else:
+            cart = set_cart_lines(self.get_vendor(), lines, session_key=get_session_key(request))
+        return Response(CartSerializer(cart, context=self.get_serializer_context()).data)
+
+    def perform_create(self, serializer):
         request = self.request
         user = request.user
-        vendor_slug = self.kwargs.get("vendor_slug")
-
-        vendor = get_object_or_404(
-            Vendor,
-            slug=vendor_slug
-        )
+        vendor = self.get_vendor()
 
         if user.is_authenticated:
             cart, _ = Cart.objects.get_or_create(
@@ -129,7 +253,7 @@ class CartItemViewSet(viewsets.ModelViewSet):
                 is_active=True
             )
 
-        product = serializer.validate_data["product"]
+        product = serializer.validated_data["product"]
 
         item, created = CartItem.objects.get_or_create(
             cart=cart,
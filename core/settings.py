@@ -42,6 +42,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'drf_yasg',
     'django_redis',
@@ -145,6 +146,27 @@ STATIC_URL = 'static/'
 
 STATIC_ROOT = BASE_DIR / "staticfiles"
 
+# Catalog snapshots are written at runtime, so they get their own storage instead of STATIC_ROOT.
+# The snapshots/ route serves this directory; set CATALOG_SNAPSHOT_URL to a CDN pulling from it
+CATALOG_SNAPSHOT_ROOT = os.getenv('CATALOG_SNAPSHOT_ROOT', str(BASE_DIR / "snapshots"))
+CATALOG_SNAPSHOT_URL = os.getenv('CATALOG_SNAPSHOT_URL', '/snapshots/')
+
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+    },
+    "catalog_snapshots": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+        "OPTIONS": {
+            "location": CATALOG_SNAPSHOT_ROOT,
+            "base_url": CATALOG_SNAPSHOT_URL,
+        },
+    },
+}
+
 REST_FRAMEWORK ={
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
@@ -174,6 +196,23 @@ CACHES = {
     }
 }
 
+# Per-worker in-memory LRU kept in front of Redis for hot catalog reads
+LOCAL_CACHE_MAX_ENTRIES = int(os.getenv('LOCAL_CACHE_MAX_ENTRIES', 1024))
+LOCAL_CACHE_TIMEOUT = int(os.getenv('LOCAL_CACHE_TIMEOUT', 5))
+
+# Bearer token Prometheus sends to scrape /metrics/, staff sessions work without it
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# STORAGES alias the static catalog snapshots are written to, e.g. an S3 bucket behind a CDN
+CATALOG_SNAPSHOT_STORAGE = os.getenv('CATALOG_SNAPSHOT_STORAGE', 'catalog_snapshots')
+
+# Anonymous carts live in Redis hashes ("redis") or in the Cart tables ("database")
+GUEST_CART_STORAGE = os.getenv('GUEST_CART_STORAGE', 'redis')
+# A guest's first cart write still creates a session, and with the default engine a session row.
+# Set this to django.contrib.sessions.backends.cache to keep guests out of the database entirely
+SESSION_ENGINE = os.getenv('SESSION_ENGINE', 'django.contrib.sessions.backends.db')
+GUEST_CART_TTL = int(os.getenv('GUEST_CART_TTL', 60 * 60 * 24 * 7))
+
 CELERY_BROKER_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/1')
 CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND', 'redis://localhost:6379/1')
 CELERY_ACCEPT_CONTENT = ['application/json']
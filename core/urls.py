@@ -19,6 +19,8 @@ from django.urls import path, include, re_path
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 from rest_framework.permissions import AllowAny
+from services.views import metrics
+from products.views import catalog_snapshot
 
 schema_view = get_schema_view(
    openapi.Info(
@@ -36,6 +38,8 @@ urlpatterns = [
     path('api/cart/', include('cart.urls')),
     path('api/', include('products.urls')),
     path('api/payments/', include('payments.urls')),
+    path('metrics/', metrics, name='metrics'),
+    path('snapshots/<path:path>', catalog_snapshot, name='catalog-snapshot'),
     re_path(r'^swagger(?P<format>\.json|\.yaml)$', schema_view.without_ui(cache_timeout=0), name='schema-json'),
     re_path(r'^swagger/$', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     re_path(r'^redoc/$', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
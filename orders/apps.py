@@ -2,6 +2,7 @@ from django.apps import AppConfig
 
 
 class OrdersConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
     name = 'orders'
     
     def ready(self):
@@ -32,6 +32,9 @@ class Order(models.Model):
     class Meta:
         indexes = [
             models.Index(fields=["vendor", "status"]),
+            # Keyset pagination of vendor-wide and per-user order listings
+            models.Index(fields=["vendor", "created_at", "id"], name="order_vendor_created_idx"),
+            models.Index(fields=["vendor", "user", "created_at", "id"], name="order_vendor_user_created_idx"),
         ]
 
         constraints = [
@@ -59,7 +62,7 @@ class OrderItem(models.Model):
     price = models.DecimalField(max_digits=12, decimal_places=2)
     
     def save(self, *args, **kwargs):
-        self.total = self.product.price * self.quantity
+        self.total = self.product.effective_price * self.quantity
         super().save(*args, **kwargs)
 
     def __str__(self):
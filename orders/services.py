@@ -13,11 +13,12 @@ def create_order_from_cart(cart):
             order=order,
             product=item.product,
             quantity=item.quantity,
-            price=item.product.price,
+            price=item.product.effective_price,
             total=item.total
         )
 
     cart.is_active = False
-    cart.save()
+    # total is maintained in SQL by the item signals, don't write back a stale in-memory copy
+    cart.save(update_fields=['is_active', 'updated_at'])
 
     return order
\ No newline at end of file
@@ -1,7 +1,7 @@
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from .models import Order
-from services.caching import clear_vendor_cache
+from services.caching import clear_vendor_cache_on_commit
 import logging
 
 logger = logging.getLogger(__name__)
@@ -13,7 +13,7 @@ def invalidate_order_cache(sender, instance, **kwargs):
         vendor = getattr(instance, 'vendor', None)
         if vendor is None:
             return
-        clear_vendor_cache(vendor.slug, 'order')
+        clear_vendor_cache_on_commit(vendor.slug, 'order')
         logger.info(f"Invalidated order cache for vendor={vendor.slug}")
     except Exception as e:
         logger.warning(f"Failed to invalidate order cache: {e}")
@@ -1,18 +1,24 @@
 from rest_framework import viewsets, status
+from django.db import IntegrityError, transaction
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from .models import Order
 from .serializers import OrderSerializer
-from services.caching import caching
-from accounts.models import Membership
+from services.caching import caching, get_principal_scope
+from services.pagination import PageOrKeysetPagination
+from accounts.services.has_role import has_vendor_wide_access
 from cart.utilis import get_session_key
 from cart.models import Cart
+from cart.guest_store import GuestCartStore, uses_guest_store
+from accounts.services.vendor_resolver import resolve_vendor
 from .services import create_order_from_cart
 from rest_framework.response import Response
 
 
 # Create your views here.
 class OrderViewSet(viewsets.ReadOnlyModelViewSet):
-    serilaizer_class = OrderSerializer
+    serializer_class = OrderSerializer
+    pagination_class = PageOrKeysetPagination
 
     def get_queryset(self):
         if getattr(self, "swagger_fake_view", False):
@@ -23,17 +29,7 @@ class OrderViewSet(viewsets.ReadOnlyModelViewSet):
         vendor_slug = self.kwargs.get("vendor_slug")
 
         if user.is_authenticated:
-            membership = Membership.objects.filter(
-                user=user,
-                vendor__slug = vendor_slug,
-                role__in =[
-                    "platform_admin",
-                    "vendor_admin",
-                    "platform_agent",
-                    "vendor_agent",
-                ],
-            ).exists()
-            if user.is_staff or membership:
+            if has_vendor_wide_access(request, vendor_slug):
                 return Order.objects.filter(vendor__slug=vendor_slug)
             return Order.objects.filter(
                 user=user,
@@ -46,25 +42,55 @@ class OrderViewSet(viewsets.ReadOnlyModelViewSet):
         )
     
     def list(self, request, *args, **kwargs):
-        return caching(self, request, "order", *args, **kwargs)
+        # cache order listings vendor-wide for admin roles, per user/session otherwise
+        vendor_wide = has_vendor_wide_access(request, self.kwargs.get("vendor_slug"))
+        scope = get_principal_scope(request, vendor_wide)
+        return caching(self, request, "order", *args, scope=scope, **kwargs)
     
-class CheckoutViewSet(viewsets.viewset):
+class CheckoutViewSet(viewsets.ViewSet):
 
     def create(self, request, vendor_slug=None):
         user = request.user
         session_key = get_session_key(request)
+        owner = {"user": user} if user.is_authenticated else {"user": None, "session_key": session_key}
 
-        cart = get_object_or_404(
-            Cart,
-            vendor__slug = vendor_slug,
-            is_active=True,
-            user=user if user.is_authenticated else None,
-            session_key=session_key if not user.is_authenticated else None
-        )
+        # one pending order per owner and vendor, answer with it instead of failing on the constraint
+        pending = Order.objects.filter(vendor__slug=vendor_slug, status="pending", **owner).first()
+        if pending is not None:
+            return self.pending_order_response(pending)
 
-        order = create_order_from_cart(cart)
+        try:
+            with transaction.atomic():
+                if uses_guest_store(request):
+                    # guest carts only reach the database now, as the cart the order is made from.
+                    # persist() drops the Redis cart on commit, so only once the order exists too
+                    vendor = resolve_vendor(request, vendor_slug)
+                    cart = GuestCartStore(vendor, session_key).persist() if vendor else None
+                    if cart is None:
+                        raise Http404("No Cart matches the given query.")
+                else:
+                    cart = get_object_or_404(
+                        Cart,
+                        vendor__slug = vendor_slug,
+                        is_active=True,
+                        user=user if user.is_authenticated else None,
+                        session_key=session_key if not user.is_authenticated else None
+                    )
+                order = create_order_from_cart(cart)
+        except IntegrityError:
+            # a concurrent checkout created the pending order first
+            pending = Order.objects.filter(vendor__slug=vendor_slug, status="pending", **owner).first()
+            if pending is None:
+                raise
+            return self.pending_order_response(pending)
 
         return Response(
             {"order_id" : order.id},
             status=status.HTTP_201_CREATED
-        )
\ No newline at end of file
+        )
+
+    def pending_order_response(self, order):
+        return Response(
+            {"detail": "A pending order already exists for this vendor.", "order_id": order.id},
+            status=status.HTTP_409_CONFLICT
+        )
@@ -0,0 +1,88 @@
+import logging
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers
+from services.caching import clear_vendor_cache_on_commit
+from .models import Product
+from .serializers import ProductBulkUpdateSerializer
+
+logger = logging.getLogger(__name__)
+
+MAX_BULK_UPDATE_ROWS = 5000
+BULK_UPDATE_CHUNK_SIZE = 500
+
+UPDATABLE_FIELDS = ['price', 'discount', 'quantity']
+
+
+class BulkUpdateError(Exception):
+    """Raised with a per-row error report when nothing could be applied"""
+
+    def __init__(self, errors):
+        super().__init__('Bulk update rejected')
+        self.errors = errors
+
+
+def validate_rows(rows):
+    """Run every row through ProductBulkUpdateSerializer, collecting errors by index"""
+    validator = ProductBulkUpdateSerializer(partial=True)
+    updates, errors = [], []
+    for index, row in enumerate(rows):
+        try:
+            updates.append(validator.run_validation(row))
+        except serializers.ValidationError as e:
+            errors.append({'index': index, 'id': row.get('id') if isinstance(row, dict) else None, 'errors': e.detail})
+    return updates, errors
+
+
+def bulk_update_products(vendor, rows):
+    """
+    Apply `[{id, price, discount, quantity}]` to a vendor's products in one transaction.
+
+    All rows are validated first and nothing is written if any of them is
+    invalid or names a product of another vendor. Rows that don't change
+    anything are skipped, the rest are written with bulk_update in chunks
+    and the vendor's caches are invalidated once on commit.
+    """
+    updates, errors = validate_rows(rows)
+    if errors:
+        raise BulkUpdateError(errors)
+
+    ids = {update['id'] for update in updates}
+    with transaction.atomic():
+        products = Product.objects.select_for_update().filter(vendor=vendor, pk__in=ids).order_by('pk').only(
+            'pk', 'vendor_id', *UPDATABLE_FIELDS, 'effective_price', 'updated_at'
+        )
+        products = {product.pk: product for product in products}
+
+        missing = [
+            {'index': index, 'id': update['id'], 'errors': {'id': ['Product not found for this vendor.']}}
+            for index, update in enumerate(updates) if update['id'] not in products
+        ]
+        if missing:
+            raise BulkUpdateError(missing)
+
+        changed = {}
+        now = timezone.now()
+        for update in updates:
+            product = products[update['id']]
+            for field in UPDATABLE_FIELDS:
+                if field in update and getattr(product, field) != update[field]:
+                    setattr(product, field, update[field])
+                    product.updated_at = now
+                    changed[product.pk] = product
+
+        if changed:
+            # bulk_update skips save(), auto_now and signals, so derived columns are set here
+            for product in changed.values():
+                product.update_effective_price()
+            Product.objects.bulk_update(
+                changed.values(), UPDATABLE_FIELDS + ['effective_price', 'updated_at'],
+                batch_size=BULK_UPDATE_CHUNK_SIZE
+            )
+            clear_vendor_cache_on_commit(vendor.slug, 'product')
+
+    logger.info(f"Bulk updated {len(changed)} of {len(products)} products for vendor={vendor.slug}")
+    return {
+        'updated': sorted(changed),
+        'unchanged': sorted(pk for pk in products if pk not in changed),
+    }
@@ -0,0 +1,114 @@
+from decimal import Decimal, InvalidOperation
+from django.core.cache import cache
+from django.db.models import Count, Q
+from rest_framework.exceptions import ValidationError
+from services.caching import DEFAULT_CACHE_TIMEOUT, get_versioned_key
+from .models import Category, Product
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds are exclusive, None means no upper bound
+PRICE_RANGES = [
+    (Decimal('0'), Decimal('50')),
+    (Decimal('50'), Decimal('100')),
+    (Decimal('100'), Decimal('500')),
+    (Decimal('500'), None),
+]
+
+TRUE_VALUES = ('1', 'true', 'yes')
+
+
+def parse_price(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        price = Decimal(value)
+    except InvalidOperation:
+        raise ValidationError({name: 'A valid number is required.'})
+    if not price.is_finite() or price < 0:
+        raise ValidationError({name: 'A valid number is required.'})
+    return price
+
+
+def filter_products(queryset, params):
+    """Apply the price range, in_stock, discounted and category facets from the query params"""
+    category_id = params.get('category')
+    if category_id:
+        queryset = queryset.filter(category_id=category_id)
+
+    min_price = parse_price(params, 'min_price')
+    if min_price is not None:
+        queryset = queryset.filter(price__gte=min_price)
+    max_price = parse_price(params, 'max_price')
+    if max_price is not None:
+        queryset = queryset.filter(price__lte=max_price)
+
+    if params.get('in_stock', '').lower() in TRUE_VALUES:
+        queryset = queryset.filter(quantity__gt=0)
+    if params.get('discounted', '').lower() in TRUE_VALUES:
+        queryset = queryset.filter(discount__gt=0)
+    return queryset
+
+
+def _price_range_q(low, high):
+    q = Q(price__gte=low)
+    if high is not None:
+        q &= Q(price__lt=high)
+    return q
+
+
+def compute_product_facets(vendor_slug):
+    """Count a vendor's whole catalog per facet: one aggregate plus one GROUP BY category"""
+    products = Product.objects.filter(vendor__slug=vendor_slug)
+    aggregates = {
+        'in_stock': Count('pk', filter=Q(quantity__gt=0)),
+        'discounted': Count('pk', filter=Q(discount__gt=0)),
+    }
+    for index, (low, high) in enumerate(PRICE_RANGES):
+        aggregates[f'price_{index}'] = Count('pk', filter=_price_range_q(low, high))
+    counts = products.aggregate(**aggregates)
+
+    categories = Category.objects.filter(vendor__slug=vendor_slug).annotate(
+        count=Count('products')
+    ).order_by('name').values('id', 'name', 'count')
+
+    return {
+        'categories': list(categories),
+        'price_ranges': [
+            {
+                'min': str(low),
+                'max': str(high) if high is not None else None,
+                'count': counts[f'price_{index}'],
+            }
+            for index, (low, high) in enumerate(PRICE_RANGES)
+        ],
+        'in_stock': counts['in_stock'],
+        'discounted': counts['discounted'],
+    }
+
+
+def get_product_facets(vendor_slug):
+    """
+    Return a vendor's facet counts, cached until its products change.
+
+    The entry lives in the vendor's product generation, so the same signals
+    that invalidate the product lists (product and category saves) also
+    invalidate the counts.
+    """
+    try:
+        facets_key = get_versioned_key('product', vendor_slug, 'facets', local=True)
+        facets = cache.get(facets_key)
+        if facets is not None:
+            return facets
+    except Exception as e:
+        logger.warning(f"Facet cache retrieval failed: {str(e)}")
+        return compute_product_facets(vendor_slug)
+
+    facets = compute_product_facets(vendor_slug)
+    try:
+        cache.set(facets_key, facets, DEFAULT_CACHE_TIMEOUT)
+    except Exception as e:
+        logger.warning(f"Facet cache storage failed: {str(e)}")
+    return facets
@@ -0,0 +1,95 @@
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+from services.storage import replace_file
+
+logger = logging.getLogger(__name__)
+
+# Widths generated for every photo, narrower than the original only
+VARIANT_WIDTHS = (160, 320, 640, 1024)
+
+# Pillow format name, file extension and encoder options per output type
+VARIANT_FORMATS = {
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+VARIANT_DIR = 'product_photos/variants'
+
+# Resizing and encoding release the GIL, so threads overlap well inside one worker
+VARIANT_THREADS = 4
+
+
+def get_variant_name(photo_name, width, extension):
+    stem = posixpath.splitext(posixpath.basename(photo_name))[0]
+    return f'{VARIANT_DIR}/{stem}-{width}w.{extension}'
+
+
+def load_photo(photo_name, storage=default_storage):
+    """Open an uploaded photo upright and without metadata, ready to resize"""
+    with storage.open(photo_name, 'rb') as photo_file:
+        image = Image.open(photo_file)
+        image.load()
+    # Apply the EXIF rotation before the EXIF block is dropped
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+    # Only pixels are kept: no EXIF, GPS, ICC or comments end up in the variants
+    image.info = {}
+    return image
+
+
+def encode_variant(image, width, fmt):
+    pil_format, _, options = VARIANT_FORMATS[fmt]
+    resized = image.copy()
+    resized.thumbnail((width, width * 10), Image.Resampling.LANCZOS)
+    if pil_format == 'JPEG' and resized.mode != 'RGB':
+        resized = resized.convert('RGB')
+    buffer = BytesIO()
+    resized.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def generate_variants(photo_name, storage=default_storage):
+    """
+    Write resized WebP and JPEG copies of a photo and return their storage names.
+
+    The result maps format to {width: name}, e.g. {'webp': {'320': '...'}}.
+    Widths wider than the original are skipped, and the original width is
+    always included so small uploads still get a variant.
+    """
+    image = load_photo(photo_name, storage)
+    widths = sorted({width for width in VARIANT_WIDTHS if width < image.width} | {min(image.width, VARIANT_WIDTHS[-1])})
+    jobs = [(width, fmt) for width in widths for fmt in VARIANT_FORMATS]
+
+    with ThreadPoolExecutor(max_workers=VARIANT_THREADS) as pool:
+        encoded = list(pool.map(lambda job: encode_variant(image, *job), jobs))
+
+    variants = {fmt: {} for fmt in VARIANT_FORMATS}
+    for (width, fmt), content in zip(jobs, encoded):
+        name = get_variant_name(photo_name, width, VARIANT_FORMATS[fmt][1])
+        # Regenerated variants replace the old files in place, their URLs never 404 in between
+        variants[fmt][str(width)] = replace_file(storage, name, content)
+    return variants
+
+
+def delete_variants(variants, storage=default_storage):
+    for names in (variants or {}).values():
+        for name in names.values():
+            try:
+                storage.delete(name)
+            except Exception as e:
+                logger.warning(f"Failed to delete image variant {name}: {e}")
+
+
+def build_srcset(variants, url_for):
+    """Turn stored variants into {'webp': 'url 160w, url 320w', ...} for <source srcset>"""
+    return {
+        fmt: ', '.join(
+            f'{url_for(name)} {width}w' for width, name in sorted(names.items(), key=lambda item: int(item[0]))
+        )
+        for fmt, names in (variants or {}).items() if names
+    }
@@ -0,0 +1,157 @@
+import codecs
+import csv
+import json
+import logging
+from itertools import islice
+from django.db import transaction
+from django.db.models import Q
+from rest_framework import serializers
+from services.caching import clear_vendor_cache_on_commit, coalesce_invalidations
+from .models import Category, Product
+from .search import update_search_vector
+from .serializers import ProductImportSerializer
+
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = 1000
+
+CSV_CONTENT_TYPES = ('text/csv', 'application/csv')
+JSONL_CONTENT_TYPES = ('application/x-ndjson', 'application/jsonl', 'application/x-jsonlines')
+
+# Columns rewritten on conflict, created_at keeps the original insert time
+UPSERT_FIELDS = ['name', 'description', 'price', 'category', 'discount', 'quantity', 'effective_price', 'updated_at']
+
+
+class ImportFormatError(Exception):
+    def __init__(self, message, report=None):
+        super().__init__(message)
+        # What earlier batches already wrote, when the file broke part way through
+        self.report = report
+
+
+def detect_format(content_type, filename=''):
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if content_type in CSV_CONTENT_TYPES or filename.endswith('.csv'):
+        return 'csv'
+    if content_type in JSONL_CONTENT_TYPES or filename.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    raise ImportFormatError('Send text/csv or application/x-ndjson, or upload a .csv or .jsonl file')
+
+
+def read_rows(source, fmt):
+    """
+    Yield (row number, row) pairs from an iterable of byte lines.
+
+    Lines are decoded as they arrive, so the upload is never held in memory
+    as a whole. Rows that can't be parsed are yielded as ValueErrors.
+    """
+    lines = codecs.iterdecode(source, 'utf-8-sig')
+    if fmt == 'csv':
+        for number, row in enumerate(csv.DictReader(lines), start=1):
+            # Empty cells mean "use the default", like a missing JSON key
+            yield number, {key: value for key, value in row.items() if key and value not in ('', None)}
+        return
+
+    number = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = ValueError('Invalid JSON')
+        if not isinstance(row, (dict, ValueError)):
+            row = ValueError('Each line must be a JSON object')
+        yield number, row
+
+
+def resolve_categories(vendor, rows):
+    """Look up every category a batch refers to in one query, keyed by id and by name"""
+    refs = {
+        str(row['category']).strip() for _, row in rows
+        if isinstance(row, dict) and row.get('category') is not None
+    }
+    ids = [int(ref) for ref in refs if ref.isdigit()]
+    categories = {}
+    for category in Category.objects.filter(Q(name__in=refs) | Q(pk__in=ids), vendor=vendor):
+        categories.setdefault(str(category.pk), category)
+        # Names win over ids, so a category called "2024" still resolves by name
+        categories[category.name] = category
+    return categories
+
+
+def import_batch(vendor, rows, report):
+    categories = resolve_categories(vendor, rows)
+    validator = ProductImportSerializer(context={'vendor': vendor, 'categories': categories})
+
+    products = {}
+    for number, row in rows:
+        if isinstance(row, ValueError):
+            report['errors'].append({'row': number, 'errors': {'non_field_errors': [str(row)]}})
+            continue
+        try:
+            data = validator.run_validation(row)
+        except serializers.ValidationError as e:
+            report['errors'].append({'row': number, 'errors': e.detail})
+            continue
+        # A SKU repeated in one batch keeps its last row, ON CONFLICT can't touch a row twice
+        product = Product(vendor=vendor, **data)
+        # bulk_create skips save(), which is what normally keeps this in sync
+        product.update_effective_price()
+        products[data['sku']] = product
+
+    if not products:
+        return
+
+    with transaction.atomic():
+        existing = set(
+            Product.objects.filter(vendor=vendor, sku__in=products).values_list('sku', flat=True)
+        )
+        Product.objects.bulk_create(
+            products.values(),
+            update_conflicts=True,
+            unique_fields=['vendor', 'sku'],
+            update_fields=UPSERT_FIELDS,
+        )
+        # bulk_create sends no post_save, so refresh the batch's search vectors here
+        update_search_vector(Product.objects.filter(vendor=vendor, sku__in=products))
+
+    report['updated'] += len(existing)
+    report['created'] += len(products) - len(existing)
+
+
+def import_products(vendor, source, fmt, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Upsert a vendor's products by SKU from CSV or JSONL byte lines.
+
+    Rows are validated and written in batches of `batch_size`, each batch
+    in its own transaction with a single category query and a single
+    INSERT ... ON CONFLICT UPDATE. Bad rows are reported by number and
+    skipped, the rest of the file is still imported. The vendor's caches
+    are invalidated once, after the last batch. A file that can't be read
+    part way through raises ImportFormatError carrying the partial report,
+    the batches before it stay committed and are still invalidated.
+    """
+    report = {'rows': 0, 'created': 0, 'updated': 0, 'errors': []}
+    rows = read_rows(source, fmt)
+    try:
+        with coalesce_invalidations():
+            try:
+                while True:
+                    batch = list(islice(rows, batch_size))
+                    if not batch:
+                        break
+                    report['rows'] += len(batch)
+                    import_batch(vendor, batch, report)
+            finally:
+                if report['created'] or report['updated']:
+                    clear_vendor_cache_on_commit(vendor.slug, 'product')
+    except (csv.Error, UnicodeDecodeError) as e:
+        raise ImportFormatError(f'Could not read the file after row {report["rows"]}: {e}', report)
+
+    logger.info(
+        f"Imported products for vendor={vendor.slug}: {report['created']} created, "
+        f"{report['updated']} updated, {len(report['errors'])} rejected"
+    )
+    return report
@@ -0,0 +1,79 @@
+import gzip
+import pickle
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from accounts.models import Vendor
+from products.services import get_default_host
+from products.views import CategoryViewSet, ProductViewSet
+from services.caching import _make_entry, payload_response, render_payload
+
+VIEWSETS = {
+    "product": (ProductViewSet, "products"),
+    "category": (CategoryViewSet, "categories"),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare cache hits that store pickled response.data against hits that store "
+        "pre-rendered JSON bytes, for one page of a vendor's list"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("vendor_slug")
+        parser.add_argument("--resource", choices=sorted(VIEWSETS), default="product")
+        parser.add_argument("--iterations", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        slug = options["vendor_slug"]
+        if not Vendor.objects.filter(slug=slug).exists():
+            raise CommandError(f"Vendor '{slug}' does not exist")
+
+        viewset_class, path = VIEWSETS[options["resource"]]
+        # Pagination links need a host that passes ALLOWED_HOSTS
+        host = get_default_host()
+        factory = APIRequestFactory(HTTP_HOST=host)
+        request = Request(factory.get(f"/api/vendors/{slug}/{path}/"))
+        request.accepted_renderer = JSONRenderer()
+        request.accepted_media_type = JSONRenderer.media_type
+
+        # Build page 1 the same way ModelViewSet.list does, without going through the cache
+        viewset = viewset_class(request=request, kwargs={"vendor_slug": slug}, format_kwarg=None, action="list")
+        page = viewset.paginate_queryset(viewset.filter_queryset(viewset.get_queryset()))
+        response = viewset.get_paginated_response(viewset.get_serializer(page, many=True).data)
+
+        iterations = options["iterations"]
+        data_blob = pickle.dumps(_make_entry(response.data, 0, 0), pickle.HIGHEST_PROTOCOL)
+        payload_blob = pickle.dumps(_make_entry(render_payload(request, response), 0, 0), pickle.HIGHEST_PROTOCOL)
+        gzip_request = Request(factory.get("/", HTTP_ACCEPT_ENCODING="gzip"))
+
+        def data_hit():
+            JSONRenderer().render(pickle.loads(data_blob)["data"])
+
+        def payload_hit():
+            payload_response(request, pickle.loads(payload_blob)["data"])
+
+        def payload_gzip_hit():
+            payload_response(gzip_request, pickle.loads(payload_blob)["data"])
+
+        rows = [
+            ("pickled response.data", len(data_blob), data_hit),
+            ("rendered bytes, identity client", len(payload_blob), payload_hit),
+            ("rendered bytes, gzip client", len(payload_blob), payload_gzip_hit),
+        ]
+        self.stdout.write(f"{options['resource']} list for '{slug}', {len(page or [])} rows, {iterations} hits each")
+        for label, size, hit in rows:
+            started = time.perf_counter()
+            for _ in range(iterations):
+                hit()
+            per_hit = (time.perf_counter() - started) / iterations * 1e6
+            self.stdout.write(f"  {label:<34} {size:>9} bytes/hit {per_hit:>10.1f} us/hit")
+
+        payload = pickle.loads(payload_blob)["data"]
+        if payload["encoding"]:
+            self.stdout.write(f"  uncompressed JSON body: {len(gzip.decompress(payload['body']))} bytes")
@@ -0,0 +1,64 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.http import QueryDict
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from accounts.models import Vendor
+from products.models import Product
+from products.serializers import ProductSerializer, ProductValuesSerializer, parse_fieldset
+from products.services import get_default_host
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare rows/second of ProductSerializer over model instances against the "
+        "values()-based list serializer, for every product of a vendor"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("vendor_slug")
+        parser.add_argument("--repeat", type=int, default=3, help="Runs per variant, the best one is reported")
+        parser.add_argument(
+            "--omit", default="description,category_detail",
+            help="Fields dropped in the sparse variants, as in ?omit="
+        )
+
+    def handle(self, *args, **options):
+        slug = options["vendor_slug"]
+        if not Vendor.objects.filter(slug=slug).exists():
+            raise CommandError(f"Vendor '{slug}' does not exist")
+
+        host = get_default_host()
+        request = Request(APIRequestFactory(HTTP_HOST=host).get(f"/api/vendors/{slug}/products/"))
+        context = {"request": request}
+        sparse = parse_fieldset(QueryDict(f"omit={options['omit']}"), ProductValuesSerializer.COLUMNS)
+
+        products = Product.objects.filter(vendor__slug=slug).order_by("-created_at", "-id")
+        ordering = ("created_at", "effective_price")
+
+        def models(fieldset):
+            queryset = products.select_related("category", "vendor").defer("search_vector")
+            return ProductSerializer(queryset, many=True, context=context, fieldset=fieldset).data
+
+        def values(fieldset):
+            queryset = products.values(*ProductValuesSerializer.get_columns(fieldset, ordering))
+            return ProductValuesSerializer(queryset, context=context, fieldset=fieldset).data
+
+        variants = [
+            ("ProductSerializer, all fields", models, None),
+            (f"ProductSerializer, omit={options['omit']}", models, sparse),
+            ("values() rows, all fields", values, None),
+            (f"values() rows, omit={options['omit']}", values, sparse),
+        ]
+        count = products.count()
+        self.stdout.write(f"product list for '{slug}', {count} rows, best of {options['repeat']} runs (query included)")
+        for label, serialize, fieldset in variants:
+            best = None
+            for _ in range(options["repeat"]):
+                started = time.perf_counter()
+                rows = len(serialize(fieldset))
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            self.stdout.write(f"  {label:<52} {rows / best if best else 0:>12.0f} rows/s {best * 1000:>10.1f} ms")
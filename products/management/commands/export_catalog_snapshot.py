@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.models import Vendor
+from products.services import DEFAULT_WARM_VENDORS, get_most_active_vendors
+from products.snapshots import SNAPSHOT_SHARD_SIZE, export_catalog_snapshot, snapshot_url
+from products.tasks import export_catalog_snapshots
+
+
+class Command(BaseCommand):
+    help = (
+        "Render vendors' categories and products into static, compressed JSON shards plus a "
+        "manifest in the snapshot storage. Later catalog changes re-export them incrementally."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("vendor_slugs", nargs="*", help="Vendors to export, defaults to the most active ones")
+        parser.add_argument("--limit", type=int, default=DEFAULT_WARM_VENDORS, help="Number of active vendors")
+        parser.add_argument("--shard-size", type=int, default=SNAPSHOT_SHARD_SIZE, help="Products per shard")
+        parser.add_argument(
+            "--async", dest="run_async", action="store_true",
+            help="Queue a Celery task for the most active vendors instead",
+        )
+
+    def handle(self, *args, **options):
+        if options["shard_size"] < 1:
+            raise CommandError("--shard-size must be at least 1")
+
+        if options["run_async"] and not options["vendor_slugs"]:
+            result = export_catalog_snapshots.delay(options["limit"], options["shard_size"])
+            self.stdout.write(f"Queued catalog snapshot task {result.id}")
+            return
+
+        slugs = options["vendor_slugs"] or get_most_active_vendors(options["limit"])
+        unknown = set(slugs) - set(Vendor.objects.filter(slug__in=slugs).values_list("slug", flat=True))
+        if unknown:
+            raise CommandError(f"Unknown vendors: {', '.join(sorted(unknown))}")
+
+        started = time.monotonic()
+        for slug in slugs:
+            result = export_catalog_snapshot(slug, options["shard_size"])
+            self.stdout.write(
+                f"{slug:<40} version {result['version']} {result['shards']:>5} shards {result['written']:>5} written "
+                f"{snapshot_url(slug)}"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported {len(slugs)} catalogs in {time.monotonic() - started:.3f}s"
+        ))
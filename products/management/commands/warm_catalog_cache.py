@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.services import DEFAULT_WARM_VENDORS, DEFAULT_WARM_WORKERS, warm_top_vendors
+from products.tasks import warm_catalog_cache
+
+
+class Command(BaseCommand):
+    help = "Pre-populate the product and category list caches of the most active vendors"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=DEFAULT_WARM_VENDORS, help="Number of vendors to warm")
+        parser.add_argument("--workers", type=int, default=DEFAULT_WARM_WORKERS, help="Concurrent vendors")
+        parser.add_argument("--pages", type=int, default=1, help="Pages of each list to warm")
+        parser.add_argument("--host", help="Host used for pagination links, defaults to the first ALLOWED_HOSTS")
+        parser.add_argument("--secure", action="store_true", help="Build https pagination links")
+        parser.add_argument("--async", dest="run_async", action="store_true", help="Queue a Celery task instead")
+
+    def handle(self, *args, **options):
+        if options["run_async"]:
+            result = warm_catalog_cache.delay(options["limit"], options["workers"], options["pages"])
+            self.stdout.write(f"Queued cache warming task {result.id}")
+            return
+
+        started = time.monotonic()
+        results = warm_top_vendors(
+            limit=options["limit"],
+            workers=options["workers"],
+            pages=options["pages"],
+            host=options["host"],
+            secure=options["secure"],
+        )
+        for result in results:
+            if "error" in result:
+                self.stderr.write(f"{result['vendor']:<40} failed: {result['error']}")
+            else:
+                self.stdout.write(f"{result['vendor']:<40} {result['seconds']:>8.3f}s")
+        self.stdout.write(self.style.SUCCESS(
+            f"Warmed {len(results)} vendors in {time.monotonic() - started:.3f}s"
+        ))
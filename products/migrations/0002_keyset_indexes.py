@@ -0,0 +1,18 @@
+# Generated by Django 5.2.11 on 2026-10-18 17:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_alter_membership_user'),
+        ('products', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['vendor', 'created_at', 'id'], name='product_vendor_created_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.11 on 2026-10-18 18:11
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def backfill_effective_price(apps, schema_editor):
+    # Same rounding as products.models.compute_effective_price, in chunks to bound memory
+    Product = apps.get_model('products', 'Product')
+    batch = []
+    for product in Product.objects.only('pk', 'price', 'discount').iterator(chunk_size=2000):
+        price = Decimal(product.price)
+        if product.discount:
+            price = price * (Decimal('1') - Decimal(product.discount) / Decimal('100'))
+        product.effective_price = price.quantize(Decimal('0.01'))
+        batch.append(product)
+        if len(batch) >= 2000:
+            Product.objects.bulk_update(batch, ['effective_price'])
+            batch = []
+    if batch:
+        Product.objects.bulk_update(batch, ['effective_price'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_alter_membership_user'),
+        ('products', '0004_product_sku'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='effective_price',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.RunPython(backfill_effective_price, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['vendor', 'effective_price', 'id'], name='product_vendor_price_idx'),
+        ),
+    ]
@@ -1,6 +1,17 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from decimal import Decimal
 from django.db import models
 from accounts.models import Vendor
 
+
+def compute_effective_price(price, discount):
+    """Sale price after the percentage discount, rounded to cents"""
+    price = Decimal(price)
+    if discount:
+        price = price * (Decimal('1') - Decimal(discount) / Decimal('100'))
+    return price.quantize(Decimal('0.01'))
+
 # Create your models here.
 class Category(models.Model):
     name = models.CharField(max_length=20)
@@ -18,16 +29,71 @@ class Category(models.Model):
         return self.name
 
 class Product(models.Model):
+    # Vendor's own stock keeping unit, the key bulk imports upsert on
+    sku = models.CharField(max_length=64, null=True, blank=True)
     name = models.CharField(max_length=100)
     description = models.TextField(null=False, blank=False)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='products')
     vendor = models.ForeignKey(Vendor, on_delete=models.CASCADE, related_name='products')
     photo = models.ImageField(upload_to='product_photos/', null=True, blank=True)
+    # Resized WebP/JPEG copies of photo as {format: {width: storage name}}, filled by a Celery task
+    photo_variants = models.JSONField(default=dict, blank=True, editable=False)
     discount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, default=0)
     quantity = models.PositiveIntegerField(default=1, null=False, blank=False)
+    # price after discount, stored so listings can sort and carts can sum it in SQL
+    effective_price = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Weighted name + description vector, kept up to date by a post_save signal
+    search_vector = SearchVectorField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of a vendor's catalog
+            models.Index(fields=["vendor", "created_at", "id"], name="product_vendor_created_idx"),
+            # Listings sorted by sale price
+            models.Index(fields=["vendor", "effective_price", "id"], name="product_vendor_price_idx"),
+            # Full-text search, and trigram matching for typos in product names
+            GinIndex(fields=["search_vector"], name="product_search_vector_idx"),
+            GinIndex(fields=["name"], name="product_name_trgm_idx", opclasses=["gin_trgm_ops"]),
+        ]
+        constraints = [
+            # Products without a SKU are left alone, NULLs never conflict
+            models.UniqueConstraint(fields=["vendor", "sku"], name="unique_sku_per_vendor"),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored photo so save() can tell when a new one was uploaded
+        instance._loaded_photo = instance.__dict__.get('photo')
+        return instance
+
+    def photo_changed(self):
+        loaded = getattr(self, '_loaded_photo', None)
+        if 'photo' not in self.__dict__:
+            return False
+        return (self.photo.name or '') != (getattr(loaded, 'name', loaded) or '')
+
+    def update_effective_price(self):
+        self.effective_price = compute_effective_price(self.price, self.discount)
+
+    def save(self, *args, **kwargs):
+        self.update_effective_price()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'price', 'discount'} & set(update_fields):
+            update_fields = kwargs['update_fields'] = {*update_fields, 'effective_price'}
+
+        # Variants of a replaced photo are stale, the post_save signal queues new ones
+        self._photo_replaced = self.photo_changed() and (update_fields is None or 'photo' in update_fields)
+        if self._photo_replaced:
+            self._stale_variants, self.photo_variants = self.photo_variants, {}
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'photo_variants'}
+
+        super().save(*args, **kwargs)
+        self._loaded_photo = self.photo.name
 
     def __str__(self):
         return self.name
\ No newline at end of file
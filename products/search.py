@@ -0,0 +1,44 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+from django.db import connection
+from django.db.models import F, Q
+
+SEARCH_CONFIG = 'english'
+
+# Names weigh more than descriptions when ranking matches
+SEARCH_VECTOR = (
+    SearchVector('name', weight='A', config=SEARCH_CONFIG)
+    + SearchVector('description', weight='B', config=SEARCH_CONFIG)
+)
+
+
+def supports_full_text_search():
+    return connection.vendor == 'postgresql'
+
+
+def update_search_vector(queryset):
+    """Recompute the stored search vector of the given products in one UPDATE"""
+    if not supports_full_text_search():
+        return 0
+    return queryset.update(search_vector=SEARCH_VECTOR)
+
+
+def search_products(queryset, query):
+    """
+    Filter and rank products matching a customer's search terms.
+
+    On PostgreSQL this matches the GIN-indexed search vector, and also the
+    trigram index on name so small typos ("iphnoe") still find the product.
+    Other databases fall back to icontains on every term, which is only
+    meant for tests and local development.
+    """
+    if not supports_full_text_search():
+        for term in query.split():
+            queryset = queryset.filter(Q(name__icontains=term) | Q(description__icontains=term))
+        return queryset.order_by('-created_at', '-id')
+
+    search_query = SearchQuery(query, search_type='websearch', config=SEARCH_CONFIG)
+    return queryset.filter(
+        Q(search_vector=search_query) | Q(name__trigram_similar=query)
+    ).annotate(
+        rank=SearchRank(F('search_vector'), search_query) + TrigramSimilarity('name', query)
+    ).order_by('-rank', '-created_at', '-id')
@@ -1,4 +1,7 @@
 from rest_framework import serializers
+from rest_framework.settings import api_settings
+from rest_framework.utils.serializer_helpers import ReturnList
+from .images import build_srcset
 from .models import Category, Product
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -25,6 +28,25 @@ class CategorySerializer(serializers.ModelSerializer):
         return value  # ← Added return statement
 
 
+def parse_fieldset(params, available):
+    """
+    Read `?fields=a,b` / `?omit=c` into the set of fields to return, or None for all of them.
+
+    Unknown names are rejected rather than ignored, so typos don't silently
+    fall back to the full representation.
+    """
+    fields = set(available)
+    for param in ('fields', 'omit'):
+        names = {name.strip() for value in params.getlist(param) for name in value.split(',') if name.strip()}
+        if not names:
+            continue
+        unknown = names - set(available)
+        if unknown:
+            raise serializers.ValidationError({param: f"Unknown fields: {', '.join(sorted(unknown))}"})
+        fields = fields & names if param == 'fields' else fields - names
+    return None if fields == set(available) else fields
+
+
 class ProductSerializer(serializers.ModelSerializer):
     # Use PrimaryKeyRelatedField for write operations, nested for reads
     category = serializers.PrimaryKeyRelatedField(
@@ -32,14 +54,36 @@ class ProductSerializer(serializers.ModelSerializer):
         write_only=True
     )
     category_detail = CategorySerializer(source='category', read_only=True)
+    photo_variants = serializers.SerializerMethodField()
     
     class Meta:
         model = Product
         fields = [
-            'id', 'name', 'description', 'price', 'category', 'category_detail',
-            'vendor', 'discount', 'quantity', 'photo', 'created_at', 'updated_at'
+            'id', 'sku', 'name', 'description', 'price', 'effective_price', 'category', 'category_detail',
+            'vendor', 'discount', 'quantity', 'photo', 'photo_variants', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['id', 'vendor', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'vendor', 'effective_price', 'created_at', 'updated_at']
+
+    def __init__(self, *args, fieldset=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Sparse fieldsets only trim the output, writable fields are always kept
+        if fieldset is not None:
+            for name in [name for name, field in self.fields.items() if not field.write_only]:
+                if name not in fieldset:
+                    self.fields.pop(name)
+
+    def get_photo_variants(self, obj):
+        """Resized copies of the photo as srcset strings per format, empty until they are generated"""
+        if not obj.photo_variants:
+            return {}
+        request = self.context.get('request')
+        storage = obj.photo.storage
+
+        def url_for(name):
+            url = storage.url(name)
+            return request.build_absolute_uri(url) if request is not None else url
+
+        return build_srcset(obj.photo_variants, url_for)
 
     def validate_category(self, value):
         """Validate that category belongs to the vendor"""
@@ -47,12 +91,30 @@ class ProductSerializer(serializers.ModelSerializer):
         if not vendor:
             raise serializers.ValidationError('Vendor context is required')
         
-        if value.vendor != vendor:
+        # Compare ids, loading value.vendor would cost a query per request
+        if value.vendor_id != vendor.pk:
             raise serializers.ValidationError(
                 'Category does not belong to this vendor.'
             )
         return value
 
+    def validate_sku(self, value):
+        """Validate SKU is unique per vendor, blank means no SKU"""
+        if not value:
+            return None
+
+        vendor = self.context.get('vendor')
+        if not vendor:
+            return value
+
+        queryset = Product.objects.filter(sku=value, vendor=vendor)
+        if self.instance:
+            queryset = queryset.exclude(pk=self.instance.pk)
+
+        if queryset.exists():
+            raise serializers.ValidationError('Product with this SKU already exists for this vendor.')
+        return value
+
     def validate_price(self, value):
         """Validate price is positive"""
         if value < 0:
@@ -69,4 +131,130 @@ class ProductSerializer(serializers.ModelSerializer):
         """Validate discount is between 0 and 100"""
         if value is not None and (value < 0 or value > 100):
             raise serializers.ValidationError('Discount must be between 0 and 100.')
-        return value
\ No newline at end of file
+        return value
+
+
+class ProductImportSerializer(ProductSerializer):
+    """
+    Validate one row of a bulk import.
+
+    Shares the field rules of ProductSerializer but makes no queries of its
+    own: categories come from the `categories` map the importer resolves
+    once per batch, keyed by id and name, and existing SKUs are updated
+    rather than rejected.
+    """
+    sku = serializers.CharField(max_length=64)
+    category = serializers.CharField(write_only=True)
+    category_detail = None
+    photo_variants = None
+
+    class Meta(ProductSerializer.Meta):
+        fields = ['sku', 'name', 'description', 'price', 'category', 'discount', 'quantity']
+
+    def validate_sku(self, value):
+        return value
+
+    def validate_category(self, value):
+        category = self.context['categories'].get(value)
+        if category is None:
+            raise serializers.ValidationError('Category does not belong to this vendor.')
+        return category
+
+
+class ProductBulkUpdateSerializer(ProductSerializer):
+    """
+    Validate one row of a bulk price/discount/stock update.
+
+    Used with partial=True, so only the fields present in a row are checked,
+    with the same rules as a single PATCH through ProductSerializer.
+    """
+    id = serializers.IntegerField()
+    category = None
+    category_detail = None
+    photo_variants = None
+
+    class Meta(ProductSerializer.Meta):
+        fields = ['id', 'price', 'discount', 'quantity']
+
+    def validate(self, attrs):
+        if 'id' not in attrs:
+            raise serializers.ValidationError({'id': 'This field is required.'})
+        if len(attrs) == 1:
+            raise serializers.ValidationError('Provide at least one of price, discount or quantity.')
+        return attrs
+
+
+class ProductValuesSerializer:
+    """
+    Serialize `Product.objects.values()` rows into the ProductSerializer shape.
+
+    List pages don't need model instances: the rows come straight from
+    `values()` and are formatted with ProductSerializer's own fields, so
+    the output matches field for field while skipping model and nested
+    serializer construction per row. Only the columns behind the requested
+    fieldset are selected.
+    """
+    # Output field -> columns it is built from, in ProductSerializer.Meta.fields order
+    COLUMNS = {
+        'id': ['id'],
+        'sku': ['sku'],
+        'name': ['name'],
+        'description': ['description'],
+        'price': ['price'],
+        'effective_price': ['effective_price'],
+        'category_detail': ['category_id', 'category__name', 'category__vendor_id'],
+        'vendor': ['vendor_id'],
+        'discount': ['discount'],
+        'quantity': ['quantity'],
+        'photo': ['photo'],
+        'photo_variants': ['photo_variants', 'photo'],
+        'created_at': ['created_at'],
+        'updated_at': ['updated_at'],
+    }
+
+    def __init__(self, instance=None, many=True, context=None, fieldset=None):
+        self.instance = instance
+        self.context = context or {}
+        self.field_names = [name for name in self.COLUMNS if fieldset is None or name in fieldset]
+        self.formatters = ProductSerializer(context=self.context).fields
+
+    @classmethod
+    def get_columns(cls, fieldset=None, ordering=()):
+        columns = {'id'}
+        for name, sources in cls.COLUMNS.items():
+            if fieldset is None or name in fieldset:
+                columns.update(sources)
+        # Cursor pagination reads its position from the ordering columns of the last row
+        columns.update(field.lstrip('-') for field in ordering)
+        return sorted(columns)
+
+    def url_for(self, name):
+        url = Product._meta.get_field('photo').storage.url(name)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request is not None else url
+
+    def to_representation(self, row):
+        data = {}
+        for name in self.field_names:
+            if name == 'category_detail':
+                value = {'id': row['category_id'], 'name': row['category__name'], 'vendor': row['category__vendor_id']}
+            elif name == 'vendor':
+                value = row['vendor_id']
+            elif name == 'photo':
+                value = row['photo'] or None
+                if value and api_settings.UPLOADED_FILES_USE_URL:
+                    value = self.url_for(value)
+            elif name == 'photo_variants':
+                value = build_srcset(row['photo_variants'], self.url_for) if row['photo_variants'] else {}
+            else:
+                value = row[name]
+                if value is not None:
+                    value = self.formatters[name].to_representation(value)
+            data[name] = value
+        return data
+
+    @property
+    def data(self):
+        return ReturnList(
+            [self.to_representation(row) for row in self.instance], serializer=self
+        )
@@ -0,0 +1,115 @@
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.test import RequestFactory
+from django.utils import timezone
+
+from accounts.models import Vendor
+from orders.models import Order
+from .models import Product
+from .views import CategoryViewSet, ProductViewSet
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WARM_VENDORS = 50
+DEFAULT_WARM_WORKERS = 4
+ACTIVITY_WINDOW = timedelta(days=7)
+
+# The cached catalog lists, warmed in this order for each vendor
+WARM_TARGETS = [
+    ("categories", CategoryViewSet),
+    ("products", ProductViewSet),
+]
+
+
+def count_per_vendor(queryset):
+    """Correlated COUNT of a queryset's rows for the outer vendor, 0 when there are none"""
+    counts = queryset.filter(vendor=OuterRef('pk')).order_by().values('vendor').annotate(
+        count=Count('pk')
+    ).values('count')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+
+def get_most_active_vendors(limit=DEFAULT_WARM_VENDORS):
+    """
+    Slugs of the active vendors with the most recent orders, then the largest catalogs.
+
+    Each count is its own subquery, so orders are only read inside the
+    activity window and never joined against the vendor's products.
+    """
+    since = timezone.now() - ACTIVITY_WINDOW
+    vendors = Vendor.objects.filter(is_active=True).annotate(
+        recent_orders=count_per_vendor(Order.objects.filter(created_at__gte=since)),
+        product_count=count_per_vendor(Product.objects.all()),
+    ).order_by('-recent_orders', '-product_count', 'pk')
+    return list(vendors.values_list('slug', flat=True)[:limit])
+
+
+def get_default_host():
+    """First concrete ALLOWED_HOSTS entry, so pagination links in warmed pages look like real ones"""
+    return next((host.lstrip('.') for host in settings.ALLOWED_HOSTS if host and host != '*'), 'localhost')
+
+
+def get_next_link(response):
+    """Path and query of a list response's next page, or None on the last page"""
+    if response.status_code != 200:
+        return None
+    # Cached lists come back as pre-rendered JSON, uncached ones as a DRF Response
+    data = response.data if hasattr(response, 'data') else json.loads(response.content)
+    next_link = data.get('next')
+    if not next_link:
+        return None
+    parts = urlsplit(next_link)
+    return f'{parts.path}?{parts.query}'
+
+
+def warm_vendor_cache(vendor_slug, pages=1, host=None, secure=False):
+    """
+    Fill the list caches of one vendor by running the real list views.
+
+    Going through the views means the entries land under exactly the keys
+    live traffic uses. Entries that are already fresh are just cache hits.
+    """
+    factory = RequestFactory(HTTP_HOST=host or get_default_host(), secure=secure)
+    started = time.monotonic()
+    statuses = {}
+    for path, viewset_class in WARM_TARGETS:
+        # The catalog lists are the same for every caller, so skip auth and permissions
+        view = viewset_class.as_view({'get': 'list'}, authentication_classes=[], permission_classes=[])
+        url = f'/api/vendors/{vendor_slug}/{path}/'
+        for page in range(1, pages + 1):
+            response = view(factory.get(url), vendor_slug=vendor_slug)
+            statuses[f'{path}:{page}'] = response.status_code
+            # Follow the next link, it works for both page numbers and cursors
+            url = get_next_link(response) if page < pages else None
+            if not url:
+                break
+
+    seconds = time.monotonic() - started
+    logger.info(f"Warmed cache for vendor={vendor_slug} in {seconds:.3f}s")
+    return {'vendor': vendor_slug, 'seconds': round(seconds, 3), 'statuses': statuses}
+
+
+def warm_top_vendors(limit=DEFAULT_WARM_VENDORS, workers=DEFAULT_WARM_WORKERS, pages=1, host=None, secure=False):
+    """Warm the N most active vendors concurrently with a bounded thread pool"""
+    def warm(slug):
+        try:
+            return warm_vendor_cache(slug, pages, host, secure)
+        except Exception as e:
+            logger.warning(f"Failed to warm cache for vendor={slug}: {e}")
+            return {'vendor': slug, 'error': str(e)}
+        finally:
+            # Each pool thread opens its own database connection, don't leave it behind
+            connections.close_all()
+
+    slugs = get_most_active_vendors(limit)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        return list(pool.map(warm, slugs))
@@ -1,7 +1,11 @@
+from django.db import transaction
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from .models import Category, Product
-from services.caching import clear_vendor_cache
+from .images import delete_variants
+from .search import update_search_vector
+from .snapshots import schedule_catalog_snapshot
+from services.caching import clear_vendor_cache_on_commit, vendor_cache_invalidated
 import logging
 
 logger = logging.getLogger(__name__)
@@ -11,16 +15,69 @@ def inavalidate_cache(instance, what_to_cache):
         vendor = getattr(instance, 'vendor', None)
         if vendor is None:
             return
-        clear_vendor_cache(vendor.slug, what_to_cache)
-        logger.info(f"Invalidated category cache for vendor={vendor.slug}")
+        clear_vendor_cache_on_commit(vendor.slug, what_to_cache)
+        logger.info(f"Scheduled {what_to_cache} cache invalidation for vendor={vendor.slug}")
     except Exception as e:
-        logger.warning(f"Failed to invalidate category cache: {e}")
+        logger.warning(f"Failed to invalidate {what_to_cache} cache: {e}")
     
 @receiver([post_save, post_delete], sender=Category)
 def invalidate_category_cache(sender, instance, **kwargs):
-    return inavalidate_cache(instance, "category")
+    inavalidate_cache(instance, "category")
+    # Product lists embed the category and the facet counts list category names
+    inavalidate_cache(instance, "product")
 
 
 @receiver([post_save, post_delete], sender=Product)
 def invalidate_product_cache(sender, instance, **kwargs):
-    return inavalidate_cache(instance, 'product')
\ No newline at end of file
+    return inavalidate_cache(instance, 'product')
+
+
+@receiver(post_save, sender=Product)
+def refresh_search_vector(sender, instance, update_fields=None, **kwargs):
+    # Only the saved row is recomputed, and only when its text could have changed
+    if update_fields and not {'name', 'description'} & set(update_fields):
+        return
+    try:
+        update_search_vector(Product.objects.filter(pk=instance.pk))
+    except Exception as e:
+        logger.warning(f"Failed to update search vector for product={instance.pk}: {e}")
+
+
+@receiver(post_save, sender=Product)
+def queue_image_variants(sender, instance, **kwargs):
+    # Resizing happens in a Celery worker, the upload request returns right away
+    if not getattr(instance, '_photo_replaced', False):
+        return
+    stale = getattr(instance, '_stale_variants', None)
+    if stale:
+        transaction.on_commit(lambda: delete_variants(stale))
+    if instance.photo:
+        product_id, photo_name = instance.pk, instance.photo.name
+        transaction.on_commit(lambda: dispatch_image_variants(product_id, photo_name))
+
+
+def dispatch_image_variants(product_id, photo_name):
+    # The product is already committed, a broker outage must not turn the save into a 500
+    from .tasks import generate_product_image_variants
+    try:
+        generate_product_image_variants.delay(product_id, photo_name)
+    except Exception as e:
+        logger.warning(f"Failed to queue image variants for product={product_id}: {e}")
+
+
+@receiver(post_delete, sender=Product)
+def delete_image_variants(sender, instance, **kwargs):
+    if instance.photo_variants:
+        variants = instance.photo_variants
+        transaction.on_commit(lambda: delete_variants(variants))
+
+
+@receiver(vendor_cache_invalidated)
+def refresh_catalog_snapshot(sender, vendor_slug, what_to_cache, **kwargs):
+    # Sent after commit for every write path, including bulk imports and updates that skip post_save
+    if what_to_cache not in ('product', 'category'):
+        return
+    try:
+        schedule_catalog_snapshot(vendor_slug)
+    except Exception as e:
+        logger.warning(f"Failed to schedule catalog snapshot for vendor={vendor_slug}: {e}")
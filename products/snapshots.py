@@ -0,0 +1,196 @@
+import gzip
+import hashlib
+import json
+import logging
+import time
+from itertools import islice
+
+import brotli
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import storages
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from services.storage import replace_file
+from .models import Category, Product
+from .serializers import CategorySerializer, ProductValuesSerializer
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_SHARD_SIZE = 500
+SNAPSHOT_DIR = 'catalog'
+
+# Changes within this many seconds of each other are folded into one export
+SNAPSHOT_DEBOUNCE = 30
+
+# Oldest first, so new products only ever change the last shard
+SNAPSHOT_ORDERING = ('created_at', 'id')
+
+
+def get_snapshot_storage():
+    return storages[settings.CATALOG_SNAPSHOT_STORAGE]
+
+
+def get_snapshot_path(vendor_slug, name):
+    return f'{SNAPSHOT_DIR}/{vendor_slug}/{name}'
+
+
+def get_manifest_path(vendor_slug):
+    return get_snapshot_path(vendor_slug, 'manifest.json')
+
+
+def snapshot_url(vendor_slug, name='manifest.json'):
+    """Public URL of a vendor's snapshot file, the manifest by default"""
+    return get_snapshot_storage().url(get_snapshot_path(vendor_slug, name))
+
+
+def get_pending_key(vendor_slug):
+    return f'catalog_snapshot:pending:{vendor_slug}'
+
+
+def get_published_key(vendor_slug):
+    return f'catalog_snapshot:published:{vendor_slug}'
+
+
+def render_json(data):
+    return json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':')).encode()
+
+
+def write_file(storage, name, body):
+    """
+    Write a JSON body plus its .gz and .br siblings.
+
+    Both are compressed at their highest level since a shard is written
+    once and read many times. Whitenoise and most CDNs pick the sibling
+    matching the client's Accept-Encoding on their own.
+    """
+    for suffix, content in (
+        ('', body),
+        ('.gz', gzip.compress(body, compresslevel=9, mtime=0)),
+        ('.br', brotli.compress(body, quality=11)),
+    ):
+        replace_file(storage, name + suffix, content)
+
+
+def delete_file(storage, name):
+    for suffix in ('', '.gz', '.br'):
+        try:
+            storage.delete(name + suffix)
+        except Exception as e:
+            logger.warning(f"Failed to delete catalog snapshot file {name}{suffix}: {e}")
+
+
+def load_manifest(vendor_slug, storage=None):
+    storage = storage or get_snapshot_storage()
+    name = get_manifest_path(vendor_slug)
+    if not storage.exists(name):
+        return None
+    with storage.open(name, 'rb') as manifest:
+        return json.load(manifest)
+
+
+def iter_product_shards(vendor_slug, shard_size=SNAPSHOT_SHARD_SIZE):
+    """Yield lists of serialized products, read in one streamed values() query"""
+    rows = Product.objects.filter(vendor__slug=vendor_slug).order_by(*SNAPSHOT_ORDERING).values(
+        *ProductValuesSerializer.get_columns(ordering=SNAPSHOT_ORDERING)
+    ).iterator(chunk_size=shard_size)
+    serializer = ProductValuesSerializer()
+    while True:
+        shard = [serializer.to_representation(row) for row in islice(rows, shard_size)]
+        if not shard:
+            return
+        yield shard
+
+
+def publish_file(storage, vendor_slug, prefix, data, existing):
+    """
+    Write a versioned file unless an identical one is already published.
+
+    Names carry a hash of the content, so unchanged shards keep their name
+    and URL from one export to the next and stay cached at the edge.
+    """
+    body = render_json(data)
+    digest = hashlib.sha256(body).hexdigest()[:16]
+    name = get_snapshot_path(vendor_slug, f'{prefix}.{digest}.json')
+    written = name not in existing
+    if written:
+        write_file(storage, name, body)
+    return {'path': name, 'bytes': len(body)}, written
+
+
+def export_catalog_snapshot(vendor_slug, shard_size=SNAPSHOT_SHARD_SIZE):
+    """
+    Render a vendor's categories and products into static JSON shards plus a manifest.
+
+    Each shard holds `shard_size` products in the public list format and is
+    only rewritten when its content changed. The manifest is written last,
+    so readers always see a complete set. Files dropped from the catalog are
+    kept for one more export, clients holding the previous manifest can
+    still fetch them, and deleted on the export after that.
+    """
+    started = time.monotonic()
+    storage = get_snapshot_storage()
+    previous = load_manifest(vendor_slug, storage) or {}
+    existing = {entry['path'] for entry in previous.get('files', [])}
+
+    written = 0
+    categories = CategorySerializer(Category.objects.filter(vendor__slug=vendor_slug).order_by('name'), many=True).data
+    category_file, changed = publish_file(storage, vendor_slug, 'categories', list(categories), existing)
+    written += changed
+
+    shards = []
+    product_count = 0
+    for index, shard in enumerate(iter_product_shards(vendor_slug, shard_size)):
+        entry, changed = publish_file(storage, vendor_slug, f'products-{index:04d}', shard, existing)
+        shards.append({**entry, 'count': len(shard)})
+        product_count += len(shard)
+        written += changed
+
+    files = [category_file] + shards
+    paths = {entry['path'] for entry in files}
+    manifest = {
+        'vendor': vendor_slug,
+        'version': hashlib.sha256(''.join(sorted(paths)).encode()).hexdigest()[:16],
+        'generated_at': timezone.now(),
+        'shard_size': shard_size,
+        'product_count': product_count,
+        'categories': category_file,
+        'shards': shards,
+        'files': files,
+        'retired': sorted(existing - paths),
+    }
+    if previous.get('version') != manifest['version']:
+        write_file(storage, get_manifest_path(vendor_slug), render_json(manifest))
+        for name in set(previous.get('retired', [])) - paths:
+            delete_file(storage, name)
+    else:
+        # Nothing changed, keep the old manifest and its retired files as they are
+        manifest = previous
+
+    # Lets the change signals skip vendors that were never exported without touching storage
+    cache.set(get_published_key(vendor_slug), manifest['version'], None)
+
+    seconds = time.monotonic() - started
+    logger.info(
+        f"Exported catalog snapshot for vendor={vendor_slug}: {product_count} products in "
+        f"{len(shards)} shards, {written} files written in {seconds:.3f}s"
+    )
+    return {'vendor': vendor_slug, 'version': manifest['version'], 'shards': len(shards), 'written': written}
+
+
+def schedule_catalog_snapshot(vendor_slug, countdown=SNAPSHOT_DEBOUNCE):
+    """
+    Queue an incremental export for a vendor that already publishes snapshots.
+
+    A burst of changes queues a single task: the pending flag is only set
+    once per debounce window, and the task clears it before reading the
+    catalog so later changes queue the next export.
+    """
+    if cache.get(get_published_key(vendor_slug)) is None:
+        return False
+    if not cache.add(get_pending_key(vendor_slug), 1, countdown + SNAPSHOT_DEBOUNCE):
+        return False
+    from .tasks import refresh_catalog_snapshot
+    refresh_catalog_snapshot.apply_async((vendor_slug,), countdown=countdown)
+    return True
@@ -0,0 +1,59 @@
+from celery import shared_task
+from django.core.cache import cache
+import logging
+
+from services.caching import clear_vendor_cache_on_commit
+from .images import delete_variants, generate_variants
+from .models import Product
+from .services import DEFAULT_WARM_VENDORS, DEFAULT_WARM_WORKERS, get_most_active_vendors, warm_top_vendors
+from .snapshots import SNAPSHOT_SHARD_SIZE, export_catalog_snapshot, get_pending_key, load_manifest
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def warm_catalog_cache(limit=DEFAULT_WARM_VENDORS, workers=DEFAULT_WARM_WORKERS, pages=1):
+    """Pre-populate the catalog list caches of the most active vendors"""
+    return warm_top_vendors(limit=limit, workers=workers, pages=pages)
+
+
+@shared_task(autoretry_for=(OSError,), retry_backoff=True, max_retries=3)
+def generate_product_image_variants(product_id, photo_name):
+    """Resize a product's uploaded photo into its WebP/JPEG variants"""
+    variants = generate_variants(photo_name)
+    # Only attach them if the photo wasn't replaced again while we worked
+    updated = Product.objects.filter(pk=product_id, photo=photo_name).update(photo_variants=variants)
+    if not updated:
+        delete_variants(variants)
+        return None
+
+    vendor_slug = Product.objects.filter(pk=product_id).values_list('vendor__slug', flat=True).first()
+    if vendor_slug:
+        # update() sends no post_save, so refresh the cached lists that link the photo
+        clear_vendor_cache_on_commit(vendor_slug, 'product')
+    logger.info(f"Generated image variants for product={product_id}")
+    return variants
+
+
+@shared_task
+def export_catalog_snapshots(limit=DEFAULT_WARM_VENDORS, shard_size=SNAPSHOT_SHARD_SIZE):
+    """Export static catalog snapshots for the most active vendors"""
+    results = []
+    for vendor_slug in get_most_active_vendors(limit):
+        try:
+            results.append(export_catalog_snapshot(vendor_slug, shard_size))
+        except Exception as e:
+            logger.warning(f"Failed to export catalog snapshot for vendor={vendor_slug}: {e}")
+            results.append({'vendor': vendor_slug, 'error': str(e)})
+    return results
+
+
+@shared_task(autoretry_for=(OSError,), retry_backoff=True, max_retries=3)
+def refresh_catalog_snapshot(vendor_slug):
+    """Re-export a vendor's snapshot after its catalog changed, rewriting only the changed shards"""
+    # Cleared before reading, so changes made while we export queue another run
+    cache.delete(get_pending_key(vendor_slug))
+    manifest = load_manifest(vendor_slug)
+    if manifest is None:
+        return None
+    return export_catalog_snapshot(vendor_slug, manifest.get('shard_size', SNAPSHOT_SHARD_SIZE))
@@ -1,9 +1,36 @@
+from datetime import timedelta
 from decimal import Decimal
-from django.test import TestCase
+from io import BytesIO
+from unittest import mock
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+import brotli
+import gzip
+import json
+import tempfile
 from django.core.exceptions import ValidationError
-from accounts.models import Vendor
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIRequestFactory, force_authenticate
+from accounts.models import Membership, Vendor
+from orders.models import Order
+from services.caching import get_cache_stats, get_generation
+from services.local_cache import local_cache
+from services.testing import LOCMEM_CACHES
 from .models import Category, Product
-
+from .services import get_most_active_vendors, warm_vendor_cache
+from .facets import get_product_facets
+from .bulk_update import bulk_update_products, BulkUpdateError
+from .images import generate_variants
+from .importer import ImportFormatError, import_products
+from .serializers import ProductSerializer
+from .tasks import generate_product_image_variants
+from .search import search_products
+from .snapshots import export_catalog_snapshot, get_snapshot_storage, load_manifest, snapshot_url
+from .views import ProductViewSet
 
 class CategoryModelTests(TestCase):
     def setUp(self):
@@ -74,6 +101,18 @@ class ProductModelTests(TestCase):
         self.assertEqual(product.discount, Decimal('10'))
         self.assertEqual(product.category, self.category)
 
+    def test_effective_price_follows_price_and_discount(self):
+        #Test that the stored sale price is kept in sync on save, including update_fields saves
+        product = Product.objects.create(
+            name='Laptop', description='Desc', price=Decimal('999.99'),
+            category=self.category, vendor=self.vendor, discount=Decimal('15')
+        )
+        self.assertEqual(product.effective_price, Decimal('849.99'))
+        product.discount = Decimal('0')
+        product.save(update_fields=['discount'])
+        product.refresh_from_db()
+        self.assertEqual(product.effective_price, Decimal('999.99'))
+
     def test_product_default_values(self):
         #Test product default values
         product = Product.objects.create(
@@ -152,3 +191,675 @@ class ProductModelTests(TestCase):
             vendor=self.vendor
         )
         self.assertEqual(self.category.products.count(), 2)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, ALLOWED_HOSTS=['api.example.com'])
+class CacheWarmingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        self.busy = Vendor.objects.create(
+            company_name='Busy Vendor', address='1 St', phone_number='1234567890', email='busy@test.com'
+        )
+        self.quiet = Vendor.objects.create(
+            company_name='Quiet Vendor', address='2 St', phone_number='1234567890', email='quiet@test.com'
+        )
+        category = Category.objects.create(name='Default', vendor=self.busy)
+        Product.objects.create(
+            name='Laptop', description='Laptop', price=Decimal('10.00'), category=category, vendor=self.busy
+        )
+        Order.objects.create(vendor=self.busy, session_key='guest', total=Decimal('10.00'))
+
+    def test_most_active_vendors_come_first(self):
+        #Test that vendors are ranked by recent orders
+        self.assertEqual(get_most_active_vendors(limit=1), [self.busy.slug])
+        self.assertEqual(get_most_active_vendors(), [self.busy.slug, self.quiet.slug])
+
+    def test_orders_outside_the_window_are_not_counted(self):
+        #Test that old orders don't rank a vendor, and catalog size breaks the tie
+        self.busy.orders.update(created_at=timezone.now() - timedelta(days=30))
+        category = Category.objects.create(name='Default', vendor=self.quiet)
+        for name in ('Pen', 'Ink'):
+            Product.objects.create(
+                name=name, description=name, price=Decimal('1.00'), category=category, vendor=self.quiet
+            )
+        self.assertEqual(get_most_active_vendors(), [self.quiet.slug, self.busy.slug])
+
+    def test_warming_fills_the_list_caches(self):
+        #Test that a warmed vendor's first real request is a cache hit
+        result = warm_vendor_cache(self.busy.slug)
+        self.assertEqual(result['statuses'], {'categories:1': 200, 'products:1': 200})
+        local_cache.clear()
+
+        before = get_cache_stats()['l2']['hits']
+        request = APIRequestFactory().get(f'/api/vendors/{self.busy.slug}/products/', HTTP_HOST='api.example.com')
+        force_authenticate(request, user=get_user_model().objects.create_user(email='u@test.com', password='pass'))
+        response = ProductViewSet.as_view({'get': 'list'})(request, vendor_slug=self.busy.slug)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(get_cache_stats()['l2']['hits'], before + 1)
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        self.vendor = Vendor.objects.create(
+            company_name='TestVendor', address='123 Street',
+            phone_number='1234567890', email='vendor@test.com'
+        )
+        other = Vendor.objects.create(
+            company_name='Other', address='456 St', phone_number='0987654321', email='other@test.com'
+        )
+        category = Category.objects.create(name='Phones', vendor=self.vendor)
+        self.phone = Product.objects.create(
+            name='Galaxy Phone', description='Android handset with a big screen',
+            price=Decimal('300.00'), category=category, vendor=self.vendor
+        )
+        self.case = Product.objects.create(
+            name='Leather Case', description='Fits most phones',
+            price=Decimal('20.00'), category=category, vendor=self.vendor
+        )
+        Product.objects.create(
+            name='Galaxy Phone', description='Sold by someone else',
+            price=Decimal('250.00'), category=Category.objects.create(name='Phones', vendor=other), vendor=other
+        )
+        self.user = get_user_model().objects.create_user(email='u@test.com', password='pass')
+        self.view = ProductViewSet.as_view({'get': 'search'})
+
+    def search(self, query=None):
+        params = {'q': query} if query is not None else {}
+        request = APIRequestFactory().get(f'/api/vendors/{self.vendor.slug}/products/search/', params)
+        force_authenticate(request, user=self.user)
+        return self.view(request, vendor_slug=self.vendor.slug)
+
+    def test_search_matches_names_and_descriptions_of_one_vendor(self):
+        #Test that terms match name or description, scoped to the vendor
+        response = self.search('phone')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({product['id'] for product in response.data['results']}, {self.phone.id, self.case.id})
+
+    def test_every_term_must_match(self):
+        #Test that multi-word queries narrow the results
+        products = search_products(Product.objects.filter(vendor=self.vendor), 'android screen')
+        self.assertEqual(list(products), [self.phone])
+
+    def test_query_is_required(self):
+        #Test that an empty search is rejected
+        self.assertEqual(self.search().status_code, 400)
+        self.assertEqual(self.search('  ').status_code, 400)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ProductFacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vendor = Vendor.objects.create(
+                company_name='TestVendor', address='123 Street',
+                phone_number='1234567890', email='vendor@test.com'
+            )
+            self.phones = Category.objects.create(name='Phones', vendor=self.vendor)
+            self.cases = Category.objects.create(name='Cases', vendor=self.vendor)
+            for price, quantity, discount, category in [
+                ('20.00', 5, '0', self.cases),
+                ('45.00', 0, '10', self.cases),
+                ('300.00', 2, '0', self.phones),
+                ('900.00', 1, '15', self.phones),
+            ]:
+                Product.objects.create(
+                    name=f'Product {price}', description='Desc', price=Decimal(price),
+                    quantity=quantity, discount=Decimal(discount), category=category, vendor=self.vendor
+                )
+        self.user = get_user_model().objects.create_user(email='u@test.com', password='pass')
+        self.view = ProductViewSet.as_view({'get': 'list'})
+
+    def get_json(self, query=''):
+        request = APIRequestFactory().get(f'/api/vendors/{self.vendor.slug}/products/{query}')
+        force_authenticate(request, user=self.user)
+        response = self.view(request, vendor_slug=self.vendor.slug)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def test_facets_count_the_whole_catalog(self):
+        #Test that facet counts cover price ranges, stock, discounts and categories
+        facets = self.get_json()['facets']
+        self.assertEqual(facets['in_stock'], 3)
+        self.assertEqual(facets['discounted'], 2)
+        self.assertEqual([price_range['count'] for price_range in facets['price_ranges']], [2, 0, 1, 1])
+        self.assertEqual(
+            [(category['name'], category['count']) for category in facets['categories']],
+            [('Cases', 2), ('Phones', 2)]
+        )
+
+    def test_filters_narrow_the_page_but_not_the_facets(self):
+        #Test that price, stock and discount filters apply to the results only
+        data = self.get_json('?min_price=40&max_price=500&in_stock=true')
+        self.assertEqual([product['price'] for product in data['results']], ['300.00'])
+        self.assertEqual(data['facets']['in_stock'], 3)
+        self.assertEqual(len(self.get_json('?discounted=true')['results']), 2)
+
+    def test_invalid_price_is_rejected(self):
+        #Test that a malformed price filter is a 400, not a server error
+        request = APIRequestFactory().get(f'/api/vendors/{self.vendor.slug}/products/?min_price=abc')
+        force_authenticate(request, user=self.user)
+        self.assertEqual(self.view(request, vendor_slug=self.vendor.slug).status_code, 400)
+
+    def test_facets_are_served_from_the_cache(self):
+        #Test that a second lookup needs no queries until a product changes
+        get_product_facets(self.vendor.slug)
+        with self.assertNumQueries(0):
+            get_product_facets(self.vendor.slug)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(price=Decimal('45.00')).get().delete()
+        self.assertEqual(get_product_facets(self.vendor.slug)['price_ranges'][0]['count'], 1)
+
+    def test_category_rename_refreshes_cached_lists(self):
+        #Test that renaming a category shows up in product lists and facets
+        self.get_json()
+        self.cases.name = 'Covers'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cases.save()
+        data = self.get_json()
+        self.assertIn('Covers', [category['name'] for category in data['facets']['categories']])
+        self.assertIn('Covers', [product['category_detail']['name'] for product in data['results']])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class BulkImportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vendor = Vendor.objects.create(
+                company_name='TestVendor', address='123 Street',
+                phone_number='1234567890', email='vendor@test.com'
+            )
+            self.phones = Category.objects.create(name='Phones', vendor=self.vendor)
+        self.user = get_user_model().objects.create_user(email='admin@test.com', password='pass')
+        Membership.objects.create(user=self.user, vendor=self.vendor, role='vendor_admin')
+        self.view = ProductViewSet.as_view({'post': 'bulk_import'})
+
+    def csv_lines(self, rows):
+        header = 'sku,name,description,price,category,quantity\n'
+        return [line.encode() for line in [header] + [f'{row}\n' for row in rows]]
+
+    def post(self, body, content_type):
+        request = APIRequestFactory().generic(
+            'POST', f'/api/vendors/{self.vendor.slug}/products/bulk/', body, content_type=content_type
+        )
+        force_authenticate(request, user=self.user)
+        return self.view(request, vendor_slug=self.vendor.slug)
+
+    def test_csv_rows_are_created_then_upserted_by_sku(self):
+        #Test that a second import of the same SKUs updates instead of duplicating
+        rows = [f'SKU-{i},Phone {i},Desc,{100 + i}.00,Phones,3' for i in range(5)]
+        report = import_products(self.vendor, self.csv_lines(rows), 'csv')
+        self.assertEqual((report['rows'], report['created'], report['updated']), (5, 5, 0))
+
+        report = import_products(self.vendor, self.csv_lines(['SKU-0,Renamed,Desc,1.00,Phones,0']), 'csv')
+        self.assertEqual((report['created'], report['updated']), (0, 1))
+        product = Product.objects.get(vendor=self.vendor, sku='SKU-0')
+        self.assertEqual((product.name, product.price, product.quantity), ('Renamed', Decimal('1.00'), 0))
+        self.assertEqual(product.effective_price, Decimal('1.00'))
+        self.assertEqual(Product.objects.filter(vendor=self.vendor).count(), 5)
+
+    def test_bad_rows_are_reported_and_skipped(self):
+        #Test that invalid rows come back by number while the others are imported
+        rows = ['A,Good,Desc,10.00,Phones,1', 'B,Bad price,Desc,-5,Phones,1', 'C,No category,Desc,5.00,Toys,1']
+        report = import_products(self.vendor, self.csv_lines(rows), 'csv')
+        self.assertEqual(report['created'], 1)
+        self.assertEqual([error['row'] for error in report['errors']], [2, 3])
+        self.assertIn('price', report['errors'][0]['errors'])
+        self.assertIn('category', report['errors'][1]['errors'])
+
+    def test_queries_per_batch_do_not_grow_with_rows(self):
+        #Test that each batch costs a fixed number of queries however many rows it has
+        rows = [f'SKU-{i},Phone {i},Desc,10.00,{self.phones.id},1' for i in range(100)]
+        # Per batch: categories, savepoint, existing SKUs, one upsert, release
+        with self.assertNumQueries(10):
+            import_products(self.vendor, self.csv_lines(rows), 'csv', batch_size=50)
+        self.assertEqual(Product.objects.filter(vendor=self.vendor).count(), 100)
+
+    def test_cache_is_invalidated_once(self):
+        #Test that an import bumps the product generation a single time
+        generation = get_generation('product', self.vendor.slug)
+        rows = [f'SKU-{i},Phone {i},Desc,10.00,Phones,1' for i in range(30)]
+        with self.captureOnCommitCallbacks(execute=True):
+            import_products(self.vendor, self.csv_lines(rows), 'csv', batch_size=10)
+        self.assertEqual(get_generation('product', self.vendor.slug), generation + 1)
+
+    def test_endpoint_accepts_jsonl(self):
+        #Test the bulk endpoint with a JSON lines body, including an unparsable line
+        body = '\n'.join([
+            json.dumps({'sku': 'J-1', 'name': 'Phone', 'description': 'Desc', 'price': '9.99', 'category': 'Phones'}),
+            '{not json',
+        ])
+        response = self.post(body, 'application/x-ndjson')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['errors'][0]['row'], 2)
+
+    def test_unreadable_tail_keeps_earlier_batches_and_reports_them(self):
+        #Test that a bad byte sequence after a committed batch still invalidates and returns the counts
+        generation = get_generation('product', self.vendor.slug)
+        lines = self.csv_lines([f'SKU-{i},Phone {i},Desc,10.00,Phones,1' for i in range(2)])
+        lines.append(b'SKU-9,Broken \xff\xfe,Desc,1.00,Phones,1\n')
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(ImportFormatError) as raised:
+                import_products(self.vendor, lines, 'csv', batch_size=2)
+        self.assertEqual((raised.exception.report['rows'], raised.exception.report['created']), (2, 2))
+        self.assertEqual(Product.objects.filter(vendor=self.vendor).count(), 2)
+        self.assertEqual(get_generation('product', self.vendor.slug), generation + 1)
+
+        with mock.patch('products.views.import_products', side_effect=raised.exception):
+            response = self.post('sku\n', 'text/csv')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual((response.data['created'], response.data['updated']), (2, 0))
+        self.assertIn('error', response.data)
+
+    def test_endpoint_rejects_unknown_formats(self):
+        #Test that a body that is neither CSV nor JSONL is a 400
+        self.assertEqual(self.post('<xml/>', 'application/xml').status_code, 400)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class BulkUpdateTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vendor = Vendor.objects.create(
+                company_name='TestVendor', address='123 Street',
+                phone_number='1234567890', email='vendor@test.com'
+            )
+            self.other = Vendor.objects.create(
+                company_name='Other', address='456 St', phone_number='0987654321', email='other@test.com'
+            )
+            category = Category.objects.create(name='Phones', vendor=self.vendor)
+            self.products = [
+                Product.objects.create(
+                    name=f'Phone {i}', description='Desc', price=Decimal('10.00'),
+                    quantity=5, category=category, vendor=self.vendor
+                )
+                for i in range(3)
+            ]
+            self.foreign = Product.objects.create(
+                name='Not mine', description='Desc', price=Decimal('10.00'),
+                category=Category.objects.create(name='Phones', vendor=self.other), vendor=self.other
+            )
+        self.user = get_user_model().objects.create_user(email='admin@test.com', password='pass')
+        Membership.objects.create(user=self.user, vendor=self.vendor, role='vendor_admin')
+
+    def test_changed_rows_are_written_and_reported(self):
+        #Test that only rows with new values are updated and listed
+        first, second, third = self.products
+        result = bulk_update_products(self.vendor, [
+            {'id': first.id, 'price': '12.50'},
+            {'id': second.id, 'quantity': 5, 'discount': '20'},
+            {'id': third.id, 'quantity': 5},
+        ])
+        self.assertEqual(result, {'updated': [first.id, second.id], 'unchanged': [third.id]})
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.price, Decimal('12.50'))
+        self.assertEqual((second.quantity, second.discount), (5, Decimal('20')))
+
+    def test_serializer_rules_reject_the_whole_batch(self):
+        #Test that one invalid row means nothing is applied
+        first, second, _ = self.products
+        with self.assertRaises(BulkUpdateError) as raised:
+            bulk_update_products(self.vendor, [
+                {'id': first.id, 'price': '99.00'},
+                {'id': second.id, 'discount': '150'},
+                {'price': '1.00'},
+            ])
+        self.assertEqual([error['index'] for error in raised.exception.errors], [1, 2])
+        self.assertIn('discount', raised.exception.errors[0]['errors'])
+        first.refresh_from_db()
+        self.assertEqual(first.price, Decimal('10.00'))
+
+    def test_other_vendors_products_are_not_found(self):
+        #Test that ids of another vendor's products are rejected
+        with self.assertRaises(BulkUpdateError):
+            bulk_update_products(self.vendor, [{'id': self.foreign.id, 'price': '1.00'}])
+        self.foreign.refresh_from_db()
+        self.assertEqual(self.foreign.price, Decimal('10.00'))
+
+    def test_one_invalidation_per_batch(self):
+        #Test that a batch bumps the product generation once on commit
+        generation = get_generation('product', self.vendor.slug)
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_update_products(self.vendor, [{'id': p.id, 'price': '11.00'} for p in self.products])
+        self.assertEqual(get_generation('product', self.vendor.slug), generation + 1)
+
+    def test_endpoint(self):
+        #Test the bulk PATCH endpoint, including a non-list body
+        view = ProductViewSet.as_view({'patch': 'bulk_partial_update'})
+        url = f'/api/vendors/{self.vendor.slug}/products/bulk/'
+        request = APIRequestFactory().patch(url, [{'id': self.products[0].id, 'price': '-1'}], format='json')
+        force_authenticate(request, user=self.user)
+        response = view(request, vendor_slug=self.vendor.slug)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('price', response.data['errors'][0]['errors'])
+
+        request = APIRequestFactory().patch(url, {'id': 1}, format='json')
+        force_authenticate(request, user=self.user)
+        self.assertEqual(view(request, vendor_slug=self.vendor.slug).status_code, 400)
+
+        request = APIRequestFactory().patch(url, [{'id': self.products[0].id, 'price': '3.00'}], format='json')
+        force_authenticate(request, user=self.user)
+        response = view(request, vendor_slug=self.vendor.slug)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['updated'], [self.products[0].id])
+
+    def test_effective_price_is_kept_in_sync(self):
+        #Test that bulk updates recompute the stored sale price
+        product = self.products[0]
+        bulk_update_products(self.vendor, [{'id': product.id, 'price': '40.00', 'discount': '25'}])
+        product.refresh_from_db()
+        self.assertEqual(product.effective_price, Decimal('30.00'))
+
+    def test_listing_can_be_sorted_by_sale_price(self):
+        #Test that ?ordering=effective_price sorts in SQL by the discounted price
+        first, second, third = self.products
+        bulk_update_products(self.vendor, [
+            {'id': first.id, 'price': '50.00', 'discount': '90'},
+            {'id': second.id, 'price': '20.00'},
+            {'id': third.id, 'price': '8.00'},
+        ])
+        request = APIRequestFactory().get(f'/api/vendors/{self.vendor.slug}/products/?ordering=effective_price')
+        force_authenticate(request, user=self.user)
+        response = ProductViewSet.as_view({'get': 'list'})(request, vendor_slug=self.vendor.slug)
+        prices = [product['effective_price'] for product in json.loads(response.content)['results']]
+        self.assertEqual(prices, ['5.00', '8.00', '20.00'])
+
+
+IN_MEMORY_STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.InMemoryStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    'catalog_snapshots': {
+        'BACKEND': 'django.core.files.storage.InMemoryStorage',
+        'OPTIONS': {'base_url': '/snapshots/'},
+    },
+}
+
+
+@override_settings(CACHES=LOCMEM_CACHES, STORAGES=IN_MEMORY_STORAGES)
+class ProductImageTests(TestCase):
+    def setUp(self):
+        self.vendor = Vendor.objects.create(
+            company_name='TestVendor', address='123 Street',
+            phone_number='1234567890', email='vendor@test.com'
+        )
+        self.category = Category.objects.create(name='Phones', vendor=self.vendor)
+
+    def photo(self, width=1200, height=800):
+        image = Image.new('RGB', (width, height), 'red')
+        exif = Image.Exif()
+        exif[0x010F] = 'CameraMaker'
+        buffer = BytesIO()
+        image.save(buffer, 'JPEG', exif=exif.tobytes())
+        return ContentFile(buffer.getvalue(), name='phone.jpg')
+
+    def create_product(self, **kwargs):
+        return Product.objects.create(
+            name='Phone', description='Desc', price=Decimal('10.00'),
+            category=self.category, vendor=self.vendor, **kwargs
+        )
+
+    def test_variants_are_resized_and_stripped(self):
+        #Test that each width gets a WebP and a JPEG copy without EXIF data
+        name = default_storage.save('product_photos/phone.jpg', self.photo())
+        variants = generate_variants(name)
+        self.assertEqual(sorted(variants), ['jpeg', 'webp'])
+        self.assertEqual(sorted(variants['webp'], key=int), ['160', '320', '640', '1024'])
+        with default_storage.open(variants['jpeg']['320']) as variant:
+            image = Image.open(variant)
+            self.assertEqual(image.size, (320, 213))
+            self.assertEqual(len(image.getexif()), 0)
+
+    def test_regenerated_variants_replace_the_files_in_place(self):
+        #Test that a second run keeps every variant name and never deletes one first
+        with tempfile.TemporaryDirectory() as location:
+            storage = FileSystemStorage(location=location)
+            name = storage.save('product_photos/phone.jpg', self.photo())
+            first = generate_variants(name, storage)
+            with mock.patch.object(storage, 'delete') as delete:
+                second = generate_variants(name, storage)
+            self.assertEqual(first, second)
+            delete.assert_not_called()
+            self.assertEqual(len(storage.listdir('product_photos/variants')[1]), 8)
+
+    def test_small_photos_are_not_upscaled(self):
+        #Test that only widths up to the original are generated
+        name = default_storage.save('product_photos/small.jpg', self.photo(200, 100))
+        self.assertEqual(sorted(generate_variants(name)['webp'], key=int), ['160', '200'])
+
+    def test_upload_queues_the_task_after_commit(self):
+        #Test that saving a new photo schedules the Celery task instead of resizing inline
+        with mock.patch('products.tasks.generate_product_image_variants.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                product = self.create_product(photo=self.photo())
+            delay.assert_called_once_with(product.pk, product.photo.name)
+
+            product = Product.objects.get(pk=product.pk)
+            product.name = 'Renamed'
+            with self.captureOnCommitCallbacks(execute=True):
+                product.save()
+            self.assertEqual(delay.call_count, 1)
+
+    def test_broker_outage_does_not_fail_the_save(self):
+        #Test that a failing dispatch is logged and the committed product is kept
+        with mock.patch('products.tasks.generate_product_image_variants.delay', side_effect=ConnectionError):
+            with self.assertLogs('products.signals', level='WARNING'):
+                with self.captureOnCommitCallbacks(execute=True):
+                    product = self.create_product(photo=self.photo())
+        self.assertTrue(Product.objects.filter(pk=product.pk).exists())
+
+    def test_task_attaches_variants_and_serializer_exposes_srcset(self):
+        #Test that the generated variants show up as srcset strings per format
+        with mock.patch('products.tasks.generate_product_image_variants.delay'):
+            product = self.create_product(photo=self.photo())
+        generate_product_image_variants(product.pk, product.photo.name)
+        product.refresh_from_db()
+
+        srcset = ProductSerializer(product).data['photo_variants']
+        self.assertEqual(sorted(srcset), ['jpeg', 'webp'])
+        self.assertTrue(srcset['webp'].endswith('1024w'))
+        self.assertIn('-160w.webp 160w, ', srcset['webp'])
+
+    def test_replaced_photo_discards_late_variants(self):
+        #Test that a task for an old photo doesn't overwrite the new one's variants
+        with mock.patch('products.tasks.generate_product_image_variants.delay'):
+            product = self.create_product(photo=self.photo())
+            old_name = product.photo.name
+            product.photo = self.photo()
+            product.save()
+        self.assertIsNone(generate_product_image_variants(product.pk, old_name))
+        product.refresh_from_db()
+        self.assertEqual(product.photo_variants, {})
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ProductFieldsetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vendor = Vendor.objects.create(
+                company_name='TestVendor', address='123 Street',
+                phone_number='1234567890', email='vendor@test.com'
+            )
+            self.category = Category.objects.create(name='Phones', vendor=self.vendor)
+            for i in range(3):
+                Product.objects.create(
+                    name=f'Product {i}', sku=f'SKU-{i}' if i else None, description='Long description',
+                    price=Decimal('19.99'), discount=Decimal('10'), quantity=i,
+                    category=self.category, vendor=self.vendor
+                )
+        self.user = get_user_model().objects.create_user(email='u@test.com', password='pass')
+
+    def get(self, query='', action='list', **kwargs):
+        request = APIRequestFactory().get(f'/api/vendors/{self.vendor.slug}/products/{query}')
+        force_authenticate(request, user=self.user)
+        response = ProductViewSet.as_view({'get': action})(request, vendor_slug=self.vendor.slug, **kwargs)
+        # Cached lists come back as pre-rendered bytes, everything else still needs rendering
+        return response.render() if hasattr(response, 'render') else response
+
+    def test_list_rows_match_the_model_serializer(self):
+        #Test that the values-based list renders products exactly like the detail view
+        results = json.loads(self.get().content)['results']
+        for row in results:
+            detail = self.get(action='retrieve', pk=row['id'])
+            self.assertEqual(row, json.loads(detail.content))
+        self.assertIsNone(results[-1]['sku'])
+        self.assertEqual(results[0]['category_detail']['name'], 'Phones')
+
+    def test_fields_and_omit_trim_the_output(self):
+        #Test that ?fields= keeps only the named fields and ?omit= drops them
+        results = json.loads(self.get('?fields=id,name').content)['results']
+        self.assertEqual([sorted(row) for row in results], [['id', 'name']] * 3)
+
+        row = json.loads(self.get('?omit=description,category_detail').content)['results'][0]
+        self.assertNotIn('description', row)
+        self.assertNotIn('category_detail', row)
+        self.assertIn('price', row)
+
+        detail = self.get('?fields=name,price', action='retrieve', pk=row['id'])
+        self.assertEqual(json.loads(detail.content), {'name': row['name'], 'price': row['price']})
+
+    def test_only_requested_columns_are_selected(self):
+        #Test that omitting nested fields drops the category join and unused columns
+        with self.assertNumQueries(4) as queries:
+            self.get('?cursor=&fields=id,name&count=false')
+        product_query = queries.captured_queries[0]['sql']
+        self.assertNotIn('products_category', product_query)
+        self.assertNotIn('description', product_query)
+
+    def test_unknown_fields_are_rejected(self):
+        #Test that a typo in ?fields= is a 400 instead of a full payload
+        response = self.get('?fields=name,prcie')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('prcie', json.loads(response.content)['fields'])
+
+    def test_sparse_lists_still_paginate(self):
+        #Test that the cursor works when the ordering columns aren't requested
+        data = json.loads(self.get('?cursor=&fields=name&page_size=2').content)
+        self.assertEqual(len(data['results']), 2)
+        query = '?' + data['next'].split('?', 1)[1]
+        self.assertEqual([row['name'] for row in json.loads(self.get(query).content)['results']], ['Product 0'])
+
+
+@override_settings(CACHES=LOCMEM_CACHES, STORAGES=IN_MEMORY_STORAGES)
+class CatalogSnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vendor = Vendor.objects.create(
+                company_name='TestVendor', address='123 Street',
+                phone_number='1234567890', email='vendor@test.com'
+            )
+            self.category = Category.objects.create(name='Phones', vendor=self.vendor)
+            self.products = [
+                Product.objects.create(
+                    name=f'Product {i}', description='Desc', price=Decimal('10.00'),
+                    category=self.category, vendor=self.vendor
+                )
+                for i in range(5)
+            ]
+        # The in-memory storage outlives a single test, start each one without snapshots
+        self.storage = get_snapshot_storage()
+        directory = f'catalog/{self.vendor.slug}'
+        if self.storage.exists(directory):
+            for name in self.storage.listdir(directory)[1]:
+                self.storage.delete(f'{directory}/{name}')
+
+    def read(self, name):
+        with self.storage.open(name, 'rb') as snapshot:
+            return snapshot.read()
+
+    def test_catalog_is_sharded_with_compressed_siblings(self):
+        #Test that products are split into shards listed by the manifest, each with .gz and .br copies
+        export_catalog_snapshot(self.vendor.slug, shard_size=2)
+        manifest = load_manifest(self.vendor.slug)
+        self.assertEqual(manifest['product_count'], 5)
+        self.assertEqual([shard['count'] for shard in manifest['shards']], [2, 2, 1])
+
+        path = manifest['shards'][0]['path']
+        body = self.read(path)
+        self.assertEqual(gzip.decompress(self.read(f'{path}.gz')), body)
+        self.assertEqual(brotli.decompress(self.read(f'{path}.br')), body)
+        self.assertEqual([product['name'] for product in json.loads(body)], ['Product 0', 'Product 1'])
+        self.assertEqual(json.loads(self.read(manifest['categories']['path']))[0]['name'], 'Phones')
+
+    def test_only_changed_shards_are_rewritten(self):
+        #Test that an unchanged catalog writes nothing and a change rewrites one shard
+        first = export_catalog_snapshot(self.vendor.slug, shard_size=2)
+        self.assertEqual(first['written'], 4)
+        self.assertEqual(export_catalog_snapshot(self.vendor.slug, shard_size=2)['written'], 0)
+
+        old_path = load_manifest(self.vendor.slug)['shards'][2]['path']
+        self.products[4].quantity = 7
+        self.products[4].save()
+        second = export_catalog_snapshot(self.vendor.slug, shard_size=2)
+        self.assertEqual(second['written'], 1)
+        self.assertNotEqual(second['version'], first['version'])
+
+        # Clients holding the previous manifest can still read its shards for one export
+        self.assertEqual(load_manifest(self.vendor.slug)['retired'], [old_path])
+        self.assertTrue(self.storage.exists(old_path))
+        self.products[4].quantity = 8
+        self.products[4].save()
+        export_catalog_snapshot(self.vendor.slug, shard_size=2)
+        self.assertFalse(self.storage.exists(old_path))
+
+    def test_snapshots_are_served_at_their_public_url(self):
+        #Test that snapshot_url() points at the route serving the snapshot storage, compressed when accepted
+        export_catalog_snapshot(self.vendor.slug, shard_size=2)
+        url = snapshot_url(self.vendor.slug)
+        self.assertEqual(url, f'/snapshots/catalog/{self.vendor.slug}/manifest.json')
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        manifest = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(manifest['product_count'], 5)
+
+        shard_name = manifest['shards'][0]['path'].split('/')[-1]
+        shard = self.client.get(snapshot_url(self.vendor.slug, shard_name), HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(shard['Content-Encoding'], 'br')
+        self.assertIn('immutable', shard['Cache-Control'])
+        self.assertEqual(len(json.loads(brotli.decompress(b''.join(shard.streaming_content)))), 2)
+        self.assertEqual(self.client.get('/snapshots/catalog/nobody/manifest.json').status_code, 404)
+
+    def test_manifest_is_replaced_without_a_delete(self):
+        #Test that re-exporting renames the new manifest over the old one on local storage
+        with tempfile.TemporaryDirectory() as location:
+            storage = FileSystemStorage(location=location)
+            with mock.patch('products.snapshots.get_snapshot_storage', return_value=storage):
+                export_catalog_snapshot(self.vendor.slug, shard_size=2)
+                Product.objects.filter(pk=self.products[0].pk).update(name='Renamed')
+                with mock.patch.object(storage, 'delete', wraps=storage.delete) as delete:
+                    export_catalog_snapshot(self.vendor.slug, shard_size=2)
+                manifest = load_manifest(self.vendor.slug, storage)
+            manifest_path = f'catalog/{self.vendor.slug}/manifest.json'
+            self.assertNotIn(manifest_path, [call.args[0] for call in delete.call_args_list])
+            files = storage.listdir(f'catalog/{self.vendor.slug}')[1]
+            self.assertEqual(sorted(name for name in files if name.startswith('manifest')), [
+                'manifest.json', 'manifest.json.br', 'manifest.json.gz'
+            ])
+            with storage.open(manifest['shards'][0]['path']) as shard:
+                self.assertEqual(json.load(shard)[0]['name'], 'Renamed')
+
+    def test_changes_queue_one_refresh_per_burst(self):
+        #Test that catalog changes of an exported vendor queue a single debounced export
+        with mock.patch('products.tasks.refresh_catalog_snapshot.apply_async') as apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.products[0].save()
+            apply_async.assert_not_called()
+
+            export_catalog_snapshot(self.vendor.slug)
+            for product in self.products[:2]:
+                with self.captureOnCommitCallbacks(execute=True):
+                    product.save()
+            apply_async.assert_called_once()
+            self.assertEqual(apply_async.call_args.args[0], (self.vendor.slug,))
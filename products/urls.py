@@ -20,6 +20,15 @@ product_list = ProductViewSet.as_view({
     'post': 'create'
 })
 
+product_search = ProductViewSet.as_view({
+    'get': 'search'
+})
+
+product_bulk = ProductViewSet.as_view({
+    'post': 'bulk_import',
+    'patch': 'bulk_partial_update'
+})
+
 product_detail = ProductViewSet.as_view({
     'get': 'retrieve',
     'put': 'update',
@@ -34,5 +43,7 @@ urlpatterns = [
     
     # Product endpoints
     path('vendors/<slug:vendor_slug>/products/', product_list, name='vendor-product-list'),
+    path('vendors/<slug:vendor_slug>/products/search/', product_search, name='vendor-product-search'),
+    path('vendors/<slug:vendor_slug>/products/bulk/', product_bulk, name='vendor-product-bulk'),
     path('vendors/<slug:vendor_slug>/products/<int:pk>/', product_detail, name='vendor-product-detail'),
 ]
\ No newline at end of file
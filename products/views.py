@@ -1,14 +1,24 @@
+from django.http import FileResponse, Http404
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import require_safe
 from rest_framework import viewsets, status
 from rest_framework.response import Response
 from .models import Category, Product
-from .serializers import CategorySerializer, ProductSerializer
-from django.shortcuts import get_object_or_404
-from accounts.models import Vendor, Membership
+from .serializers import CategorySerializer, ProductSerializer, ProductValuesSerializer, parse_fieldset
 from accounts.permissions import IsVendorAdminOrAgent
-from services.caching import caching, clear_vendor_cache
+from accounts.mixins import VendorResolverMixin
+from services.caching import caching, conditional_get
+from services.pagination import KeysetPagination, PageOrKeysetPagination
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.filters import OrderingFilter
+from .search import search_products
+from .facets import filter_products, get_product_facets
+from .importer import ImportFormatError, detect_format, import_products
+from .snapshots import SNAPSHOT_DIR, get_snapshot_storage
+from .bulk_update import MAX_BULK_UPDATE_ROWS, BulkUpdateError, bulk_update_products
 
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(VendorResolverMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [IsVendorAdminOrAgent]
@@ -21,17 +31,24 @@ class CategoryViewSet(viewsets.ModelViewSet):
             vendor__slug=self.kwargs['vendor_slug']
         )
     
+    @conditional_get("category", local=True)
     def list(self, request, *args, **kwargs):
-        return caching(self, request, "category", *args, **kwargs)
+        return caching(
+            self, request, "category", *args,
+            tiered=True, rendered=True, lock_timeout=10, stale_timeout=60, early_expiration=1.0, **kwargs
+        )
+
+    @conditional_get("category", local=True)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
     
     def perform_create(self, serializer):
         if getattr(self, 'swagger_fake_view', False):
             return serializer.save()
         
-        vendor = get_object_or_404(Vendor, slug=self.kwargs.get('vendor_slug'))
+        vendor = self.get_vendor()
+        # post_save invalidates the vendor's list cache once the request commits
         serializer.save(vendor=vendor)
-        # Clear cache after creation
-        clear_vendor_cache(vendor.slug, "category")
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -42,14 +59,31 @@ class CategoryViewSet(viewsets.ModelViewSet):
         if not slug:
             return context
         
-        context['vendor'] = get_object_or_404(Vendor, slug=slug)
+        context['vendor'] = self.get_vendor()
         return context
     
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(VendorResolverMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     permission_classes = [IsVendorAdminOrAgent]
+    pagination_class = PageOrKeysetPagination
+    # ?ordering=effective_price or -effective_price sorts by sale price, newest first otherwise
+    filter_backends = [OrderingFilter]
+    ordering_fields = ['effective_price', 'created_at']
+    ordering = KeysetPagination.ordering
+    # Actions whose output can be trimmed with ?fields= / ?omit=
+    sparse_actions = ('list', 'retrieve', 'search')
+
+    def get_fieldset(self):
+        if self.action not in self.sparse_actions:
+            return None
+        if not hasattr(self, '_fieldset'):
+            self._fieldset = parse_fieldset(self.request.query_params, ProductValuesSerializer.COLUMNS)
+        return self._fieldset
+
+    def uses_values(self):
+        return self.action == 'list' and not getattr(self, 'swagger_fake_view', False)
 
     def get_queryset(self):
         if getattr(self, 'swagger_fake_view', False):
@@ -58,21 +92,104 @@ class ProductViewSet(viewsets.ModelViewSet):
         vendor_slug = self.kwargs.get('vendor_slug')
         queryset = Product.objects.filter(vendor__slug=vendor_slug)
         
-        # Optional filtering by category
-        category_id = self.request.query_params.get('category')
-        if category_id:
-            queryset = queryset.filter(category_id=category_id)
+        # Optional filtering by category, price range, stock and discount
+        queryset = filter_products(queryset, self.request.query_params)
         
-        return queryset.select_related('category', 'vendor')
+        if self.uses_values():
+            # List pages are serialized from plain rows, selecting only the requested columns
+            return queryset.values(*ProductValuesSerializer.get_columns(self.get_fieldset(), self.ordering_fields))
+
+        # The search vector is only used inside WHERE clauses, don't ship it to Python
+        return queryset.select_related('category', 'vendor').defer('search_vector')
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fieldset', self.get_fieldset())
+        if self.uses_values():
+            kwargs.setdefault('context', self.get_serializer_context())
+            return ProductValuesSerializer(*args, **kwargs)
+        return super().get_serializer(*args, **kwargs)
     
+    @conditional_get("product", local=True)
     def list(self, request, *args, **kwargs):
-        return caching(self, request, "product", *args, **kwargs)
+        # Reject unknown ?fields= before the cache is consulted
+        self.get_fieldset()
+        return caching(
+            self, request, "product", *args,
+            tiered=True, rendered=True, lock_timeout=10, stale_timeout=60, early_expiration=1.0, **kwargs
+        )
+
+    @conditional_get("product", local=True)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        # Whole-catalog facet counts come from the cache, not from this page's query
+        response.data['facets'] = get_product_facets(self.kwargs['vendor_slug'])
+        return response
+
+    def search(self, request, *args, **kwargs):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response(
+                {"error": "The q parameter is required"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        queryset = search_products(self.filter_queryset(self.get_queryset()), query)
+        # Results are ordered by rank, which a created_at cursor can't page through
+        paginator = PageNumberPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
     
+    def bulk_import(self, request, *args, **kwargs):
+        vendor = self.get_vendor()
+
+        # Either a raw CSV/JSONL body or a multipart upload in the "file" field
+        upload = request.FILES.get('file') if request.content_type.startswith('multipart/') else None
+        try:
+            if upload is not None:
+                fmt = detect_format(upload.content_type, upload.name)
+                report = import_products(vendor, upload, fmt)
+            else:
+                fmt = detect_format(request.content_type)
+                report = import_products(vendor, request._request, fmt)
+        except ImportFormatError as e:
+            # rows written before the file broke are reported alongside the error
+            return Response(
+                {"error": str(e), **(e.report or {})},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return Response(report, status=status.HTTP_200_OK)
+
+    def bulk_partial_update(self, request, *args, **kwargs):
+        vendor = self.get_vendor()
+
+        rows = request.data
+        if not isinstance(rows, list) or not rows:
+            return Response(
+                {"error": "Expected a non-empty list of {id, price, discount, quantity} objects"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(rows) > MAX_BULK_UPDATE_ROWS:
+            return Response(
+                {"error": f"At most {MAX_BULK_UPDATE_ROWS} rows can be updated per request"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            result = bulk_update_products(vendor, rows)
+        except BulkUpdateError as e:
+            return Response({"errors": e.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(result, status=status.HTTP_200_OK)
+
     def perform_create(self, serializer):
-        vendor = get_object_or_404(Vendor, slug=self.kwargs['vendor_slug'])
+        vendor = self.get_vendor()
+        # post_save invalidates the vendor's list cache once the request commits
         serializer.save(vendor=vendor)
-        # Clear cache after creation
-        clear_vendor_cache(vendor.slug, "product")
 
 
     def get_serializer_context(self):
@@ -84,5 +201,32 @@ class ProductViewSet(viewsets.ModelViewSet):
         if not slug:
             return context
         
-        context['vendor'] = get_object_or_404(Vendor, slug=slug)
-        return context
\ No newline at end of file
+        context['vendor'] = self.get_vendor()
+        return context
+
+
+@require_safe
+def catalog_snapshot(request, path):
+    # Serves the snapshot storage at CATALOG_SNAPSHOT_URL, for local setups and as a CDN origin.
+    # The .br or .gz sibling is sent to clients that accept it
+    storage = get_snapshot_storage()
+    if not path.startswith(f"{SNAPSHOT_DIR}/") or not path.endswith(".json") or not storage.exists(path):
+        raise Http404("No catalog snapshot at this path.")
+
+    name, encoding = path, None
+    accepted = request.META.get("HTTP_ACCEPT_ENCODING", "")
+    for suffix, coding in ((".br", "br"), (".gz", "gzip")):
+        if coding in accepted and storage.exists(path + suffix):
+            name, encoding = path + suffix, coding
+            break
+
+    response = FileResponse(storage.open(name, "rb"), content_type="application/json")
+    if encoding:
+        response["Content-Encoding"] = encoding
+    patch_vary_headers(response, ("Accept-Encoding",))
+    if path.endswith("/manifest.json"):
+        # The manifest keeps its name across exports, everything it lists is content-hashed
+        patch_cache_control(response, public=True, max_age=60)
+    else:
+        patch_cache_control(response, public=True, max_age=60 * 60 * 24 * 365, immutable=True)
+    return response
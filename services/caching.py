@@ -1,10 +1,63 @@
 from django.core.cache import cache
+from django.db import transaction
+from django.dispatch import Signal, receiver
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
 from rest_framework.response import Response
+from .local_cache import local_cache
+from .metrics import registry, SIZE_BUCKETS
+from contextlib import contextmanager
+from functools import wraps
+from urllib.parse import urlencode
+import gzip
+import hashlib
 import logging
+import math
+import pickle
+import random
+import threading
+import time
+import uuid
 
 logger = logging.getLogger(__name__)
 
 DEFAULT_CACHE_TIMEOUT = 60 * 15
+DEFAULT_LOCK_TIMEOUT = 10
+
+# Rendered bodies smaller than this aren't worth gzipping
+MIN_COMPRESS_SIZE = 1024
+
+# Scope used for platform-wide listings that don't belong to a single vendor
+PLATFORM_SCOPE = "platform"
+
+# Sent by clear_vendor_cache with vendor_slug, what_to_cache and generation
+vendor_cache_invalidated = Signal()
+
+# Labelled by resource (what_to_cache) and cache tier, l1 being the
+# in-process LRU and l2 Redis. Vendor slugs are deliberately not a label,
+# one series per vendor would grow without bound.
+cache_requests = registry.counter(
+    "cache_requests_total", "Cache lookups by resource, tier and result (hit, miss, stale or waited)",
+    ("resource", "tier", "result"),
+)
+cache_lookup_seconds = registry.histogram(
+    "cache_lookup_seconds", "Time spent reading an entry from a cache tier", ("resource", "tier"),
+)
+cache_compute_seconds = registry.histogram(
+    "cache_compute_seconds", "Time spent building a list response on a cache miss", ("resource",),
+)
+cache_sets = registry.counter("cache_sets_total", "Entries written to the cache", ("resource",))
+cache_set_failures = registry.counter(
+    "cache_set_failures_total", "Cache writes that raised an error", ("resource",),
+)
+cache_invalidations = registry.counter(
+    "cache_invalidations_total", "Generation bumps, each orphaning every variant of a vendor list",
+    ("resource",),
+)
+cache_payload_bytes = registry.histogram(
+    "cache_payload_bytes", "Size of the data stored per cache entry", ("resource",), buckets=SIZE_BUCKETS,
+)
 
 
 def get_cache_key(what_to_cache, vendor_slug):
@@ -12,47 +65,577 @@ def get_cache_key(what_to_cache, vendor_slug):
     return f"{what_to_cache}_list:{vendor_slug}"
 
 
+def get_generation_key(what_to_cache, vendor_slug):
+    """Key of the generation counter embedded in every key for a vendor and data type"""
+    return f"{get_cache_key(what_to_cache, vendor_slug)}:gen"
+
+
+def get_generation(what_to_cache, vendor_slug, local=False):
+    """
+    Return the current cache generation for a vendor and data type.
+
+    Counters are seeded from the clock in milliseconds rather than 1, so a
+    counter that was evicted and re-created can't line up with the keys of an
+    older generation that are still waiting to expire. With `local=True` the
+    counter is also kept in the in-process cache for a few seconds, so a hit
+    in that tier doesn't need Redis at all.
+    """
+    generation_key = get_generation_key(what_to_cache, vendor_slug)
+    if local:
+        generation = local_cache.get(generation_key)
+        if generation is not None:
+            return generation
+
+    generation = cache.get(generation_key)
+    if generation is None:
+        cache.add(generation_key, int(time.time() * 1000), None)
+        generation = cache.get(generation_key)
+
+    if local and generation is not None:
+        local_cache.set(generation_key, generation)
+    return generation
+
+
+def bump_generation(what_to_cache, vendor_slug):
+    """Move a vendor and data type to a new generation, orphaning its cached keys"""
+    generation_key = get_generation_key(what_to_cache, vendor_slug)
+    cache.set(get_modified_key(what_to_cache, vendor_slug), math.ceil(time.time()), None)
+    try:
+        return cache.incr(generation_key)
+    except ValueError:
+        # Nothing has read the counter since it expired, start a fresh one
+        generation = int(time.time() * 1000)
+        cache.set(generation_key, generation, None)
+        return generation
+
+
+def get_modified_key(what_to_cache, vendor_slug):
+    """Key of the time a vendor and data type last changed, used for Last-Modified"""
+    return f"{get_cache_key(what_to_cache, vendor_slug)}:modified"
+
+
+def get_last_modified(what_to_cache, vendor_slug, local=False):
+    """
+    Return when a vendor and data type last changed, as a unix timestamp.
+
+    Recorded on every generation bump. When nothing was recorded yet the
+    current time is stored, which is safe: clients just refetch once.
+    """
+    modified_key = get_modified_key(what_to_cache, vendor_slug)
+    if local:
+        modified = local_cache.get(modified_key)
+        if modified is not None:
+            return modified
+
+    modified = cache.get(modified_key)
+    if modified is None:
+        cache.add(modified_key, math.ceil(time.time()), None)
+        modified = cache.get(modified_key)
+
+    if local and modified is not None:
+        local_cache.set(modified_key, modified)
+    return modified
+
+
+def get_versioned_key(what_to_cache, vendor_slug, suffix, local=False):
+    """Generate a cache key tied to the current generation of a vendor and data type"""
+    generation = get_generation(what_to_cache, vendor_slug, local=local)
+    return f"{get_cache_key(what_to_cache, vendor_slug)}:g{generation}:{suffix}"
+
+
+def normalize_query(request, paginator=None):
+    """
+    Build a stable representation of the request path, query params and page.
+
+    Params are sorted and empty values dropped so `?b=1&a=2` and `?a=2&b=1&c=`
+    share an entry. The page number and page size are always included, with
+    their defaults filled in, so `?page=1` and no page at all are the same page.
+    """
+    params = {}
+    for name, values in request.query_params.lists():
+        values = sorted(value for value in values if value != "")
+        if values:
+            params[name] = values
+
+    page, page_size = "1", None
+    if paginator is not None:
+        page_param = getattr(paginator, "page_query_param", None)
+        if page_param:
+            page = params.pop(page_param, [page])[-1]
+        size_param = getattr(paginator, "page_size_query_param", None)
+        if size_param:
+            params.pop(size_param, None)
+        if hasattr(paginator, "get_page_size"):
+            page_size = paginator.get_page_size(request)
+
+    query = urlencode(sorted(params.items()), doseq=True)
+    return f"{request.path}?{query}|page={page}|size={page_size}"
+
+
+def get_principal_scope(request, vendor_wide=False):
+    """
+    Describe which rows of a per-caller list the request is allowed to see.
+
+    Admin roles see the whole vendor and share one entry, everyone else gets
+    an entry of their own keyed by user id or guest session.
+    """
+    if vendor_wide:
+        return "vendor"
+    if request.user and request.user.is_authenticated:
+        return f"user:{request.user.pk}"
+    from cart.utilis import get_session_key
+    return f"session:{get_session_key(request)}"
+
+
+def get_variant_digest(request, paginator=None, scope=None):
+    """Hash the normalized request (and caller scope) into a short key suffix"""
+    variant = normalize_query(request, paginator)
+    if scope is not None:
+        # Hashed with the rest so session keys never show up in key names
+        variant = f"{variant}|scope={scope}"
+    return hashlib.sha256(variant.encode()).hexdigest()[:32]
+
+
+def get_variant_cache_key(request, what_to_cache, vendor_slug, paginator=None, scope=None, local=False):
+    """Generate the cache key for one page/filter variant of a vendor list"""
+    digest = get_variant_digest(request, paginator, scope)
+    return get_versioned_key(what_to_cache, vendor_slug, digest, local=local)
+
+
+def get_stale_key(what_to_cache, vendor_slug, digest):
+    """Key of the last good copy of a variant, kept outside the generation"""
+    return f"{get_cache_key(what_to_cache, vendor_slug)}:stale:{digest}"
+
+
 def clear_vendor_cache(vendor_slug, what_to_cache):
-    """Clear cache for a specific vendor and data type"""
+    """
+    Invalidate every cached variant for a specific vendor and data type.
+
+    This is a single INCR of the generation counter; keys from the old
+    generation are never read again and are left to expire.
+    """
     try:
-        cache_key = get_cache_key(what_to_cache, vendor_slug)
-        cache.delete(cache_key)
-        logger.info(f"Cleared cache: {cache_key}")
+        generation = bump_generation(what_to_cache, vendor_slug)
+        cache_invalidations.inc(resource=what_to_cache)
+        logger.info(f"Cleared cache: {get_cache_key(what_to_cache, vendor_slug)} (generation {generation})")
     except Exception as e:
         logger.warning(f"Failed to clear cache: {str(e)}")
+        generation = None
+
+    vendor_cache_invalidated.send(
+        sender=None, vendor_slug=vendor_slug, what_to_cache=what_to_cache, generation=generation
+    )
+
+
+class PendingInvalidations:
+    """The (vendor, resource) pairs to clear once the current transaction commits"""
+
+    def __init__(self):
+        self.keys = set()
+        self.done = False
+
+    def __call__(self):
+        self.done = True
+        keys, self.keys = self.keys, set()
+        for vendor_slug, what_to_cache in sorted(keys):
+            clear_vendor_cache(vendor_slug, what_to_cache)
+
 
+_invalidation_state = threading.local()
 
-def caching(viewset_instance, request, what_to_cache, *args, timeout=DEFAULT_CACHE_TIMEOUT, **kwargs):
+
+def _get_invalidation_state():
+    state = _invalidation_state
+    if not hasattr(state, "depth"):
+        state.depth = 0
+        state.suspended = set()
+        state.batch = None
+    return state
+
+
+def clear_vendor_cache_on_commit(vendor_slug, what_to_cache):
+    """
+    Invalidate a vendor and data type once, after the current transaction commits.
+
+    Repeated calls in one transaction are deduplicated by (vendor, resource)
+    and flushed by a single on_commit callback, so saving 5,000 products in
+    an atomic block costs one INCR. Outside a transaction this clears right
+    away, and inside coalesce_invalidations() it waits for the block to end.
+    """
+    key = (vendor_slug, what_to_cache)
+    state = _get_invalidation_state()
+    if state.depth:
+        state.suspended.add(key)
+        return
+
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        clear_vendor_cache(vendor_slug, what_to_cache)
+        return
+
+    # A batch whose callback was dropped by a rollback only holds rolled back changes, start over
+    batch = state.batch
+    if batch is None or batch.done or not any(entry[1] is batch for entry in connection.run_on_commit):
+        batch = state.batch = PendingInvalidations()
+        transaction.on_commit(batch)
+    batch.keys.add(key)
+
+
+@contextmanager
+def coalesce_invalidations():
+    """
+    Hold back cache invalidations during bulk work and flush each (vendor, resource) once.
+
+    The flush happens when the outermost block exits, even on error, since
+    rows written before the failure may already be committed.
+    """
+    state = _get_invalidation_state()
+    state.depth += 1
+    try:
+        yield
+    finally:
+        state.depth -= 1
+        if not state.depth:
+            keys, state.suspended = state.suspended, set()
+            for vendor_slug, what_to_cache in sorted(keys):
+                clear_vendor_cache_on_commit(vendor_slug, what_to_cache)
+
+
+@receiver(vendor_cache_invalidated)
+def clear_local_vendor_cache(sender, vendor_slug, what_to_cache, **kwargs):
+    """Drop this worker's in-process entries and generation for a vendor and data type"""
+    local_cache.delete_prefix(f"{get_cache_key(what_to_cache, vendor_slug)}:")
+
+
+def get_cache_stats():
+    """Return the hit/miss counts for each cache tier, summed over resources"""
+    return {
+        tier: {
+            "hits": cache_requests.total(tier=tier, result="hit"),
+            "misses": cache_requests.total(tier=tier, result="miss"),
+        }
+        for tier in ("l1", "l2")
+    }
+
+
+def _timed_get(what_to_cache, tier, getter, key):
+    """Read key from a cache tier, recording how long it took"""
+    started = time.monotonic()
+    try:
+        return getter(key)
+    finally:
+        cache_lookup_seconds.observe(time.monotonic() - started, resource=what_to_cache, tier=tier)
+
+
+def _count(what_to_cache, tier, result):
+    cache_requests.inc(resource=what_to_cache, tier=tier, result=result)
+
+
+def _payload_size(data, rendered):
+    """Approximate bytes an entry takes in Redis, the pickled data or the rendered body"""
+    if rendered:
+        return len(data["body"])
+    return len(pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
+
+
+def _make_entry(data, timeout, delta):
+    """Wrap cached data with its expiry and how long it took to compute"""
+    return {"data": data, "expires": time.time() + timeout, "delta": delta}
+
+
+def _is_entry(entry):
+    return isinstance(entry, dict) and "data" in entry and "expires" in entry
+
+
+def should_recompute_early(entry, beta):
+    """
+    Probabilistic early expiration (XFetch).
+
+    Each reader volunteers to refresh with a probability that grows as the
+    entry nears expiry and with how slow it was to compute, so a hot key is
+    usually refreshed by one request before it expires for everybody.
+    """
+    if not beta:
+        return False
+    jitter = entry["delta"] * beta * -math.log(1.0 - random.random())
+    return time.time() + jitter >= entry["expires"]
+
+
+def render_payload(request, response):
+    """
+    Render a list response once into JSON bytes ready to be served again.
+
+    Bodies over MIN_COMPRESS_SIZE are stored gzipped, which is also how most
+    clients want them. The ETag is taken from the uncompressed body.
+    """
+    renderer = request.accepted_renderer
+    # Rendered with the plain media type so Accept params like indent can't leak into a shared entry
+    body = renderer.render(response.data, renderer.media_type, {"request": request, "response": response})
+    etag = hashlib.sha256(body).hexdigest()[:32]
+    encoding = None
+    if len(body) >= MIN_COMPRESS_SIZE:
+        body, encoding = gzip.compress(body, compresslevel=6), "gzip"
+    content_type = renderer.media_type
+    if renderer.charset:
+        content_type = f"{content_type}; charset={renderer.charset}"
+    return {"body": body, "encoding": encoding, "content_type": content_type, "etag": etag}
+
+
+def payload_response(request, payload):
+    """Serve a rendered payload as-is, decompressing only for clients without gzip"""
+    body, encoding, etag = payload["body"], payload["encoding"], payload["etag"]
+    if encoding == "gzip":
+        if "gzip" in request.META.get("HTTP_ACCEPT_ENCODING", ""):
+            etag = f"{etag}-gzip"
+        else:
+            body, encoding = gzip.decompress(body), None
+
+    response = HttpResponse(body, content_type=payload["content_type"])
+    if encoding:
+        response["Content-Encoding"] = encoding
+    response["ETag"] = f'"{etag}"'
+    patch_vary_headers(response, ("Accept-Encoding",))
+    return response
+
+
+def _to_response(request, data, rendered):
+    if rendered:
+        return payload_response(request, data)
+    return Response(data)
+
+
+def _to_stale_response(request, data, rendered):
+    """
+    A copy kept from before the last invalidation, marked so conditional_get
+    leaves it without the current generation's validators and clients
+    revalidate instead of holding on to it.
+    """
+    response = _to_response(request, data, rendered)
+    if response.has_header("ETag"):
+        del response["ETag"]
+    response.serves_stale = True
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def get_etag(request, what_to_cache, vendor_slug, local=False):
+    """
+    Build a strong ETag from the vendor's cache generation and the request variant.
+
+    It changes whenever the vendor's data is invalidated, and differs per
+    path/query, renderer and content coding, so no two byte sequences served
+    for a URL share a tag.
+    """
+    generation = get_generation(what_to_cache, vendor_slug, local=local)
+    renderer = getattr(getattr(request, "accepted_renderer", None), "format", "")
+    variant = hashlib.sha256(f"{normalize_query(request)}|{renderer}".encode()).hexdigest()[:16]
+    coding = "-gzip" if "gzip" in request.META.get("HTTP_ACCEPT_ENCODING", "") else ""
+    return quote_etag(f"{what_to_cache}-{generation}-{variant}{coding}")
+
+
+def conditional_get(what_to_cache, local=False):
+    """
+    Decorate a viewset method to answer conditional GETs with 304 Not Modified.
+
+    If-None-Match and If-Modified-Since are checked against validators read
+    from the cache (the vendor generation and its last change time), so an
+    unchanged resource is answered before any queryset or serializer runs.
+    """
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(viewset_instance, request, *args, **kwargs):
+            vendor_slug = viewset_instance.kwargs.get("vendor_slug")
+            if request.method not in ("GET", "HEAD") or not vendor_slug:
+                return view_method(viewset_instance, request, *args, **kwargs)
+
+            try:
+                etag = get_etag(request, what_to_cache, vendor_slug, local=local)
+                last_modified = get_last_modified(what_to_cache, vendor_slug, local=local)
+            except Exception as e:
+                logger.warning(f"Cache validators unavailable: {str(e)}")
+                return view_method(viewset_instance, request, *args, **kwargs)
+
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = view_method(viewset_instance, request, *args, **kwargs)
+
+            # A stale body would otherwise be tagged as the new generation and get 304s later
+            if response.status_code in (200, 304) and not getattr(response, "serves_stale", False):
+                response["ETag"] = etag
+                response["Last-Modified"] = http_date(last_modified)
+                patch_vary_headers(response, ("Accept-Encoding",))
+            return response
+        return wrapper
+    return decorator
+
+
+def acquire_lock(lock_key, lock_timeout):
+    """Take a short-lived Redis lock, returning its token or None if already held"""
+    token = uuid.uuid4().hex
+    if cache.add(lock_key, token, lock_timeout):
+        return token
+    return None
+
+
+def release_lock(lock_key, token):
+    """Release a lock taken with acquire_lock, unless it expired and changed hands"""
+    if cache.get(lock_key) == token:
+        cache.delete(lock_key)
+
+
+def wait_for_entry(cache_key, lock_key, lock_timeout, poll_interval=0.05):
+    """Wait for the lock holder to fill cache_key, giving up when the lock goes away"""
+    deadline = time.monotonic() + lock_timeout
+    while time.monotonic() < deadline:
+        time.sleep(poll_interval)
+        entry = cache.get(cache_key)
+        if _is_entry(entry):
+            return entry
+        if cache.get(lock_key) is None:
+            break
+    return None
+
+
+def caching(
+    viewset_instance, request, what_to_cache, *args,
+    timeout=DEFAULT_CACHE_TIMEOUT, scope=None, tiered=False, rendered=False,
+    lock_timeout=0, stale_timeout=0, early_expiration=0, **kwargs
+):
     """
     Cache the list response for a viewset.
+
+    Each combination of path, query params, page and page size is cached
+    under its own key, so filtered and paginated listings are safe to cache.
+    Lists whose rows depend on the caller must pass a `scope`, usually from
+    get_principal_scope(), so callers never see each other's entries.
+    With `tiered=True` entries are also kept in a small per-worker LRU in
+    front of Redis, which suits hot public reads like the vendor catalog.
+    With `rendered=True` the final JSON bytes are cached instead of
+    `response.data`, so a hit is served without unpickling nested data or
+    running the DRF renderer again.
+
+    Stampede protection is opt-in per call site:
+    - `lock_timeout`: on a miss only the worker holding a Redis lock runs the
+      query, the others wait up to this many seconds for its result.
+    - `stale_timeout`: keep the previous value this many seconds past its
+      expiry or invalidation and serve it while the lock holder refreshes.
+    - `early_expiration`: XFetch beta, refresh hot entries shortly before
+      they expire. 1.0 is a good default, 0 disables it.
     """
     from rest_framework import viewsets
     vendor_slug = viewset_instance.kwargs.get("vendor_slug")
-    
+
+    def compute():
+        started = time.monotonic()
+        response = viewsets.ModelViewSet.list(viewset_instance, request, *args, **kwargs)
+        delta = time.monotonic() - started
+        cache_compute_seconds.observe(delta, resource=what_to_cache)
+        return response, delta
+
     if not vendor_slug:
         # If no vendor_slug, don't cache - just return normal list response
-        return viewsets.ModelViewSet.list(viewset_instance, request, *args, **kwargs)
-    
-    cache_key = get_cache_key(what_to_cache, vendor_slug)
-    
+        return compute()[0]
+
+    if rendered and getattr(getattr(request, "accepted_renderer", None), "format", None) != "json":
+        # Only JSON bodies are cached pre-rendered, the browsable API is rendered per request
+        return compute()[0]
+
+    keys = None
+
     # Try to get from cache
     try:
-        cached = cache.get(cache_key)
-        if cached is not None:
+        digest = get_variant_digest(request, viewset_instance.paginator, scope)
+        cache_key = get_versioned_key(what_to_cache, vendor_slug, digest, local=tiered)
+        stale_key = get_stale_key(what_to_cache, vendor_slug, digest) if stale_timeout else None
+        lock_key = f"{cache_key}:lock"
+        keys = (cache_key, stale_key)
+
+        if tiered:
+            cached = _timed_get(what_to_cache, "l1", local_cache.get, cache_key)
+            if cached is not None:
+                _count(what_to_cache, "l1", "hit")
+                logger.debug(f"Local cache hit: {cache_key}")
+                return _to_response(request, cached, rendered)
+            _count(what_to_cache, "l1", "miss")
+
+        entry = _timed_get(what_to_cache, "l2", cache.get, cache_key)
+        if _is_entry(entry):
+            _count(what_to_cache, "l2", "hit")
+            if should_recompute_early(entry, early_expiration):
+                token = acquire_lock(lock_key, lock_timeout or DEFAULT_LOCK_TIMEOUT)
+                if token:
+                    logger.debug(f"Early recompute: {cache_key}")
+                    return _refresh(
+                        request, what_to_cache, compute, keys, timeout, stale_timeout, tiered, rendered,
+                        lock=(lock_key, token),
+                    )
             logger.debug(f"Cache hit: {cache_key}")
-            return Response(cached)
+            if tiered:
+                local_cache.set(cache_key, entry["data"])
+            return _to_response(request, entry["data"], rendered)
+        _count(what_to_cache, "l2", "miss")
+
+        if lock_timeout:
+            token = acquire_lock(lock_key, lock_timeout)
+            if token:
+                return _refresh(
+                    request, what_to_cache, compute, keys, timeout, stale_timeout, tiered, rendered,
+                    lock=(lock_key, token),
+                )
+
+            # Another worker is already recomputing: serve the stale copy or wait for theirs
+            entry = cache.get(stale_key) if stale_key else None
+            if _is_entry(entry):
+                _count(what_to_cache, "l2", "stale")
+                logger.debug(f"Served stale while another worker refreshes: {cache_key}")
+                return _to_stale_response(request, entry["data"], rendered)
+            entry = wait_for_entry(cache_key, lock_key, lock_timeout)
+            if _is_entry(entry):
+                # The lock holder's fresh result, only later than a plain hit
+                _count(what_to_cache, "l2", "waited")
+                logger.debug(f"Served after another worker refreshed: {cache_key}")
+                return _to_response(request, entry["data"], rendered)
     except Exception as e:
         logger.warning(f"Cache retrieval failed: {str(e)}")
-    
+
     # Cache miss - get fresh data
-    response = viewsets.ModelViewSet.list(viewset_instance, request, *args, **kwargs)
-    
-    # Store in cache
+    if keys is None:
+        return compute()[0]
+    return _refresh(request, what_to_cache, compute, keys, timeout, stale_timeout, tiered, rendered)
+
+
+def _refresh(request, what_to_cache, compute, keys, timeout, stale_timeout, tiered, rendered, lock=None):
+    """Run the list view and store its result, then release the lock if one is held"""
+    cache_key, stale_key = keys
     try:
-        if response.status_code == 200:
-            cache.set(cache_key, response.data, timeout)
+        response, delta = compute()
+        if response.status_code != 200:
+            return response
+
+        data = response.data
+        if rendered:
+            data = render_payload(request, response)
+            response = payload_response(request, data)
+
+        # Store in cache
+        try:
+            entry = _make_entry(data, timeout, delta)
+            cache.set(cache_key, entry, timeout)
+            if stale_key:
+                cache.set(stale_key, entry, timeout + stale_timeout)
+            if tiered:
+                local_cache.set(cache_key, data)
+            cache_sets.inc(resource=what_to_cache)
+            cache_payload_bytes.observe(_payload_size(data, rendered), resource=what_to_cache)
             logger.debug(f"Cache set: {cache_key}")
-    except Exception as e:
-        logger.warning(f"Cache storage failed: {str(e)}")
-    
-    return response
\ No newline at end of file
+        except Exception as e:
+            cache_set_failures.inc(resource=what_to_cache)
+            logger.warning(f"Cache storage failed: {str(e)}")
+
+        return response
+    finally:
+        if lock:
+            try:
+                release_lock(*lock)
+            except Exception as e:
+                logger.warning(f"Cache lock release failed: {str(e)}")
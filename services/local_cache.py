@@ -0,0 +1,64 @@
+from collections import OrderedDict
+from django.conf import settings
+import threading
+import time
+
+DEFAULT_LOCAL_CACHE_MAX_ENTRIES = 1024
+DEFAULT_LOCAL_CACHE_TIMEOUT = 5
+
+
+class LocalLRUCache:
+    """
+    Small in-process LRU cache with a short per-entry expiry.
+
+    Each gunicorn worker gets its own copy, so the timeout bounds how long a
+    worker can keep serving an entry after another worker invalidated it.
+    """
+
+    def __init__(self, max_entries=None, timeout=None):
+        self.max_entries = max_entries or getattr(
+            settings, "LOCAL_CACHE_MAX_ENTRIES", DEFAULT_LOCAL_CACHE_MAX_ENTRIES
+        )
+        self.timeout = timeout or getattr(settings, "LOCAL_CACHE_TIMEOUT", DEFAULT_LOCAL_CACHE_TIMEOUT)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        expires_at = time.monotonic() + (timeout or self.timeout)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_prefix(self, prefix):
+        """Drop every entry whose key starts with prefix"""
+        with self._lock:
+            for key in [key for key in self._data if key.startswith(prefix)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+local_cache = LocalLRUCache()
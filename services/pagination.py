@@ -0,0 +1,88 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination over (created_at, id), newest first.
+
+    Each page is a `WHERE created_at < cursor ... LIMIT n` range scan on the
+    (vendor, created_at, id) indexes, so page 500 costs the same as page 1.
+    The total count is still included by default for existing clients, pass
+    `?count=false` to skip the COUNT(*) as well.
+    """
+
+    ordering = ("-created_at", "-id")
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    count_query_param = "count"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = queryset.count() if self.should_count(request) else None
+        return super().paginate_queryset(queryset, request, view)
+
+    def should_count(self, request):
+        return request.query_params.get(self.count_query_param, "").lower() not in ("0", "false", "no")
+
+    def get_paginated_response(self, data):
+        payload = {}
+        if self.count is not None:
+            payload["count"] = self.count
+        payload["next"] = self.get_next_link()
+        payload["previous"] = self.get_previous_link()
+        payload["results"] = data
+        return Response(payload)
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema["properties"] = {
+            "count": {"type": "integer", "example": 123},
+            **response_schema["properties"],
+        }
+        return response_schema
+
+
+class PageOrKeysetPagination(PageNumberPagination):
+    """
+    Page numbers by default, keyset cursors for clients that opt in.
+
+    `?page=N` works as it always has, with the total `count`. Sending
+    `?cursor=` (empty for the first page) switches the request to
+    KeysetPagination, whose next/previous links carry the cursor on, so deep
+    pages become range seeks. Both modes list newest first.
+    """
+
+    cursor_query_param = KeysetPagination.cursor_query_param
+    keyset = None
+
+    def uses_cursor(self, request):
+        return self.cursor_query_param in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.uses_cursor(request):
+            self.keyset = None
+            if not queryset.ordered:
+                queryset = queryset.order_by(*KeysetPagination.ordering)
+            return super().paginate_queryset(queryset, request, view)
+
+        if self.page_query_param in request.query_params:
+            raise ValidationError({self.page_query_param: ["Send either page or cursor, not both."]})
+        self.keyset = KeysetPagination()
+        return self.keyset.paginate_queryset(queryset, request, view)
+
+    def should_count(self, request):
+        return not self.uses_cursor(request) or KeysetPagination().should_count(request)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_schema_operation_parameters(self, view):
+        parameters = super().get_schema_operation_parameters(view)
+        names = {parameter["name"] for parameter in parameters}
+        return parameters + [
+            parameter for parameter in KeysetPagination().get_schema_operation_parameters(view)
+            if parameter["name"] not in names
+        ]
@@ -0,0 +1,23 @@
+import os
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+
+
+def replace_file(storage, name, content):
+    """
+    Save bytes under a name, over an existing file without a moment where it's missing.
+
+    Storages that overwrite on save, like S3 with file_overwrite, replace
+    the object in one PUT. Local storages get a temporary file renamed over
+    the old one. Anything else falls back to delete and save. Returns the
+    name the file was stored under.
+    """
+    if not storage.exists(name) or storage.get_available_name(name) == name:
+        return storage.save(name, ContentFile(content))
+    if isinstance(storage, FileSystemStorage):
+        temporary = storage.save(f'{name}.tmp', ContentFile(content))
+        os.replace(storage.path(temporary), storage.path(name))
+        return name
+    storage.delete(name)
+    return storage.save(name, ContentFile(content))
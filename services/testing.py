@@ -0,0 +1,9 @@
+# Settings overrides shared by the apps' test modules
+
+# Caching tests run against an in-process cache instead of the Redis server in CACHES
+LOCMEM_CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "tests",
+    }
+}
@@ -0,0 +1,477 @@
+from decimal import Decimal
+import gzip
+import json
+from unittest import mock
+import time
+from urllib.parse import urlsplit
+from django.core.cache import cache
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from accounts.models import Vendor
+from products.models import Category, Product
+from products.views import ProductViewSet
+from .caching import (
+    clear_vendor_cache, clear_vendor_cache_on_commit, coalesce_invalidations, get_cache_stats, get_generation,
+    get_variant_cache_key, get_versioned_key, should_recompute_early,
+)
+from .local_cache import LocalLRUCache, local_cache
+from .metrics import MetricsRegistry, registry
+from .testing import LOCMEM_CACHES
+
+User = get_user_model()
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class VendorCatalogTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        self.factory = APIRequestFactory()
+        self.user = User.objects.create_user(email='user@example.com', password='pass')
+        # Flush the fixtures' invalidations so each test starts without a pending batch
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vendor = Vendor.objects.create(
+                company_name='TestVendor', address='123 Street',
+                phone_number='1234567890', email='vendor@test.com'
+            )
+            self.phones = Category.objects.create(name='Phones', vendor=self.vendor)
+            self.laptops = Category.objects.create(name='Laptops', vendor=self.vendor)
+            for i in range(25):
+                Product.objects.create(
+                    name=f'Product {i}', description='Desc', price=Decimal('10.00'),
+                    category=self.phones if i % 2 else self.laptops, vendor=self.vendor
+                )
+        self.view = ProductViewSet.as_view({'get': 'list'})
+
+    def get(self, query=''):
+        request = self.factory.get(f'/api/vendors/{self.vendor.slug}/products/{query}')
+        force_authenticate(request, user=self.user)
+        return self.view(request, vendor_slug=self.vendor.slug)
+
+    def get_json(self, query=''):
+        return json.loads(self.get(query).content)
+
+    def next_query(self, data=None):
+        """Query string of the next page, following the cursor from page 1 by default"""
+        data = data or self.get_json()
+        return '?' + urlsplit(data['next']).query
+
+
+class ListCachingTests(VendorCatalogTestCase):
+    def test_pages_and_filters_are_cached_separately(self):
+        #Test that page 2 and category filters don't get page 1 back
+        first = self.get_json()
+        second = self.get_json(self.next_query(first))
+        filtered = self.get_json(f'?category={self.phones.id}')
+        self.assertEqual(len(first['results']), 20)
+        self.assertEqual(len(second['results']), 5)
+        self.assertEqual(filtered['count'], 12)
+        # Served again from cache with the same content
+        self.assertEqual(self.get_json(self.next_query(first)), second)
+
+    def test_equivalent_queries_share_a_key(self):
+        #Test that param order, empty params and default page normalize to one key
+        paginator = PageNumberPagination()
+        keys = set()
+        for query in ['?a=1&b=2', '?b=2&a=1', '?b=2&a=1&c=', '?a=1&b=2&page=1']:
+            request = Request(self.factory.get(f'/api/vendors/x/products/{query}'))
+            keys.add(get_variant_cache_key(request, 'product', 'x', paginator))
+        self.assertEqual(len(keys), 1)
+
+    def test_clear_vendor_cache_drops_every_variant(self):
+        #Test that one clear invalidates all cached pages and filters
+        page_two = self.next_query()
+        self.get(page_two)
+        Product.objects.filter(vendor=self.vendor).update(name='Renamed')
+        clear_vendor_cache(self.vendor.slug, 'product')
+        self.assertEqual(self.get_json()['results'][0]['name'], 'Renamed')
+        self.assertEqual(self.get_json(page_two)['results'][0]['name'], 'Renamed')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class GenerationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+
+    def test_clear_moves_to_a_new_generation(self):
+        #Test that invalidation is a counter bump and old keys are left alone
+        old_key = get_versioned_key('product', 'acme', 'page-1')
+        cache.set(old_key, ['stale'])
+        generation = get_generation('product', 'acme')
+        clear_vendor_cache('acme', 'product')
+        self.assertEqual(get_generation('product', 'acme'), generation + 1)
+        self.assertNotEqual(get_versioned_key('product', 'acme', 'page-1'), old_key)
+        self.assertEqual(cache.get(old_key), ['stale'])
+
+    def test_generations_are_per_vendor_and_resource(self):
+        #Test that bumping one vendor/resource leaves the others untouched
+        product_key = get_versioned_key('product', 'acme', 'x')
+        category_key = get_versioned_key('category', 'acme', 'x')
+        other_key = get_versioned_key('product', 'other', 'x')
+        clear_vendor_cache('acme', 'product')
+        self.assertNotEqual(get_versioned_key('product', 'acme', 'x'), product_key)
+        self.assertEqual(get_versioned_key('category', 'acme', 'x'), category_key)
+        self.assertEqual(get_versioned_key('product', 'other', 'x'), other_key)
+
+    def test_clear_without_existing_counter(self):
+        #Test that clearing a vendor that was never cached starts a generation
+        clear_vendor_cache('fresh', 'product')
+        self.assertIsNotNone(get_generation('product', 'fresh'))
+
+
+class LocalLRUCacheTests(TestCase):
+    def test_evicts_least_recently_used(self):
+        #Test that the cache stays within its size bound
+        lru = LocalLRUCache(max_entries=2, timeout=60)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        self.assertEqual(len(lru), 2)
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual(lru.get('a'), 1)
+
+    def test_entries_expire(self):
+        #Test that entries are dropped after their timeout
+        lru = LocalLRUCache(max_entries=2, timeout=60)
+        lru.set('a', 1, timeout=0.01)
+        time.sleep(0.02)
+        self.assertIsNone(lru.get('a'))
+
+
+class TieredCachingTests(VendorCatalogTestCase):
+    def test_repeat_reads_are_served_from_the_local_tier(self):
+        #Test that a second read hits L1 and skips Redis
+        self.get()
+        before = get_cache_stats()
+        self.get()
+        after = get_cache_stats()
+        self.assertEqual(after['l1']['hits'], before['l1']['hits'] + 1)
+        self.assertEqual(after['l2'], before['l2'])
+
+    def test_invalidation_signal_clears_the_local_tier(self):
+        #Test that clear_vendor_cache drops this worker's L1 entries
+        self.get()
+        self.assertTrue(len(local_cache))
+        clear_vendor_cache(self.vendor.slug, 'product')
+        self.assertFalse(any(key.startswith(f'product_list:{self.vendor.slug}:') for key in local_cache._data))
+
+
+class StampedeProtectionTests(VendorCatalogTestCase):
+    def test_stale_copy_is_served_while_another_worker_refreshes(self):
+        #Test that an invalidated list is served stale while the lock is held elsewhere
+        self.get()
+        Product.objects.filter(vendor=self.vendor).update(name='Renamed')
+        clear_vendor_cache(self.vendor.slug, 'product')
+        with mock.patch('services.caching.acquire_lock', return_value=None):
+            stale = self.get_json()
+        self.assertEqual(stale['results'][0]['name'], 'Product 24')
+        # Once the lock is free the next request refreshes the entry
+        self.assertEqual(self.get_json()['results'][0]['name'], 'Renamed')
+
+    def test_stale_copy_carries_no_validators(self):
+        #Test that a stale body isn't tagged with the new generation's ETag, so clients don't keep it
+        self.get()
+        Product.objects.filter(vendor=self.vendor).update(name='Renamed')
+        clear_vendor_cache(self.vendor.slug, 'product')
+        with mock.patch('services.caching.acquire_lock', return_value=None):
+            stale = self.get()
+        self.assertNotIn('ETag', stale)
+        self.assertNotIn('Last-Modified', stale)
+        self.assertIn('no-cache', stale['Cache-Control'])
+
+        fresh = self.get()
+        request = self.factory.get(f'/api/vendors/{self.vendor.slug}/products/', HTTP_IF_NONE_MATCH=fresh['ETag'])
+        force_authenticate(request, user=self.user)
+        self.assertEqual(self.view(request, vendor_slug=self.vendor.slug).status_code, 304)
+
+    def test_stale_and_waited_reads_are_counted_apart(self):
+        #Test that only the stale copy counts as stale, a result waited for from the lock holder doesn't
+        registry.reset()
+        self.get()
+        clear_vendor_cache(self.vendor.slug, 'product')
+        fresh = {'data': self.get_json('?page=2'), 'expires': time.time() + 60, 'delta': 0.1}
+        with mock.patch('services.caching.acquire_lock', return_value=None):
+            self.get()
+            with mock.patch('services.caching.wait_for_entry', return_value=fresh) as wait:
+                self.get('?category=1')
+        wait.assert_called_once()
+        counter = registry.get('cache_requests_total')
+        self.assertEqual(counter.value(resource='product', tier='l2', result='stale'), 1)
+        self.assertEqual(counter.value(resource='product', tier='l2', result='waited'), 1)
+
+    def test_lock_holder_recomputes_on_miss(self):
+        #Test that the worker taking the lock computes and releases it
+        with mock.patch('services.caching.release_lock') as release:
+            self.assertEqual(self.get().status_code, 200)
+        self.assertTrue(release.called)
+
+    def test_early_expiration(self):
+        #Test that XFetch refreshes near expiry and never when disabled
+        now = time.time()
+        expiring = {'data': [], 'expires': now - 1, 'delta': 0.5}
+        fresh = {'data': [], 'expires': now + 3600, 'delta': 0.001}
+        self.assertTrue(should_recompute_early(expiring, 1.0))
+        self.assertFalse(should_recompute_early(fresh, 1.0))
+        self.assertFalse(should_recompute_early(expiring, 0))
+
+
+class RenderedCachingTests(VendorCatalogTestCase):
+    def test_hits_are_served_as_prerendered_bytes(self):
+        #Test that a cache hit returns the same JSON bytes without re-rendering
+        first = self.get()
+        second = self.get()
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(second['Content-Type'], 'application/json')
+        self.assertEqual(first['ETag'], second['ETag'])
+        self.assertEqual(json.loads(second.content)['count'], 25)
+
+    def test_gzip_clients_get_the_stored_compressed_body(self):
+        #Test that compressed bodies are passed through to clients accepting gzip
+        plain = self.get()
+        request = self.factory.get(f'/api/vendors/{self.vendor.slug}/products/', HTTP_ACCEPT_ENCODING='gzip, br')
+        force_authenticate(request, user=self.user)
+        compressed = self.view(request, vendor_slug=self.vendor.slug)
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        self.assertIn('Accept-Encoding', compressed['Vary'])
+
+
+class ConditionalGetTests(VendorCatalogTestCase):
+    def conditional_get(self, path='', **headers):
+        request = self.factory.get(f'/api/vendors/{self.vendor.slug}/products/{path}', **headers)
+        force_authenticate(request, user=self.user)
+        if path:
+            view = ProductViewSet.as_view({'get': 'retrieve'})
+            return view(request, vendor_slug=self.vendor.slug, pk=int(path.strip('/')))
+        return self.view(request, vendor_slug=self.vendor.slug)
+
+    def test_matching_etag_returns_304_without_queries(self):
+        #Test that If-None-Match short-circuits before any database work
+        etag = self.get()['ETag']
+        with self.assertNumQueries(0):
+            response = self.conditional_get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_etag_changes_when_products_change(self):
+        #Test that a product save moves the ETag and returns the full list
+        etag = self.get()['ETag']
+        product = Product.objects.filter(vendor=self.vendor).first()
+        product.name = 'Changed'
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        response = self.conditional_get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_differs_per_page(self):
+        #Test that each page/filter variant gets its own validator
+        self.assertNotEqual(self.get()['ETag'], self.get(self.next_query())['ETag'])
+
+    def test_if_modified_since(self):
+        #Test that If-Modified-Since gets a 304 until the vendor's products change
+        last_modified = self.get()['Last-Modified']
+        response = self.conditional_get(HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_detail_route(self):
+        #Test that vendor-product-detail supports conditional GETs too
+        product = Product.objects.filter(vendor=self.vendor).first()
+        first = self.conditional_get(f'{product.pk}/')
+        self.assertEqual(first.status_code, 200)
+        with self.assertNumQueries(0):
+            second = self.conditional_get(f'{product.pk}/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 304)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class DeferredInvalidationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        # Flush the fixtures' invalidations so each test starts without a pending batch
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vendor = Vendor.objects.create(
+                company_name='TestVendor', address='123 Street',
+                phone_number='1234567890', email='vendor@test.com'
+            )
+            self.category = Category.objects.create(name='Phones', vendor=self.vendor)
+        self.generation = get_generation('product', self.vendor.slug)
+
+    def create_products(self, count):
+        for i in range(count):
+            Product.objects.create(
+                name=f'Product {i}', description='Desc', price=Decimal('10.00'),
+                category=self.category, vendor=self.vendor
+            )
+
+    def test_saves_in_a_transaction_flush_once_on_commit(self):
+        #Test that many saves produce one on_commit callback and one generation bump
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.create_products(20)
+            self.assertEqual(get_generation('product', self.vendor.slug), self.generation)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(get_generation('product', self.vendor.slug), self.generation + 1)
+
+    def test_pairs_are_deduplicated_per_vendor_and_resource(self):
+        #Test that each (vendor, resource) is cleared once per transaction
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(3):
+                clear_vendor_cache_on_commit(self.vendor.slug, 'product')
+                clear_vendor_cache_on_commit(self.vendor.slug, 'category')
+        self.assertEqual(get_generation('product', self.vendor.slug), self.generation + 1)
+
+    def test_rolled_back_savepoint_does_not_leak_into_the_next_batch(self):
+        #Test that a batch dropped by a rollback is replaced by a fresh one
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    clear_vendor_cache_on_commit(self.vendor.slug, 'product')
+                    raise ValueError
+            except ValueError:
+                pass
+            clear_vendor_cache_on_commit(self.vendor.slug, 'category')
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(get_generation('product', self.vendor.slug), self.generation)
+
+    def test_coalesce_invalidations_holds_back_until_the_block_ends(self):
+        #Test that bulk work inside the context manager is flushed once at the end
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with coalesce_invalidations():
+                self.create_products(10)
+                with coalesce_invalidations():
+                    self.create_products(5)
+                self.assertEqual(len(callbacks), 0)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(get_generation('product', self.vendor.slug), self.generation + 1)
+
+
+class MetricsRegistryTests(SimpleTestCase):
+    def test_counters_render_one_series_per_label_set(self):
+        #Test that counters are exported in the Prometheus text format
+        metrics = MetricsRegistry()
+        hits = metrics.counter('hits_total', 'Hits', ('resource',))
+        hits.inc(resource='product')
+        hits.inc(2, resource='product')
+        hits.inc(resource='category')
+        text = metrics.render()
+        self.assertIn('# TYPE hits_total counter', text)
+        self.assertIn('hits_total{resource="product"} 3', text)
+        self.assertIn('hits_total{resource="category"} 1', text)
+
+    def test_histograms_render_cumulative_buckets(self):
+        #Test that histogram buckets are cumulative and end with +Inf, _sum and _count
+        metrics = MetricsRegistry()
+        latency = metrics.histogram('latency_seconds', 'Latency', buckets=(0.1, 1))
+        for value in (0.05, 0.5, 5):
+            latency.observe(value)
+        text = metrics.render()
+        self.assertIn('latency_seconds_bucket{le="0.1"} 1', text)
+        self.assertIn('latency_seconds_bucket{le="1"} 2', text)
+        self.assertIn('latency_seconds_bucket{le="+Inf"} 3', text)
+        self.assertIn('latency_seconds_sum 5.55', text)
+        self.assertIn('latency_seconds_count 3', text)
+
+    def test_labels_must_match_the_registration(self):
+        #Test that a missing or unknown label is rejected
+        metrics = MetricsRegistry()
+        hits = metrics.counter('hits_total', 'Hits', ('resource',))
+        with self.assertRaises(ValueError):
+            hits.inc(vendor='acme')
+        with self.assertRaises(ValueError):
+            metrics.histogram('hits_total', 'Hits', ('resource',))
+
+
+class CacheMetricsTests(VendorCatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        registry.reset()
+
+    def test_lists_record_hits_misses_sets_and_sizes(self):
+        #Test that a miss then a local hit are counted per resource and tier
+        self.get()
+        self.get()
+        requests = registry.get('cache_requests_total')
+        self.assertEqual(requests.value(resource='product', tier='l1', result='miss'), 1)
+        self.assertEqual(requests.value(resource='product', tier='l2', result='miss'), 1)
+        self.assertEqual(requests.value(resource='product', tier='l1', result='hit'), 1)
+        self.assertEqual(registry.get('cache_sets_total').value(resource='product'), 1)
+        self.assertEqual(registry.get('cache_compute_seconds').count(resource='product'), 1)
+        self.assertGreater(registry.get('cache_payload_bytes').sum(resource='product'), 0)
+
+    def test_failed_writes_are_counted(self):
+        #Test that a cache write error is counted instead of failing the request
+        with mock.patch('services.caching.cache.set', side_effect=ConnectionError):
+            self.assertEqual(self.get().status_code, 200)
+        self.assertEqual(registry.get('cache_set_failures_total').value(resource='product'), 1)
+
+    def test_invalidations_are_counted(self):
+        #Test that each generation bump is counted for its resource
+        clear_vendor_cache(self.vendor.slug, 'product')
+        self.assertEqual(registry.get('cache_invalidations_total').value(resource='product'), 1)
+
+    def test_endpoint_requires_staff_or_the_metrics_token(self):
+        #Test that /metrics/ is only readable by staff or with the bearer token
+        self.get()
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+        with override_settings(METRICS_TOKEN='secret'):
+            response = self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn('cache_requests_total{resource="product",tier="l2",result="miss"} 1', response.content.decode())
+
+
+class KeysetPaginationTests(VendorCatalogTestCase):
+    def test_page_numbers_stay_the_default(self):
+        #Test that ?page=N still selects the page and count is the total
+        first = self.get_json()
+        second = self.get_json('?page=2')
+        self.assertEqual(first['count'], 25)
+        self.assertIn('page=2', first['next'])
+        self.assertEqual(len(second['results']), 5)
+        self.assertNotEqual(first['results'][0]['id'], second['results'][0]['id'])
+
+    def test_page_and_cursor_together_are_rejected(self):
+        #Test that mixing both pagination styles is a 400
+        self.assertEqual(self.get('?cursor=&page=2').status_code, 400)
+
+    def test_cursor_pages_are_newest_first_without_gaps(self):
+        #Test that following next links returns every product once, newest first
+        first = self.get_json('?cursor=')
+        second = self.get_json(self.next_query(first))
+        ids = [product['id'] for product in first['results'] + second['results']]
+        expected = list(
+            Product.objects.filter(vendor=self.vendor).order_by('-created_at', '-id').values_list('id', flat=True)
+        )
+        self.assertEqual(ids, expected)
+        self.assertIsNone(second['next'])
+
+    def test_count_can_be_skipped(self):
+        #Test that ?count=false leaves out the total and its COUNT(*) query
+        self.assertEqual(self.get_json('?cursor=')['count'], 25)
+        local_cache.clear()
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            data = self.get_json('?cursor=&count=false')
+        self.assertNotIn('count', data)
+        self.assertFalse(any('COUNT(*)' in query['sql'] for query in queries.captured_queries))
+
+    def test_deep_pages_use_a_range_filter_not_an_offset(self):
+        #Test that a later page seeks on created_at instead of scanning past earlier rows
+        query = self.next_query(self.get_json('?cursor=&page_size=5'))
+        cache.clear()
+        local_cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(len(self.get_json(query)['results']), 5)
+        page_sql = [
+            q['sql'] for q in queries.captured_queries if 'LIMIT' in q['sql'] and 'products_product' in q['sql']
+        ]
+        self.assertTrue(page_sql)
+        self.assertNotIn('OFFSET', page_sql[-1])
+        self.assertIn('"products_product"."created_at" <', page_sql[-1])
@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import require_GET
+from .metrics import registry
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def has_metrics_access(request):
+    """Scrapers send `Authorization: Bearer <METRICS_TOKEN>`, staff can also use their session"""
+    token = getattr(settings, "METRICS_TOKEN", "")
+    header = request.META.get("HTTP_AUTHORIZATION", "")
+    if token and header.startswith("Bearer ") and constant_time_compare(header[len("Bearer "):], token):
+        return True
+    user = getattr(request, "user", None)
+    return bool(user and user.is_authenticated and user.is_staff)
+
+
+@never_cache
+@require_GET
+def metrics(request):
+    """Expose this worker's metrics registry in the Prometheus text format"""
+    if not has_metrics_access(request):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type=PROMETHEUS_CONTENT_TYPE)